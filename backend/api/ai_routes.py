@@ -1,6 +1,8 @@
 # backend/api/ai_routes.py
 from fastapi import APIRouter, HTTPException
-from services.azure_ai import ChatRequest, ChatResponse, chat
+from fastapi.responses import StreamingResponse
+from services.azure_ai import ChatRequest, ChatResponse, chat, chat_cache, chat_stream
+from services.streaming import SSE_HEADERS, sse_stream
 
 router = APIRouter(prefix="/ai", tags=["ai"])
 
@@ -10,3 +12,17 @@ def ai_chat(req: ChatRequest):
         return chat(req)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"AI error: {str(e)}")
+
+@router.post("/chat/stream", summary="Chat with tokens streamed as Server-Sent Events")
+def ai_chat_stream(req: ChatRequest):
+    # الأحداث: delta (مقطع نص) ... ثم done (النص الكامل + الاستهلاك) أو error
+    return StreamingResponse(sse_stream(chat_stream(req)), media_type="text/event-stream", headers=SSE_HEADERS)
+
+@router.get("/cache/stats", summary="Chat response cache counters")
+def ai_cache_stats():
+    return chat_cache.snapshot()
+
+@router.delete("/cache", summary="Drop all cached chat responses")
+def ai_cache_clear():
+    chat_cache.clear()
+    return {"ok": True}
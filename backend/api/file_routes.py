@@ -1,70 +1,273 @@
 # backend/api/file_routes.py
 from __future__ import annotations
 
-from fastapi import APIRouter, UploadFile, File, HTTPException
+import asyncio
+import logging
+import os
+from typing import AsyncIterator, List, Literal, Optional, Tuple
+
+from fastapi import APIRouter, UploadFile, File, HTTPException, Query
 from fastapi.responses import JSONResponse
 
-from services.storage import (
-    save_temp,
-    move_from_inbox_to_path,
-    ensure_container,          # نتأكد أن الكونتينر موجود قبل النقل
+from services.storage import CONTAINER_INBOX, UPLOAD_BLOCK_SIZE, _unique_name
+# عميل Blob غير متزامن مشترك (يُفتح في lifespan التطبيق) حتى لا تُحجب حلقة الأحداث أثناء النقل
+from services.storage_aio import (
+    save_temp_async,
+    upload_async,
+    move_from_inbox_to_path_async,
+    copy_within_account_async,
+    ensure_container_async,    # نتأكد أن الكونتينر موجود قبل النقل
+)
+from services.ocr import extract_text_any          # OCR (Gemini)
+from services.classifier import classify_text     # تصنيف (Azure OpenAI)
+from services import catalog
+from services.dedup import (
+    DEDUP_ENABLED,
+    check_duplicate,
+    content_metadata,
+    duplicate_response,
+    register as register_blob,
+)
+from services.dedup import stats as dedup_stats
+from services.batch_pipeline import (
+    BATCH_MAX_FILES,
+    FINAL_STATES,
+    batch_progress,
+    count_uploads,
+    get_batch,
+    spool_uploads,
+    start_batch,
 )
-from services.classifier import classify_bytes  # OCR (Gemini) + تصنيف (Azure OpenAI)
 
 router = APIRouter(prefix="/files", tags=["Files"])
+logger = logging.getLogger(__name__)
+
+# direct: تصنيف من الملف المؤقت محليًا ثم كتابة واحدة إلى الوجهة.
+# staged: السلوك القديم (رفع إلى inbox → تصنيف → نقل).
+ROUTING_MODE       = os.getenv("ROUTING_MODE", "direct").lower()
+# في وضع direct: الإبقاء على نسخة تدقيق في inbox (نسخ من جهة الخادم، بلا نقل بيانات إضافي)
+ROUTING_AUDIT_COPY = os.getenv("ROUTING_AUDIT_COPY", "0").lower() in {"1", "true", "yes", "on"}
+MIN_ROUTING_CONFIDENCE = 0.35
+
+
+def _destination(result: dict, filename: str) -> Tuple[str, str]:
+    """يحدد (الكونتينر، مسار الـ blob) من قرار التصنيف."""
+    bucket = result.get("bucket")            # الكونتينر الرئيسي (cases / contracts / …)
+    sub    = result.get("subfolder")         # المجلد الفرعي داخل الحاوية
+    conf   = float(result.get("confidence", 0.0))
+    if conf < MIN_ROUTING_CONFIDENCE:
+        # ثقة منخفضة → نرسلها إلى unclassified
+        return "unclassified", filename
+    return bucket or "unclassified", (f"{sub}/{filename}" if sub else filename)
+
+
+async def _file_chunks(file: UploadFile, size: int = UPLOAD_BLOCK_SIZE) -> AsyncIterator[bytes]:
+    """يقرأ الملف المرفوع مقطعًا مقطعًا (UploadFile.read ينفَّذ في thread عند الحاجة)."""
+    await file.seek(0)
+    while True:
+        chunk = await file.read(size)
+        if not chunk:
+            return
+        yield chunk
+
+
+async def _classify(file: UploadFile) -> Tuple[str, dict]:
+    # OCR + التصنيف متزامنان (Gemini / Azure OpenAI) → في thread حتى تبقى الحلقة حرّة
+    await file.seek(0)
+    text = await asyncio.to_thread(extract_text_any, file.filename, file.file)
+    return text, await asyncio.to_thread(classify_text, text, file.filename)
+
+
+async def _catalog(container: str, blob_name: str, filename: str, result: dict, text: str,
+                   sha256: Optional[str], size: Optional[int], source: str) -> Optional[int]:
+    # الفهرس مساعد للتصفح والبحث؛ فشله لا يُفشل التوجيه
+    try:
+        return await asyncio.to_thread(
+            catalog.record_document, container, blob_name, filename, result, text, sha256, size, source
+        )
+    except Exception as e:
+        logger.warning(f"Catalog update failed for {container}/{blob_name}: {e}")
+        return None
+
+
+async def _catalog_duplicate(prior: dict, filename: str, source: str) -> Optional[int]:
+    try:
+        return await asyncio.to_thread(
+            catalog.record_duplicate, prior["container"], prior["blob_name"], filename,
+            prior["decision"], prior["sha256"], prior["size"], source,
+        )
+    except Exception as e:
+        logger.warning(f"Catalog update failed for duplicate {filename}: {e}")
+        return None
 
 
 @router.post(
     "/classify-upload",
     summary="Upload → OCR (Gemini) → Classify → Route in Blob",
 )
-async def classify_upload(file: UploadFile = File(...)):
+async def classify_upload(
+    file: UploadFile = File(...),
+    mode: Literal["direct", "staged"] = Query(ROUTING_MODE if ROUTING_MODE in ("direct", "staged") else "direct"),
+    audit_copy: bool = Query(ROUTING_AUDIT_COPY),
+    dedup: bool = Query(DEDUP_ENABLED),
+):
     """
-    1) يرفع الملف مؤقتًا إلى inbox.
-    2) OCR + تصنيف بالموديلات (Gemini للـ OCR و Azure OpenAI للتصنيف).
-    3) يحدد الكونتينر الرئيسي (bucket) ثم المجلد الفرعي (subfolder) ويحرّك الملف مباشرةً:
-       inbox → <bucket>/<subfolder>/<filename>
-       لو الثقة منخفضة، يذهب إلى: unclassified/<filename>
+    وضع direct (الافتراضي):
+    1) OCR + تصنيف من الملف المؤقت المحلي (Gemini للـ OCR و Azure OpenAI للتصنيف).
+    2) كتابة واحدة مباشرةً إلى <bucket>/<subfolder>/<filename> (أو unclassified/<filename> عند ضعف الثقة).
+    3) (اختياري audit_copy) نسخة تدقيق في inbox/<uid>_<filename> عبر نسخ من جهة الخادم.
+
+    وضع staged: رفع مؤقت إلى inbox → تصنيف → نقل من جهة الخادم إلى الوجهة.
+
+    dedup: إن كان المحتوى نفسه (sha256) قد وُجّه سابقًا، يُعاد القرار السابق فورًا
+    دون رفع أو OCR أو تصنيف، ويُسجَّل الرفع كمرجع للنسخة الأصلية.
     """
-    # --- 1) رفع مؤقت إلى inbox ---
-    content = await file.read()
-    temp_blob_name = save_temp(content, file.filename, container="inbox")
+    sha256: Optional[str] = None
+    size: Optional[int] = file.size
+    if dedup:
+        sha256, size, prior = await check_duplicate(file.file, file.filename, "classify-upload")
+        if prior is not None:
+            doc_id = await _catalog_duplicate(prior, file.filename, "classify-upload")
+            return JSONResponse({
+                "ok": True, "routing_mode": mode, "inbox_blob": None, **duplicate_response(prior), "catalog_id": doc_id,
+            })
 
-    # --- 2) OCR + تصنيف ---
-    result = classify_bytes(content, file.filename)
-    bucket = result.get("bucket")            # الكونتينر الرئيسي (cases / contracts / …)
-    sub    = result.get("subfolder")         # المجلد الفرعي داخل الحاوية
-    conf   = float(result.get("confidence", 0.0))
+    if mode == "staged":
+        # --- 1) رفع مؤقت إلى inbox (بالتدفق من الملف المؤقت، دون قراءته كاملًا في الذاكرة) ---
+        temp_blob_name = await save_temp_async(
+            _file_chunks(file), file.filename, container=CONTAINER_INBOX, metadata=content_metadata(sha256)
+        )
 
-    # --- 3) تحديد الوجهة النهائية ---
-    if conf < 0.35:
-        # ثقة منخفضة → نرسلها إلى unclassified
-        dst_container = "unclassified"
-        dst_blob_name = file.filename
+        # --- 2) OCR + تصنيف ---
+        text, result = await _classify(file)
+        dst_container, dst_blob_name = _destination(result, file.filename)
+
+        # تأكد من وجود الكونتينر الوجهة
+        await ensure_container_async(dst_container)
+
+        # --- 3) النقل: من inbox إلى الوجهة النهائية مباشرةً (بدون المرور على sorted) ---
+        try:
+            await move_from_inbox_to_path_async(
+                temp_blob_name=temp_blob_name,
+                dst_blob_path=dst_blob_name,
+                dst_container=dst_container,
+            )
+        except Exception as e:
+            # فشل النقل → بلّغي بخطأ داخلي
+            raise HTTPException(status_code=500, detail=f"Routing failed: {e}")
+        inbox_blob: Optional[str] = f"{CONTAINER_INBOX}/{temp_blob_name}"
     else:
-        dst_container = bucket or "unclassified"
-        dst_blob_name = f"{sub}/{file.filename}" if sub else file.filename
+        # --- 1) OCR + تصنيف محليًا قبل أي رفع ---
+        text, result = await _classify(file)
+        dst_container, dst_blob_name = _destination(result, file.filename)
 
-    # تأكد من وجود الكونتينر الوجهة
-    ensure_container(dst_container)
+        # --- 2) كتابة واحدة إلى الوجهة ---
+        try:
+            await upload_async(dst_container, dst_blob_name, _file_chunks(file), metadata=content_metadata(sha256))
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Routing failed: {e}")
 
-    # --- 4) النقل: من inbox إلى الوجهة النهائية مباشرةً (بدون المرور على sorted) ---
-    try:
-        move_from_inbox_to_path(
-            temp_blob_name=temp_blob_name,
-            dst_blob_path=dst_blob_name,
-            dst_container=dst_container,
-        )
-    except Exception as e:
-        # فشل النقل → بلّغي بخطأ داخلي
-        raise HTTPException(status_code=500, detail=f"Routing failed: {e}")
+        # --- 3) نسخة تدقيق اختيارية من جهة الخادم ---
+        inbox_blob = None
+        if audit_copy:
+            # اسم فريد: رفعان بالاسم نفسه لا يكتب أحدهما فوق نسخة تدقيق الآخر
+            audit_name = _unique_name(file.filename)
+            try:
+                await copy_within_account_async(dst_container, dst_blob_name, CONTAINER_INBOX, audit_name)
+                inbox_blob = f"{CONTAINER_INBOX}/{audit_name}"
+            except Exception as e:
+                # الملف وصل وجهته؛ فشل نسخة التدقيق لا يُفشل الطلب
+                result = {**result, "audit_copy_error": str(e)}
 
-    # --- 5) استجابة واضحة ---
+    if sha256:
+        await asyncio.to_thread(register_blob, sha256, size, dst_container, dst_blob_name, file.filename, result)
+    doc_id = await _catalog(dst_container, dst_blob_name, file.filename, result, text, sha256, size, "classify-upload")
+
+    # --- استجابة واضحة ---
     return JSONResponse(
         {
             "ok": True,
-            "inbox_blob": f"inbox/{temp_blob_name}",
+            "routing_mode": mode,
+            "inbox_blob": inbox_blob,
             "moved_to": f"{dst_container}/{dst_blob_name}",
             "ai_decision": result,  # {bucket, subfolder, confidence, reasoning}
+            "sha256": sha256,
+            "deduplicated": False,
+            "catalog_id": doc_id,
         }
     )
+
+
+@router.post(
+    "/classify-batch",
+    summary="Batch upload (files or zip) → pipelined OCR → Classify → Route",
+)
+async def classify_batch(files: List[UploadFile] = File(...)):
+    """
+    يقبل عدة ملفات و/أو أرشيفات zip. تُنسخ الملفات محليًا (spool) ثم يعود الرد فورًا بمعرّف الدفعة،
+    وتعمل مراحل OCR → تصنيف → توجيه في الخلفية، لكل مرحلة حد توازٍ خاص بها.
+    التقدم والنتائج لكل ملف: GET /files/batches/{batch_id}
+    """
+    uploads = [(f.filename or "upload", f.file) for f in files]
+    # العدد من الفهرس المركزي لملفات zip → نرفض الدفعة الكبيرة قبل أي نسخ أو فك ضغط
+    total = await count_uploads(uploads)
+    if total > BATCH_MAX_FILES:
+        return JSONResponse(
+            {"error": f"Too many files ({total}); the limit is {BATCH_MAX_FILES} per batch."},
+            status_code=413,
+        )
+    spooled = await spool_uploads(uploads)
+    if not spooled:
+        return JSONResponse({"error": "No files found in the upload."}, status_code=400)
+    batch = start_batch(spooled, _destination)
+    return JSONResponse(batch_progress(batch), status_code=202)
+
+
+@router.get("/batches/{batch_id}", summary="Batch progress + per-file results")
+async def batch_status(
+    batch_id: str,
+    status: Optional[str] = Query(None, description="تصفية الملفات حسب الحالة، أو finished لكل المنتهية"),
+):
+    batch = get_batch(batch_id)
+    if batch is None:
+        return JSONResponse({"error": "Batch not found."}, status_code=404)
+    files = batch["files"]
+    if status == "finished":
+        files = [f for f in files if f["status"] in FINAL_STATES]
+    elif status:
+        files = [f for f in files if f["status"] == status]
+    return JSONResponse({**batch_progress(batch), "files": files})
+
+
+@router.get("/dedup/stats", summary="Content-addressed deduplication stats")
+async def dedup_statistics():
+    return JSONResponse(await asyncio.to_thread(dedup_stats))
+
+
+@router.get("/catalog", summary="Browse/search routed documents (local index, no blob listing)")
+async def catalog_list(
+    q: Optional[str] = Query(None, description="بحث نصي كامل في نص الـ OCR واسم الملف"),
+    bucket: Optional[str] = None,
+    subfolder: Optional[str] = None,
+    min_confidence: Optional[float] = Query(None, ge=0, le=1),
+    since: Optional[float] = Query(None, description="unix timestamp"),
+    until: Optional[float] = Query(None, description="unix timestamp"),
+    limit: int = Query(50, ge=1, le=catalog.CATALOG_PAGE_MAX),
+    offset: int = Query(0, ge=0),
+):
+    return JSONResponse(await asyncio.to_thread(
+        catalog.query_documents, q, bucket, subfolder, min_confidence, since, until, limit, offset
+    ))
+
+
+@router.get("/catalog/facets", summary="Document counts per bucket/subfolder")
+async def catalog_facets():
+    return JSONResponse({"facets": await asyncio.to_thread(catalog.facets)})
+
+
+@router.get("/catalog/{doc_id}", summary="One catalogued document")
+async def catalog_item(doc_id: int):
+    doc = await asyncio.to_thread(catalog.get_document, doc_id)
+    if doc is None:
+        return JSONResponse({"error": "Document not found."}, status_code=404)
+    return JSONResponse(doc)
@@ -0,0 +1,389 @@
+# benchmarks/e2e.py
+"""
+قياس أداء شامل دون اتصال: يشغّل المسارات الحقيقية للتطبيق فوق بدائل داخل العملية
+لـ Gemini و Azure OpenAI و Azure Blob (benchmarks/fake_backends.py).
+
+السيناريوهات:
+  job             run_article_by_article_process مباشرةً (استخراج → رفع → مقارنة مادة بمادة)
+  process-demo    POST /process-demo ثم GET /results/{job_id}
+  classify-upload POST /files/classify-upload (OCR + تصنيف + توجيه، مع نسبة تكرار)
+  suggest         POST /suggest-amendment على صفوف مهمة مكتملة
+
+التشغيل (من مجلد backend):
+  python -m benchmarks.e2e --articles 10 --countries 3 --jobs 2 --time-scale 0.01 --out bench.json
+
+الزمن: كل نداء وهمي ينام (زمنه المُنمذَج × time_scale)، وكذلك time.sleep للتراجع بين المحاولات.
+الزمن المُنمذَج لوحدة عمل = CPU + (الزمن الفعلي − CPU) ÷ time_scale؛ أي أن الانتظار يُعاد لمقياسه
+الحقيقي بينما يبقى عمل المعالج (JSON، كتابة الملفات، التسجيل) كما هو. يتلوّث التقدير قليلًا بدقة
+مؤقت sleep حين يكون time_scale صغيرًا جدًا؛ 0.01 مناسب عادةً.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import redirect_stdout
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from benchmarks.fake_backends import FakeProfile, install, install_blob, set_dummy_credentials
+
+BACKEND_ROOT = Path(__file__).resolve().parent.parent
+DEFAULT_DEMO_DIR = BACKEND_ROOT / "demo_files - Copy"
+PRIMARY_LAW = "TashreaDraft"
+SCENARIOS = ("job", "process-demo", "classify-upload", "suggest")
+
+
+# =========[ قياس الكتابة على القرص ]=========
+class WriteCounter:
+    """يعدّ البايتات المكتوبة عبر Path.write_text/write_bytes (مسار كتابة النتائج والاقتراحات)."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.writes = 0
+
+    def install(self) -> None:
+        orig_text, orig_bytes = Path.write_text, Path.write_bytes
+        counter = self
+
+        def write_text(self_path, data, encoding=None, errors=None, newline=None):
+            n = orig_text(self_path, data, encoding=encoding, errors=errors, newline=newline)
+            counter.add(len(data.encode(encoding or "utf-8", errors or "strict")))
+            return n
+
+        def write_bytes(self_path, data):
+            n = orig_bytes(self_path, data)
+            counter.add(len(data))
+            return n
+
+        Path.write_text = write_text
+        Path.write_bytes = write_bytes
+
+    def add(self, n: int) -> None:
+        with self._lock:
+            self.bytes += n
+            self.writes += 1
+
+
+# =========[ الساعة المُنمذَجة ]=========
+class Span:
+    def __init__(self, scale: float, thread_only: bool = False):
+        self._scale = scale
+        self._cpu = time.thread_time if thread_only else time.process_time
+
+    def __enter__(self) -> "Span":
+        self._w0, self._c0 = time.perf_counter(), self._cpu()
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.wall = time.perf_counter() - self._w0
+        self.cpu = min(self._cpu() - self._c0, self.wall)
+        self.modeled = self.cpu + (self.wall - self.cpu) / self._scale
+
+
+def _pct(values: List[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    if len(values) == 1:
+        return round(values[0], 3)
+    return round(statistics.quantiles(values, n=100, method="inclusive")[int(q) - 1], 3)
+
+
+def _per_unit(d: Dict[str, int], units: int) -> Dict[str, float]:
+    return {k: round(v / max(1, units), 2) for k, v in sorted(d.items())}
+
+
+# =========[ التهيئة ]=========
+def _prepare_env(work: Path) -> None:
+    # مفاتيح وهمية (لا يخرج أي طلب شبكي) ومسارات الحالة في مجلد مؤقت
+    set_dummy_credentials()
+    os.environ["AZURE_STORAGE_CONNECTION_STRING"] = (
+        "DefaultEndpointsProtocol=https;AccountName=bench;AccountKey=YmVuY2g=;EndpointSuffix=core.windows.net"
+    )
+    os.environ["DOCUMENTS_DB"] = str(work / "documents.sqlite")
+    os.environ["CLASSIFIER_DECISIONS_LOG"] = str(work / "classifier_decisions.jsonl")
+    os.environ["LOCAL_CLASSIFIER_PATH"] = str(work / "local_classifier.joblib")
+    os.environ["LAW_INDEX_DIRS"] = str(work / "data")
+    os.environ.setdefault("AUTO_SUGGEST", "0")
+
+
+class Harness:
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+        self.work = Path(tempfile.mkdtemp(prefix="ailegal-bench-"))
+        _prepare_env(self.work)
+        profile = (
+            FakeProfile.from_json(args.profile, time_scale=args.time_scale, error_rate=args.error_rate,
+                                  rate_limit_rate=args.rate_limit_rate, seed=args.seed)
+            if args.profile
+            else FakeProfile(time_scale=args.time_scale or 0.01, error_rate=args.error_rate or 0.0,
+                             rate_limit_rate=args.rate_limit_rate or 0.0, seed=args.seed or 7)
+        )
+        self.profile = profile
+        self.backend = install(profile, args.demo_dir)
+        if PRIMARY_LAW not in self.backend.laws:
+            raise SystemExit(f"{PRIMARY_LAW}.json not found in {args.demo_dir}")
+
+        # استيراد main ينشئ data/ و demo_files/ بجانب الكود؛ نزيلهما إن لم يكونا موجودين قبله
+        created = [p for p in (BACKEND_ROOT / "data", BACKEND_ROOT / "demo_files") if not p.exists()]
+        import main
+        for p in created:
+            shutil.rmtree(p, ignore_errors=True)
+
+        install_blob(self.backend)
+        self.main = main
+        main.DATA_DIR = self.work / "data"
+        main.DEMO_DIR = self.work / "demo"
+        main.DATA_DIR.mkdir()
+        main.DEMO_DIR.mkdir()
+
+        self.writes = WriteCounter()
+        self.writes.install()
+        self.cells: List[float] = []
+        self.failed_cells = 0
+        self._cells_lock = threading.Lock()
+        self._wrap_compare()
+        self.countries = [
+            law for law in sorted(self.backend.laws)
+            if law != PRIMARY_LAW and " - Copy" not in law
+        ][: args.countries]
+        self.finished_jobs: List[str] = []
+
+    def _wrap_compare(self) -> None:
+        main = self.main
+        inner = main.compare_single_article_with_api
+
+        def timed_cell(*a: Any, **kw: Any):
+            span = Span(self.profile.time_scale, thread_only=True)
+            span.__enter__()
+            try:
+                return inner(*a, **kw)
+            finally:
+                span.__exit__(None, None, None)
+                with self._cells_lock:
+                    self.cells.append(span.modeled)
+
+        main.compare_single_article_with_api = timed_cell
+
+    def close(self) -> None:
+        shutil.rmtree(self.work, ignore_errors=True)
+
+    # ---------- أدوات التقرير ----------
+    def measure(self, name: str, units: int, run: Callable[[Callable[..., None]], None], unit: str) -> Dict[str, Any]:
+        """run(record) يستدعي record(الزمن المُنمذَج، نجاح؟) لكل وحدة؛ المعدل بالساعة يحسب الوحدات الناجحة فقط."""
+        self.backend.stats.reset()
+        self.cells = []
+        self.failed_cells = 0
+        latencies: List[float] = []
+        failed = 0
+
+        def record(modeled: float, ok: bool = True) -> None:
+            nonlocal failed
+            latencies.append(modeled)
+            failed += not ok
+
+        bytes0, writes0 = self.writes.bytes, self.writes.writes
+        with Span(self.profile.time_scale) as total:
+            run(record)
+        stats = self.backend.stats.snapshot()
+        calls = stats["calls"]
+        per_hour = (units - failed) / total.modeled * 3600 if total.modeled else None
+        report: Dict[str, Any] = {
+            "scenario": name,
+            "units": units,
+            "failed": failed,
+            "unit": unit,
+            "wall_sec": round(total.wall, 3),
+            "cpu_sec": round(total.cpu, 3),
+            "modeled_sec": round(total.modeled, 1),
+            f"{unit}s_per_hour": round(per_hour, 2) if per_hour else None,
+            f"{unit}_latency_sec": {"p50": _pct(latencies, 50), "p95": _pct(latencies, 95), "max": round(max(latencies), 3) if latencies else None},
+            f"calls_per_{unit}": _per_unit(calls, units),
+            f"llm_calls_per_{unit}": round(sum(v for k, v in calls.items() if k not in ("blob", "upload", "delete")) / max(1, units), 2),
+            f"prompt_tokens_per_{unit}": _per_unit(stats["prompt_tokens"], units),
+            f"completion_tokens_per_{unit}": _per_unit(stats["completion_tokens"], units),
+            "errors_503": stats["errors_503"],
+            "errors_429": stats["errors_429"],
+            f"bytes_written_per_{unit}": round((self.writes.bytes - bytes0) / max(1, units)),
+            f"file_writes_per_{unit}": round((self.writes.writes - writes0) / max(1, units), 1),
+            f"blob_bytes_per_{unit}": round(stats["blob_bytes_uploaded"] / max(1, units)),
+        }
+        if self.cells:
+            report["cells"] = len(self.cells)
+            report["failed_cells"] = self.failed_cells
+            report["cell_latency_sec"] = {"p50": _pct(self.cells, 50), "p95": _pct(self.cells, 95), "max": round(max(self.cells), 3)}
+        return report
+
+    def _job_finished(self, job_id: str) -> bool:
+        """مهمة ناجحة = نتائج على شكل قائمة صفوف؛ تُحسب الخلايا الفاشلة وتُحفظ المهمة لسيناريو الاقتراح."""
+        path = self.main.DATA_DIR / f"results_{job_id}.json"
+        rows = json.loads(path.read_text("utf-8")) if path.exists() else None
+        if not isinstance(rows, list):
+            return False
+        self.failed_cells += sum(
+            1 for row in rows for c in row["country_comparisons"] if c.get("status") != "completed"
+        )
+        self.finished_jobs.append(job_id)
+        return True
+
+    # ---------- السيناريوهات ----------
+    def scenario_job(self) -> Dict[str, Any]:
+        a = self.args
+        self.backend.extract_limits = {PRIMARY_LAW: a.articles}
+
+        def run(record: Callable[[float], None]) -> None:
+            for _ in range(a.jobs):
+                job_id = uuid.uuid4().hex
+                data = self.main.DATA_DIR
+                # ملفات PDF شكلية؛ محتوى الاستخراج يأتي من القوانين الجاهزة حسب الاسم
+                primary = data / f"{job_id}_primary_{PRIMARY_LAW}.pdf"
+                primary.write_bytes(b"%PDF-1.4 bench placeholder")
+                cmps = []
+                for law in self.countries:
+                    p = data / f"{job_id}_cmp_{law}.pdf"
+                    p.write_bytes(b"%PDF-1.4 bench placeholder")
+                    cmps.append(p)
+                with Span(self.profile.time_scale) as s:
+                    self.main.run_article_by_article_process(primary, cmps, job_id)
+                record(s.modeled, self._job_finished(job_id))
+
+        return self.measure("job", a.jobs, run, "job")
+
+    def scenario_process_demo(self, client) -> Dict[str, Any]:
+        a = self.args
+        # نسخ القوانين إلى مجلد العرض مع قص القانون الأساسي إلى عدد المواد المطلوب
+        for law, arts in self.backend.laws.items():
+            chosen = arts[: a.articles] if law == PRIMARY_LAW else arts
+            (self.main.DEMO_DIR / f"{law}.json").write_text(json.dumps(chosen, ensure_ascii=False), encoding="utf-8")
+        body = {"primary_file": f"{PRIMARY_LAW}.json", "comparison_files": [f"{c}.json" for c in self.countries]}
+
+        def run(record: Callable[[float], None]) -> None:
+            for _ in range(a.jobs):
+                with Span(self.profile.time_scale) as s:
+                    # TestClient ينفّذ مهام الخلفية قبل إعادة الرد، فالمهمة مكتملة عند العودة
+                    r = client.post("/process-demo", json=body)
+                    job_id = r.json()["id"]
+                    res = client.get(f"/results/{job_id}")
+                record(s.modeled, res.status_code == 200 and self._job_finished(job_id))
+
+        return self.measure("process-demo", a.jobs, run, "job")
+
+    def scenario_classify_upload(self, client) -> Dict[str, Any]:
+        a = self.args
+        texts = [
+            f"{art.get('article_title', '')}\n{art.get('article_text', '')}"
+            for law in self.countries + [PRIMARY_LAW]
+            for art in self.backend.laws[law]
+        ]
+        sent: List[bytes] = []
+
+        def run(record: Callable[[float], None]) -> None:
+            for i in range(a.uploads):
+                if sent and self.backend.rand() < a.dup_rate:
+                    data = self.backend.choice(sent)
+                else:
+                    data = ("\n\n".join(self.backend.sample(texts, min(len(texts), a.doc_articles))) + f"\n#{i}").encode("utf-8")
+                    sent.append(data)
+                # صورة ممسوحة: لا استخراج محلي، فيمر المستند بـ OCR ثم التصنيف كما في الإنتاج
+                with Span(self.profile.time_scale) as s:
+                    r = client.post("/files/classify-upload", files={"file": (f"scan_{i}.png", data, "image/png")})
+                record(s.modeled, r.status_code == 200)
+
+        return self.measure("classify-upload", a.uploads, run, "document")
+
+    def scenario_suggest(self, client) -> Dict[str, Any]:
+        a = self.args
+        if not self.finished_jobs:
+            self.scenario_job()
+        if not self.finished_jobs:
+            return {"scenario": "suggest", "skipped": "no comparison job finished"}
+        job_id = self.finished_jobs[-1]
+        rows = json.loads((self.main.DATA_DIR / f"results_{job_id}.json").read_text("utf-8"))
+        n = min(a.suggestions, len(rows))
+
+        def run(record: Callable[[float], None]) -> None:
+            for i in range(n):
+                with Span(self.profile.time_scale) as s:
+                    r = client.post("/suggest-amendment", json={"job_id": job_id, "article_index": i, "refresh": True})
+                record(s.modeled, r.status_code == 200)
+
+        return self.measure("suggest", n, run, "suggestion")
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    p = argparse.ArgumentParser(description="Offline end-to-end benchmark against fake Gemini/Azure backends.")
+    p.add_argument("--scenario", action="append", choices=SCENARIOS, help="repeatable; default: all")
+    p.add_argument("--jobs", type=int, default=2, help="jobs per comparison scenario")
+    p.add_argument("--articles", type=int, default=10, help="base-law articles per job (max 39)")
+    p.add_argument("--countries", type=int, default=3, help="comparison laws per job")
+    p.add_argument("--uploads", type=int, default=40, help="documents for classify-upload")
+    p.add_argument("--doc-articles", type=int, default=4, help="articles concatenated per uploaded document")
+    p.add_argument("--dup-rate", type=float, default=0.2, help="share of uploads repeating an earlier document")
+    p.add_argument("--suggestions", type=int, default=5, help="rows for suggest-amendment")
+    p.add_argument("--time-scale", type=float, default=None, help="real seconds slept per modeled second (default 0.01)")
+    p.add_argument("--error-rate", type=float, default=None, help="share of calls failing with 503")
+    p.add_argument("--rate-limit-rate", type=float, default=None, help="share of calls failing with 429")
+    p.add_argument("--seed", type=int, default=None)
+    p.add_argument("--profile", type=Path, help="JSON with time_scale/error_rate/rate_limit_rate/seed/latency overrides")
+    p.add_argument("--demo-dir", type=Path, default=DEFAULT_DEMO_DIR)
+    p.add_argument("--out", type=Path, help="write the JSON report here as well")
+    p.add_argument("--verbose", action="store_true", help="keep application INFO logs")
+    return p.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> Dict[str, Any]:
+    import logging
+
+    args = parse_args(argv)
+    scenarios = args.scenario or list(SCENARIOS)
+    harness = Harness(args)
+    if not args.verbose:
+        logging.getLogger().setLevel(logging.WARNING)
+
+    from fastapi.testclient import TestClient
+
+    results: List[Dict[str, Any]] = []
+    try:
+        # طباعات التشخيص داخل التطبيق تذهب إلى stderr حتى يبقى stdout تقرير JSON فقط
+        with redirect_stdout(sys.stderr), TestClient(harness.main.app, raise_server_exceptions=False) as client:
+            for name in scenarios:
+                if name == "job":
+                    results.append(harness.scenario_job())
+                elif name == "process-demo":
+                    results.append(harness.scenario_process_demo(client))
+                elif name == "classify-upload":
+                    results.append(harness.scenario_classify_upload(client))
+                elif name == "suggest":
+                    results.append(harness.scenario_suggest(client))
+    finally:
+        harness.close()
+
+    report = {
+        "config": {
+            "articles": args.articles,
+            "countries": len(harness.countries),
+            "jobs": args.jobs,
+            "time_scale": harness.profile.time_scale,
+            "error_rate": harness.profile.error_rate,
+            "rate_limit_rate": harness.profile.rate_limit_rate,
+            "latency_median_sigma": harness.profile.latency,
+        },
+        "results": results,
+    }
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    print(text)
+    if args.out:
+        args.out.write_text(text, encoding="utf-8")
+    return report
+
+
+if __name__ == "__main__":
+    main()
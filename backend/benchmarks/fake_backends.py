@@ -0,0 +1,529 @@
+# benchmarks/fake_backends.py
+"""
+بدائل داخل العملية لـ google.generativeai و Azure OpenAI و Azure Blob لقياس الأداء دون استهلاك حصة API.
+
+- زمن كل نداء من توزيع log-normal (الوسيط + sigma) لكل نوع نداء، مضروبًا في time_scale
+  حتى ينتهي القياس بسرعة؛ التقارير تعيد التحويل إلى الزمن المُنمذَج (÷ time_scale).
+- نسبة أخطاء 503 ونسبة 429 قابلتان للضبط.
+- الردود JSON جاهزة مأخوذة من قوانين demo_files المرفقة.
+"""
+from __future__ import annotations
+
+import json
+import math
+import os
+import random
+import re
+import threading
+import time
+import uuid
+from collections import defaultdict
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+_real_sleep = time.sleep
+
+# مفاتيح وهمية تكفي لاستيراد وحدات التطبيق (تتحقق من وجودها عند الاستيراد)؛ لا يخرج بها أي طلب
+DUMMY_ENV = {
+    "GOOGLE_API_KEY": "bench-fake-key",
+    "AZURE_OPENAI_KEY": "bench-fake-key",
+    "AZURE_OPENAI_ENDPOINT": "https://bench.openai.azure.com/",
+    "AZURE_OPENAI_DEPLOYMENT": "bench-deployment",
+    "OPENAI_API_VERSION": "2024-02-01",
+}
+
+
+def set_dummy_credentials() -> None:
+    for key, val in DUMMY_ENV.items():
+        os.environ.setdefault(key, val)
+
+
+# الوسيط (ثوانٍ حقيقية مُنمذَجة) و sigma لتوزيع log-normal لكل نوع نداء
+DEFAULT_LATENCY: Dict[str, Tuple[float, float]] = {
+    "extract":    (40.0, 0.4),
+    "compare":    (12.0, 0.5),
+    "suggest":    (25.0, 0.4),
+    "improve":    (15.0, 0.4),
+    "deepsearch": (20.0, 0.5),
+    "translate":  (2.0, 0.3),
+    "ocr":        (6.0, 0.5),
+    "upload":     (1.0, 0.3),
+    "delete":     (0.3, 0.3),
+    "classify":   (1.5, 0.4),
+    "chat":       (3.0, 0.4),
+    "blob":       (0.05, 0.5),
+}
+
+
+@dataclass
+class FakeProfile:
+    time_scale: float = 0.01
+    error_rate: float = 0.0        # نسبة 503 (ServiceUnavailable)
+    rate_limit_rate: float = 0.0   # نسبة 429 (ResourceExhausted / RateLimitError)
+    latency: Dict[str, Tuple[float, float]] = field(default_factory=lambda: dict(DEFAULT_LATENCY))
+    seed: int = 7
+
+    @classmethod
+    def from_json(cls, path: Path, **overrides: Any) -> "FakeProfile":
+        raw = json.loads(Path(path).read_text("utf-8"))
+        lat = dict(DEFAULT_LATENCY)
+        lat.update({k: tuple(v) for k, v in raw.pop("latency", {}).items()})
+        raw.update({k: v for k, v in overrides.items() if v is not None})
+        return cls(latency=lat, **raw)
+
+
+class CallStats:
+    """عدادات النداءات والرموز والأخطاء لكل نوع؛ آمنة بين الـ threads."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.calls: Dict[str, int] = defaultdict(int)
+            self.errors: Dict[str, int] = defaultdict(int)
+            self.rate_limited: Dict[str, int] = defaultdict(int)
+            self.prompt_tokens: Dict[str, int] = defaultdict(int)
+            self.completion_tokens: Dict[str, int] = defaultdict(int)
+            self.blob_bytes = 0
+            self.modeled_latency: Dict[str, float] = defaultdict(float)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "calls": dict(self.calls),
+                "errors_503": dict(self.errors),
+                "errors_429": dict(self.rate_limited),
+                "prompt_tokens": dict(self.prompt_tokens),
+                "completion_tokens": dict(self.completion_tokens),
+                "modeled_latency_sec": {k: round(v, 2) for k, v in self.modeled_latency.items()},
+                "blob_bytes_uploaded": self.blob_bytes,
+            }
+
+
+def _tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+class FakeBackend:
+    """الحالة المشتركة لكل البدائل: الملف الشخصي، المولّد العشوائي، القوانين الجاهزة، الإحصاءات."""
+
+    def __init__(self, profile: FakeProfile, demo_dir: Path):
+        self.profile = profile
+        self.stats = CallStats()
+        self._rng = random.Random(profile.seed)
+        self._rng_lock = threading.Lock()
+        self.laws: Dict[str, List[Dict[str, Any]]] = {}
+        for p in sorted(Path(demo_dir).glob("*.json")):
+            try:
+                arts = json.loads(p.read_text("utf-8"))
+            except (OSError, json.JSONDecodeError):
+                continue
+            if isinstance(arts, list) and arts:
+                self.laws[p.stem] = arts
+        # اسم القانون → عدد المواد المطلوبة عند "الاستخراج" (يضبطه سيناريو القياس)
+        self.extract_limits: Dict[str, int] = {}
+
+    # ---------- زمن/أخطاء ----------
+    def rand(self) -> float:
+        with self._rng_lock:
+            return self._rng.random()
+
+    def choice(self, seq):
+        with self._rng_lock:
+            return self._rng.choice(seq)
+
+    def sample(self, seq, k):
+        with self._rng_lock:
+            return self._rng.sample(seq, k)
+
+    def latency(self, kind: str) -> float:
+        median, sigma = self.profile.latency.get(kind, (1.0, 0.3))
+        with self._rng_lock:
+            z = self._rng.gauss(0.0, 1.0)
+        return median * math.exp(sigma * z)
+
+    def call(self, kind: str, prompt_tokens: int, rate_limit_exc, error_exc) -> None:
+        """يسجّل النداء، ينام زمنه المُنمذَج (مضروبًا في time_scale)، وقد يرمي 429/503."""
+        modeled = self.latency(kind)
+        with self.stats._lock:
+            self.stats.calls[kind] += 1
+            self.stats.prompt_tokens[kind] += prompt_tokens
+            self.stats.modeled_latency[kind] += modeled
+        r = self.rand()
+        if r < self.profile.rate_limit_rate:
+            with self.stats._lock:
+                self.stats.rate_limited[kind] += 1
+            _real_sleep(0.1 * modeled * self.profile.time_scale)  # الرفض يعود أسرع من الإجابة
+            raise rate_limit_exc()
+        _real_sleep(modeled * self.profile.time_scale)
+        if r < self.profile.rate_limit_rate + self.profile.error_rate:
+            with self.stats._lock:
+                self.stats.errors[kind] += 1
+            raise error_exc()
+
+    def completed(self, kind: str, text: str) -> int:
+        n = _tokens(text)
+        with self.stats._lock:
+            self.stats.completion_tokens[kind] += n
+        return n
+
+    def law_for(self, name: str) -> Tuple[str, List[Dict[str, Any]]]:
+        """يطابق اسم ملف (مع بادئات المهمة) مع قانون جاهز؛ وإلا قانون عشوائي ثابت للاسم."""
+        stem = Path(name).stem
+        stem = re.sub(r"^[0-9a-f]{32}_(?:primary|cmp)_", "", stem)
+        for law in sorted(self.laws, key=len, reverse=True):
+            if stem == law or stem.startswith(law):
+                return law, self.laws[law]
+        keys = sorted(self.laws)
+        law = keys[sum(map(ord, stem)) % len(keys)]
+        return law, self.laws[law]
+
+
+# =========[ google.generativeai ]=========
+class FakeUsage:
+    def __init__(self, prompt: int, completion: int):
+        self.prompt_token_count = prompt
+        self.candidates_token_count = completion
+        self.total_token_count = prompt + completion
+
+
+class FakeResponse:
+    def __init__(self, text: str, usage: FakeUsage):
+        self.text = text
+        self.usage_metadata = usage
+
+
+class FakeStreamResponse:
+    """بث: مقاطع نصية متتالية؛ usage_metadata متاحة بعد الاستهلاك كما في الـ SDK."""
+
+    def __init__(self, backend: FakeBackend, text: str, usage: FakeUsage, chunks: int = 8):
+        self._backend = backend
+        self._text = text
+        self._chunks = chunks
+        self.usage_metadata = usage
+        self.text = text
+
+    def __iter__(self) -> Iterator[Any]:
+        step = max(1, len(self._text) // self._chunks)
+        for i in range(0, len(self._text), step):
+            _real_sleep(0.002 * self._backend.profile.time_scale)
+            yield type("Chunk", (), {"text": self._text[i:i + step]})()
+
+
+class FakeFile:
+    def __init__(self, display_name: str, data: bytes, path: Optional[str] = None):
+        self.name = f"files/{uuid.uuid4().hex[:12]}"
+        self.display_name = display_name
+        self.path = path
+        self.data = data
+        self.size_bytes = len(data)
+
+
+def _parts_text(contents: Any) -> Tuple[str, List[FakeFile]]:
+    texts: List[str] = []
+    files: List[FakeFile] = []
+
+    def walk(x: Any) -> None:
+        if isinstance(x, str):
+            texts.append(x)
+        elif isinstance(x, FakeFile):
+            files.append(x)
+        elif isinstance(x, dict):
+            walk(x.get("parts") or [])
+        elif isinstance(x, (list, tuple)):
+            for y in x:
+                walk(y)
+
+    walk(contents)
+    return "\n".join(texts), files
+
+
+def _classify_prompt(text: str) -> str:
+    # الترتيب مهم: مطالبات التحسين والبحث قد تتضمن نص مطالبة الاقتراح
+    if "معالجة المستندات القانونية" in text:
+        return "extract"
+    if "خبير OCR" in text:
+        return "ocr"
+    if "أعد صياغة المخرجات التالية" in text:
+        return "improve"
+    if "STRICT JSON" in text:
+        return "deepsearch"
+    if "الصياغة التشريعية" in text:
+        return "suggest"
+    if "القانون المقارن" in text and "المادة المستهدفة" in text:
+        return "compare"
+    return "translate"
+
+
+def make_genai_fakes(backend: FakeBackend):
+    from google.api_core import exceptions as gex
+
+    files: Dict[str, FakeFile] = {}
+    files_lock = threading.Lock()
+
+    def configure(**_: Any) -> None:
+        return None
+
+    def upload_file(path: Any = None, file: Any = None, display_name: Optional[str] = None, mime_type: Optional[str] = None, **_: Any) -> FakeFile:
+        if file is not None:
+            data = file.read()
+        else:
+            data = Path(path).read_bytes()
+        name = display_name or (Path(path).name if path else "upload")
+        backend.call("upload", 0, lambda: gex.ResourceExhausted("429 fake quota"), lambda: gex.ServiceUnavailable("503 fake"))
+        f = FakeFile(name, data, str(path) if path else None)
+        with files_lock:
+            files[f.name] = f
+        return f
+
+    def delete_file(name: Any) -> None:
+        backend.call("delete", 0, lambda: gex.ResourceExhausted("429 fake quota"), lambda: gex.ServiceUnavailable("503 fake"))
+        with files_lock:
+            files.pop(getattr(name, "name", name), None)
+
+    class GenerativeModel:
+        def __init__(self, model_name: str = "fake-gemini", **_: Any):
+            self.model_name = model_name
+
+        def generate_content(self, contents: Any, generation_config: Any = None, stream: bool = False, **_: Any):
+            text, fs = _parts_text(contents)
+            kind = _classify_prompt(text)
+            prompt_tokens = _tokens(text) + sum(_tokens(f.data.decode("utf-8", "ignore")) for f in fs)
+            backend.call(kind, prompt_tokens, lambda: gex.ResourceExhausted("429 fake quota"), lambda: gex.ServiceUnavailable("503 fake"))
+            out = _canned_gemini(backend, kind, text, fs)
+            usage = FakeUsage(prompt_tokens, backend.completed(kind, out))
+            if stream:
+                return FakeStreamResponse(backend, out, usage)
+            return FakeResponse(out, usage)
+
+    return {"configure": configure, "upload_file": upload_file, "delete_file": delete_file, "GenerativeModel": GenerativeModel}
+
+
+def _canned_gemini(backend: FakeBackend, kind: str, text: str, files: List[FakeFile]) -> str:
+    if kind == "extract":
+        name = files[0].display_name if files else "law"
+        law, arts = backend.law_for(files[0].path or name if files else name)
+        limit = backend.extract_limits.get(law)
+        return "```json\n" + json.dumps(arts[:limit] if limit else arts, ensure_ascii=False) + "\n```"
+
+    if kind == "compare":
+        cmp_articles: List[Dict[str, Any]] = []
+        if len(files) >= 2:
+            try:
+                cmp_articles = json.loads(files[1].data.decode("utf-8"))
+            except (UnicodeDecodeError, json.JSONDecodeError):
+                cmp_articles = []
+        k = min(len(cmp_articles), backend.choice([0, 1, 1, 2, 2, 3]))
+        picks = backend.sample(cmp_articles, k) if k else []
+        return json.dumps(
+            [
+                {
+                    "المادة_المشابهة_في_الملف_الثاني": a.get("article_number"),
+                    "عنوان_المادة_المشابهة": a.get("article_title"),
+                    "وجه_التشابه": "تتناول المادتان الموضوع نفسه وتفرضان التزامات متقاربة على المخاطبين بالحكم.",
+                }
+                for a in picks
+            ],
+            ensure_ascii=False,
+        )
+
+    if kind in ("suggest", "improve"):
+        keep = backend.rand() < 0.6
+        return json.dumps(
+            {
+                "decision": "keep" if keep else "amend",
+                "rationale": {
+                    "summary": "راجعنا المادة ونظيراتها المقارنة. الصياغة الحالية واضحة ومتسقة. لا يظهر ما يبرر تغيير الجوهر.",
+                    "evidence": [
+                        {"source": "المادة المشابهة", "quote": "نص مقتطف من المادة المقارنة", "why_relevant": "تعالج الموضوع نفسه"}
+                        for _ in range(3)
+                    ],
+                    "comparative_table": [
+                        {"jurisdiction": j, "alignment": "same", "note": "صياغة متقاربة"} for j in ("دبي", "أبوظبي")
+                    ],
+                    "constitutional_check_uae": {
+                        "assessment": "ok",
+                        "principles": ["مبدأ المشروعية", "اليقين القانوني"],
+                        "notes": "لا تعارض ظاهر.",
+                    },
+                    "risk_assessment": "منخفض.",
+                    "implementation_impact": "محدود.",
+                },
+                "proposed_text": None if keep else "نص مقترح معدّل للمادة بصياغة موحّدة.",
+                "footnotes": [{"type": "law", "source": "قانون مقارن", "pointer": "المادة ذات الصلة"}],
+            },
+            ensure_ascii=False,
+        )
+
+    if kind == "deepsearch":
+        return json.dumps(
+            {
+                "results": [
+                    {
+                        "title": f"مرجع تشريعي {i + 1}",
+                        "url": f"https://example.gov.ae/law/{i + 1}",
+                        "snippet": "مقتطف من مصدر رسمي يتناول موضوع المادة.",
+                        "why": "صلة مباشرة بموضوع المادة.",
+                        "score": 0.9 - i * 0.1,
+                    }
+                    for i in range(5)
+                ]
+            },
+            ensure_ascii=False,
+        )
+
+    if kind == "ocr":
+        return files[0].data.decode("utf-8", "ignore") if files else ""
+
+    return "legislation, regulation, compliance"
+
+
+# =========[ Azure OpenAI ]=========
+def make_azure_openai_fake(backend: FakeBackend):
+    import httpx
+    import openai
+
+    def rate_limited():
+        req = httpx.Request("POST", "https://fake.openai.azure.com/")
+        return openai.RateLimitError("429 fake", response=httpx.Response(429, request=req), body=None)
+
+    def unavailable():
+        return openai.APIConnectionError(request=httpx.Request("POST", "https://fake.openai.azure.com/"))
+
+    class _Completions:
+        def create(self, model: str = "", messages: Optional[List[Dict[str, str]]] = None, response_format: Any = None, stream: bool = False, **_: Any):
+            prompt = "\n".join(m.get("content") or "" for m in (messages or []))
+            kind = "classify" if response_format else "chat"
+            backend.call(kind, _tokens(prompt), rate_limited, unavailable)
+            if kind == "classify":
+                bucket = backend.choice(["cases", "contracts", "memos", "reports"])
+                from services.classifier import MAIN_BUCKETS
+                content = json.dumps({
+                    "bucket": bucket,
+                    "subfolder": MAIN_BUCKETS[bucket]["sub"][0],
+                    "confidence": round(0.6 + 0.35 * backend.rand(), 2),
+                    "reasoning": "تصنيف تجريبي.",
+                }, ensure_ascii=False)
+            else:
+                content = "إجابة تجريبية موجزة مبنية على النصوص القانونية المتاحة."
+            completion = backend.completed(kind, content)
+            usage = type("Usage", (), {"prompt_tokens": _tokens(prompt), "completion_tokens": completion,
+                                       "total_tokens": _tokens(prompt) + completion})()
+            if stream:
+                return _chat_stream(content, usage)
+            msg = type("Msg", (), {"content": content, "role": "assistant"})()
+            choice = type("Choice", (), {"message": msg, "finish_reason": "stop", "index": 0})()
+            return type("Completion", (), {"choices": [choice], "usage": usage, "model": model})()
+
+    def _chat_stream(content: str, usage: Any):
+        for i in range(0, len(content), 16):
+            delta = type("Delta", (), {"content": content[i:i + 16]})()
+            yield type("Chunk", (), {"choices": [type("C", (), {"delta": delta, "finish_reason": None})()], "usage": None})()
+        yield type("Chunk", (), {"choices": [], "usage": usage})()
+
+    class FakeAzureOpenAI:
+        def __init__(self, **_: Any):
+            self.chat = type("Chat", (), {"completions": _Completions()})()
+
+    return FakeAzureOpenAI
+
+
+# =========[ Azure Blob (aio) ]=========
+class _FakeBlobClient:
+    def __init__(self, backend: FakeBackend, store: Dict[Tuple[str, str], bytes],
+                 meta: Dict[Tuple[str, str], Dict[str, str]], container: str, name: str):
+        self._b, self._store, self._meta, self.container, self.name = backend, store, meta, container, name
+        self.url = f"https://fake.blob.core.windows.net/{container}/{name}"
+        self._blocks: Dict[str, bytes] = {}
+
+    async def _io(self, nbytes: int = 0) -> None:
+        import asyncio
+        await asyncio.sleep(self._b.latency("blob") * self._b.profile.time_scale)
+        with self._b.stats._lock:
+            self._b.stats.calls["blob"] += 1
+            self._b.stats.blob_bytes += nbytes
+
+    async def upload_blob(self, data: bytes, overwrite: bool = True, metadata: Any = None, **_: Any) -> None:
+        await self._io(len(data))
+        self._store[(self.container, self.name)] = bytes(data)
+        self._meta[(self.container, self.name)] = dict(metadata or {})
+
+    async def stage_block(self, block_id: str, data: bytes, **_: Any) -> None:
+        await self._io(len(data))
+        self._blocks[block_id] = bytes(data)
+
+    async def commit_block_list(self, blocks: List[Any], metadata: Any = None, **_: Any) -> None:
+        await self._io()
+        self._store[(self.container, self.name)] = b"".join(self._blocks[b.id] for b in blocks)
+        self._meta[(self.container, self.name)] = dict(metadata or {})
+
+    async def start_copy_from_url(self, url: str, **_: Any) -> Dict[str, str]:
+        await self._io()
+        _, _, path = url.partition(".net/")
+        c, _, n = path.partition("/")
+        self._store[(self.container, self.name)] = self._store.get((c, n), b"")
+        self._meta[(self.container, self.name)] = dict(self._meta.get((c, n), {}))
+        return {"copy_status": "success"}
+
+    async def exists(self) -> bool:
+        await self._io()
+        return (self.container, self.name) in self._store
+
+    async def get_blob_properties(self) -> Any:
+        from azure.core.exceptions import ResourceNotFoundError
+        await self._io()
+        if (self.container, self.name) not in self._store:
+            raise ResourceNotFoundError("BlobNotFound")
+        copy = type("Copy", (), {"status": "success"})()
+        return type("Props", (), {"metadata": dict(self._meta[(self.container, self.name)]), "copy": copy})()
+
+    async def delete_blob(self, **_: Any) -> None:
+        await self._io()
+        self._store.pop((self.container, self.name), None)
+        self._meta.pop((self.container, self.name), None)
+
+
+class FakeBlobService:
+    def __init__(self, backend: FakeBackend):
+        self._b = backend
+        self.store: Dict[Tuple[str, str], bytes] = {}
+        self.meta: Dict[Tuple[str, str], Dict[str, str]] = {}
+
+    async def create_container(self, name: str) -> None:
+        return None
+
+    def get_blob_client(self, container: str, blob: str) -> _FakeBlobClient:
+        return _FakeBlobClient(self._b, self.store, self.meta, container, blob)
+
+    async def close(self) -> None:
+        return None
+
+
+# =========[ التثبيت ]=========
+def install(profile: FakeProfile, demo_dir: Path) -> FakeBackend:
+    """
+    يستبدل نقاط الاتصال الخارجية قبل استيراد وحدات التطبيق:
+    google.generativeai.{configure,upload_file,delete_file,GenerativeModel} و openai.AzureOpenAI،
+    و time.sleep (التراجع بين المحاولات) يُضرب في time_scale.
+    عميل Blob غير المتزامن يُستبدل بعد استيراد services.storage_aio عبر install_blob().
+    """
+    import google.generativeai as genai
+    import openai
+
+    backend = FakeBackend(profile, demo_dir)
+    for name, fn in make_genai_fakes(backend).items():
+        setattr(genai, name, fn)
+    openai.AzureOpenAI = make_azure_openai_fake(backend)
+    time.sleep = lambda s: _real_sleep(max(0.0, s) * profile.time_scale)
+    return backend
+
+
+def install_blob(backend: FakeBackend) -> FakeBlobService:
+    import services.storage_aio as storage_aio
+
+    service = FakeBlobService(backend)
+    storage_aio._build_service = lambda session: service
+    return service
@@ -0,0 +1,245 @@
+# benchmarks/micro.py
+"""
+قياسات دقيقة لدوال المعالج الساخنة (بلا شبكة): تُستدعى لكل طلب أو لكل خلية مقارنة.
+المدخلات من قوانين demo_files المرفقة بأحجام من مادة واحدة حتى قانون الأونسيترال كاملًا.
+
+التشغيل (من مجلد backend):
+  python -m benchmarks.micro --out micro.json
+  python -m benchmarks.micro --baseline micro.json --max-regression 1.25   # يفشل (exit 1) عند التراجع
+  python -m benchmarks.micro --filter deepsearch --scale full
+
+المخرجات JSON: لكل (حالة، حجم) الوسيط/الأدنى للنداء الواحد بالميكروثانية وحجم المدخل بالبايت.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from benchmarks.fake_backends import set_dummy_credentials
+
+BACKEND_ROOT = Path(__file__).resolve().parent.parent
+DEFAULT_DEMO_DIR = BACKEND_ROOT / "demo_files - Copy"
+SCALE_LAW = "UNCITRALLaw"
+COUNTRY_LAWS = ("DubaiLaw", "AbuDhabiLaw", "EgyptLaw")
+SCALES = {"1": 1, "10": 10, "full": None}  # None = كل مواد القانون
+
+Case = Tuple[str, Callable[[], Any], int]  # (الاسم، نداء بلا وسائط، حجم المدخل بالبايت)
+
+
+def _size(obj: Any) -> int:
+    if isinstance(obj, str):
+        return len(obj.encode("utf-8"))
+    return len(json.dumps(obj, ensure_ascii=False).encode("utf-8"))
+
+
+def _similar(art: Dict[str, Any], reason: str = "تتناول المادتان الموضوع نفسه.") -> Dict[str, Any]:
+    """مادة مشابهة بالشكل الذي يكتبه main في results_{job_id}.json."""
+    return {
+        "matched_article_identifier": art.get("article_number"),
+        "matched_article_title": art.get("article_title"),
+        "reason_for_similarity": reason,
+        "matched_article_full_text": art.get("article_text", ""),
+    }
+
+
+def _results_report(base: List[Dict[str, Any]], laws: Dict[str, List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    """تقرير نتائج مكتمل: كل مادة × كل دولة مع مادتين مشابهتين."""
+    return [
+        {
+            "base_article_info": art,
+            "country_comparisons": [
+                {
+                    "country_name": country,
+                    "status": "completed",
+                    "similar_articles": [_similar(a) for a in laws[country][i % len(laws[country]):][:2]],
+                }
+                for country in COUNTRY_LAWS
+            ],
+        }
+        for i, art in enumerate(base)
+    ]
+
+
+def build_cases(laws: Dict[str, List[Dict[str, Any]]], n: int, tmp_dir: Path) -> List[Case]:
+    set_dummy_credentials()
+    from services import comparison, deepsearch, extraction, job_registry, suggestions
+    from services.classifier import _heuristic_bucket
+
+    arts = laws[SCALE_LAW][:n]
+    text = "\n\n".join(f"{a.get('article_title', '')}\n{a.get('article_text', '')}" for a in arts)
+    similars = [_similar(a) for a in arts]
+
+    # ردود النموذج كما تصل: JSON داخل ```json للمقارنة والاستخراج، ونسخة مقطوعة بفواصل زائدة للإصلاح
+    cmp_payload = [
+        {"المادة_المشابهة_في_الملف_الثاني": a.get("article_number"), "عنوان_المادة_المشابهة": a.get("article_title"),
+         "وجه_التشابه": (a.get("article_text") or "")[:300]}
+        for a in arts
+    ]
+    cmp_fenced = "```json\n" + json.dumps(cmp_payload, ensure_ascii=False, indent=2) + "\n```"
+    extract_fenced = "```json\n" + json.dumps(arts, ensure_ascii=False, indent=4) + "\n```"
+    suggestion = {
+        "decision": "amend",
+        "rationale": {
+            "summary": (arts[0].get("article_text") or "")[:600],
+            "evidence": [{"source": s["matched_article_identifier"], "quote": s["matched_article_full_text"][:400],
+                          "why_relevant": s["reason_for_similarity"]} for s in similars],
+            "comparative_table": [{"jurisdiction": c, "alignment": "same", "note": ""} for c in COUNTRY_LAWS],
+        },
+        "proposed_text": arts[0].get("article_text"),
+        "footnotes": [],
+    }
+    sug_clean = "```json\n" + json.dumps(suggestion, ensure_ascii=False) + "\n```"
+    sug_broken = json.dumps(suggestion, ensure_ascii=False).replace("}]", "},]")[:-2]
+
+    base = {"article_number": "1", "article_title": arts[0].get("article_title"), "article_text": text}
+    scope = {"law_subject": "التحكيم التجاري الدولي", "subject_refine": arts[0].get("article_title") or "",
+             "geo": "الإمارات", "timeframe": "آخر 10 سنوات", "sources": "تشريعات، معايير دولية"}
+    ans = deepsearch._normalize_answers(scope)
+    ds_results = [
+        {"title": a.get("article_title") or "", "url": f"https://uncitral.un.org/texts/{i}",
+         "snippet": (a.get("article_text") or "")[:300], "why": ""}
+        for i, a in enumerate(arts)
+    ]
+    tokens = text.split()
+    report = _results_report(arts, laws)
+
+    tmp = tmp_dir / "results.json"
+
+    def rewrite_results() -> None:
+        # نفس ما يفعله run_article_by_article_process بعد كل خلية
+        tmp.write_bytes(job_registry.dumps(report))
+
+    return [
+        ("comparison._extract_json", lambda: comparison._extract_json(cmp_fenced), _size(cmp_fenced)),
+        ("extraction._extract_json", lambda: extraction._extract_json(extract_fenced), _size(extract_fenced)),
+        ("suggestions._safe_json[clean]", lambda: suggestions._safe_json(sug_clean), _size(sug_clean)),
+        ("suggestions._safe_json[repair]", lambda: suggestions._safe_json(sug_broken), _size(sug_broken)),
+        ("suggestions._build_context", lambda: suggestions._build_context(arts[0], similars), _size(similars)),
+        ("deepsearch._norm_token", lambda: [deepsearch._norm_token(t) for t in tokens], _size(text)),
+        ("deepsearch._keywords", lambda: deepsearch._keywords(text), _size(text)),
+        ("deepsearch._build_queries", lambda: deepsearch._build_queries(base, scope), _size(text)),
+        ("deepsearch._rerank_results", lambda: deepsearch._rerank_results(ds_results, ans, base["article_title"] or "", text), _size(ds_results)),
+        ("classifier._heuristic_bucket", lambda: _heuristic_bucket("document.pdf", text), _size(text)),
+        ("main.results_json_dumps", lambda: job_registry.dumps(report), _size(report)),
+        ("main.results_rewrite", rewrite_results, _size(report)),
+    ]
+
+
+def time_call(fn: Callable[[], Any], min_time: float, repeats: int) -> Dict[str, float]:
+    """مثل timeit: يضاعف عدد الحلقات حتى تتجاوز الجولة min_time، ثم يكرر الجولة repeats مرة."""
+    fn()  # إحماء (استيرادات كسولة، ذاكرات مؤقتة)
+
+    def run(loops: int) -> float:
+        t0 = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        return time.perf_counter() - t0
+
+    loops = 1
+    elapsed = run(loops)
+    while elapsed < min_time and loops < 1 << 20:
+        loops = min(1 << 20, max(loops * 2, int(loops * min_time * 1.1 / max(elapsed, 1e-9))))
+        elapsed = run(loops)
+    per_call = [elapsed / loops] + [run(loops) / loops for _ in range(repeats - 1)]
+    return {
+        "loops": loops,
+        "median_us": round(statistics.median(per_call) * 1e6, 2),
+        "min_us": round(min(per_call) * 1e6, 2),
+        "stdev_us": round(statistics.pstdev(per_call) * 1e6, 2),
+    }
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_ROOT, capture_output=True, text=True, timeout=5
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def compare(results: List[Dict[str, Any]], baseline: Dict[str, Any], max_regression: float) -> List[Dict[str, Any]]:
+    """نسبة الوسيط الحالي إلى خط الأساس لكل (حالة، حجم) مشتركة؛ تُعلَّم ما يتجاوز max_regression."""
+    old = {(r["case"], r["scale"]): r for r in baseline.get("results", [])}
+    out = []
+    for r in results:
+        prev = old.get((r["case"], r["scale"]))
+        if not prev or not prev.get("median_us"):
+            continue
+        ratio = r["median_us"] / prev["median_us"]
+        out.append({"case": r["case"], "scale": r["scale"], "ratio": round(ratio, 3),
+                    "regressed": ratio > max_regression})
+    return out
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    p = argparse.ArgumentParser(description="Micro-benchmarks for CPU-side helpers.")
+    p.add_argument("--scale", action="append", choices=list(SCALES), help="repeatable; default: all")
+    p.add_argument("--filter", help="only cases whose name contains this substring")
+    p.add_argument("--min-time", type=float, default=0.2, help="seconds per timing round")
+    p.add_argument("--repeats", type=int, default=5)
+    p.add_argument("--demo-dir", type=Path, default=DEFAULT_DEMO_DIR)
+    p.add_argument("--out", type=Path, help="write the JSON report here as well")
+    p.add_argument("--baseline", type=Path, help="earlier report to compare against")
+    p.add_argument("--max-regression", type=float, default=1.25, help="median ratio above which a case counts as regressed")
+    return p.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    # tldextract يحاول تنزيل قائمة اللواحق عند أول استخدام ثم يرجع للنسخة المضمّنة؛ الإحماء يمتص ذلك
+    logging.getLogger("tldextract").setLevel(logging.CRITICAL)
+    laws = {
+        p.stem: json.loads(p.read_text("utf-8"))
+        for p in sorted(args.demo_dir.glob("*.json"))
+        if p.stem in (SCALE_LAW,) + COUNTRY_LAWS
+    }
+    missing = {SCALE_LAW, *COUNTRY_LAWS} - set(laws)
+    if missing:
+        raise SystemExit(f"Missing demo laws in {args.demo_dir}: {sorted(missing)}")
+
+    results: List[Dict[str, Any]] = []
+    with tempfile.TemporaryDirectory(prefix="ailegal-micro-") as tmp:
+        for scale in args.scale or list(SCALES):
+            n = SCALES[scale] or len(laws[SCALE_LAW])
+            for name, fn, nbytes in build_cases(laws, n, Path(tmp)):
+                if args.filter and args.filter not in name:
+                    continue
+                timing = time_call(fn, args.min_time, args.repeats)
+                results.append({"case": name, "scale": scale, "articles": n, "input_bytes": nbytes, **timing})
+                print(f"{name:<34} {scale:>4}  {timing['median_us']:>12.1f} µs", file=sys.stderr)
+
+    report: Dict[str, Any] = {
+        "meta": {
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "timestamp": int(time.time()),
+            "min_time": args.min_time,
+            "repeats": args.repeats,
+        },
+        "results": results,
+    }
+    status = 0
+    if args.baseline:
+        report["comparison"] = compare(results, json.loads(args.baseline.read_text("utf-8")), args.max_regression)
+        status = int(any(c["regressed"] for c in report["comparison"]))
+
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    print(text)
+    if args.out:
+        args.out.write_text(text, encoding="utf-8")
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -9,26 +9,47 @@ import json
 import logging
 import uuid
 import shutil
+import threading
 import time
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
 from pathlib import Path
 from typing import Optional, List, Dict, Any, Tuple
 
 import aiofiles
 import google.generativeai as genai
 from google.api_core import exceptions
-from fastapi import BackgroundTasks, FastAPI, File, UploadFile
+from fastapi import BackgroundTasks, FastAPI, File, Form, Request, UploadFile
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from pydantic import BaseModel
 from api.ai_routes import router as ai_router
 from api.file_routes import router as file_router
 
 
 # خدمات المشروع
+from services import job_registry, metrics, scheduler
 from services.extraction import extract_law
 from services.comparison import compare_single_article_with_api, normalize_similarities
-from services.suggestions import generate_legislative_suggestion
+from services.suggestions import (
+    generate_legislative_suggestion,
+    stream_legislative_suggestion,
+    suggestion_path_stats,
+)
+from services.results_rows import parse_fields, rows_page
+from services.planner import law_from_bytes, law_from_path, plan_job
+from services.streaming import SSE_HEADERS, sse_stream
+from services.storage_aio import open_async_storage, close_async_storage
 from services.deepsearch import deepsearch_questions as ds_questions, deepsearch_execute as ds_execute
+from services.suggestion_jobs import (
+    AUTO_SUGGEST,
+    cancel_rows as cancel_suggestion_rows,
+    job_suggestion_status,
+    load_suggestion,
+    store_suggestion,
+    submit_rows as submit_suggestion_rows,
+)
 
 from dotenv import load_dotenv
 load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), ".env"))
@@ -38,10 +59,23 @@ load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), ".env"))
 logging.basicConfig(level=logging.INFO, format="[%(asctime)s] [%(levelname)s] %(message)s")
 logger = logging.getLogger(__name__)
 
+@asynccontextmanager
+async def lifespan(_: FastAPI):
+    # عميل Blob غير متزامن واحد بمجمع اتصالات مشترك لكل مسارات /files
+    try:
+        await open_async_storage()
+    except RuntimeError as e:
+        # بدون بيانات اعتماد التخزين يعمل باقي التطبيق؛ مسارات /files ستُرجع الخطأ عند استدعائها
+        logger.warning(f"Async blob storage not initialized: {e}")
+    yield
+    await close_async_storage()
+
+
 app = FastAPI(
     title="Smart Legislation Assistant API",
     description="An API for intelligent comparison of legal texts using Generative AI.",
-    version="3.1.0"
+    version="3.1.0",
+    lifespan=lifespan,
 )
 
 app.include_router(ai_router) # يفعّل مسار /ai/chat
@@ -72,6 +106,8 @@ if not API_KEY:
 genai.configure(api_key=API_KEY)
 MODEL_NAME = os.getenv("GEMINI_MODEL", "gemini-2.5-pro") # تم تحديثه لنموذج أحدث
 model = genai.GenerativeModel(MODEL_NAME)
+# خلايا المهمة الواحدة التي تنتظر/تنفَّذ معًا؛ الحد الكلي لكل المهام هو CELL_CONCURRENCY في المجدول
+JOB_CELL_PARALLELISM = int(os.getenv("JOB_CELL_PARALLELISM", str(scheduler.CELL_CONCURRENCY)))
 
 # -----------------------
 # نماذج الطلبات (Pydantic)
@@ -79,10 +115,31 @@ model = genai.GenerativeModel(MODEL_NAME)
 class DemoRequest(BaseModel):
     primary_file: str
     comparison_files: list[str]
+    auto_suggest: bool = AUTO_SUGGEST  # توليد الاقتراح لكل صف فور اكتمال مقارناته
+    priority: Optional[str] = None  # interactive | normal | bulk (الافتراضي من JOB_DEFAULT_PRIORITY)
+    tenant: Optional[str] = None  # الفريق: مهامه تتقاسم حصة واحدة في الجدولة العادلة
+
+class PriorityRequest(BaseModel):
+    priority: str
+
+class FocusRequest(BaseModel):
+    article_indexes: List[int]  # الصفوف التي يعرضها المستخدم الآن، بترتيب الأهمية
+
+class PlanRequest(BaseModel):
+    primary_file: str
+    comparison_files: list[str]
+    auto_suggest: bool = AUTO_SUGGEST
+    priority: Optional[str] = None  # أولوية المهمة المقدَّرة: تحدد أي خلايا المجدول الحالية تسبقها
 
 class SuggestionRequest(BaseModel):
     job_id: str
     article_index: int  # فهرس الصف (المادة) في النتائج الحية
+    speculative: Optional[bool] = None  # جلب البحث المعمّق بالتوازي مع التمريرة الأولى (الافتراضي من البيئة)
+    refresh: bool = False  # تجاهل الاقتراح المحفوظ مسبقًا وإعادة التوليد
+
+class BulkSuggestionRequest(BaseModel):
+    article_indexes: Optional[List[int]] = None  # None = كل الصفوف
+    force: bool = False  # إعادة توليد الصفوف المحفوظة أيضًا
 
 class DeepSearchStartRequest(BaseModel):
     job_id: str
@@ -96,22 +153,32 @@ class DeepSearchExecRequest(BaseModel):
 # -------------------------------------------
 # وظيفة الخلفية: استخراج + مقارنة مادة بمادة
 # -------------------------------------------
-def run_article_by_article_process(primary_file_path: Path, cmp_file_paths: List[Path], job_id: str) -> None:
+def run_article_by_article_process(
+    primary_file_path: Path, cmp_file_paths: List[Path], job_id: str, auto_suggest: bool = False
+) -> None:
     """
     سير العمل:
     1) استخراج المواد من جميع الملفات (إن لم تكن مُستخرجة).
     2) رفع ملفات الـ JSON إلى Gemini (File API).
     3) المقارنة مادة بمادة، وتحديث النتائج لحظياً في ملف results_{job_id}.json.
+    4) (اختياري) جدولة الاقتراح التشريعي لكل صف فور اكتمال مقارناته.
+    كل نداءات النموذج/الرفع تمر بخانات المجدول المشترك (حسب أولوية المهمة)، والإلغاء يُفحص بين الخلايا.
     """
     uploaded_files: Dict[str, Any] = {}
     live_results_path = DATA_DIR / f"results_{job_id}.json"
+    consolidated_report: Optional[List[Dict[str, Any]]] = None
+    job = metrics.start_job(job_id)
+    job_registry.register(job_id, primary_file_path, cmp_file_paths)
+    scheduler.register(job_id)
 
     try:
         # 1) استخراج
+        job.phase("extraction")
         logger.info(f"Job [{job_id}] - Phase 1: Extracting all documents...")
         primary_json_path = primary_file_path.with_suffix(".json")
         if not primary_json_path.exists():
-            extract_law(primary_file_path, model, primary_json_path)
+            with scheduler.slot(job_id):
+                extract_law(primary_file_path, model, primary_json_path)
         if not primary_json_path.exists():
             raise FileNotFoundError(f"Primary file extraction failed for {primary_file_path.name}.")
 
@@ -119,22 +186,14 @@ def run_article_by_article_process(primary_file_path: Path, cmp_file_paths: List
         for p in cmp_file_paths:
             cmp_json = p.with_suffix(".json")
             if not cmp_json.exists():
-                extract_law(p, model, cmp_json)
+                with scheduler.slot(job_id):
+                    extract_law(p, model, cmp_json)
             if cmp_json.exists():
                 cmp_json_paths.append(cmp_json)
             else:
                 logger.warning(f"Job [{job_id}] - Skipping {p.name} as its extraction failed.")
 
-        # 2) رفع
-        logger.info(f"Job [{job_id}] - Phase 2: Uploading all JSON files to Google...")
-        up_primary = _upload_with_retries(primary_json_path, uploaded_files)
-        for json_path in cmp_json_paths:
-            _upload_with_retries(json_path, uploaded_files)
-        if up_primary is None:
-            raise RuntimeError("Primary file could not be uploaded; stopping job.")
-
-        # 3) تهيئة هيكل النتائج
-        logger.info(f"Job [{job_id}] - Phase 3: Starting article-by-article comparison...")
+        # هيكل النتائج الأولي يُنشر في السجل فورًا ليراه المستطلِع أثناء الرفع
         base_articles: List[Dict[str, Any]] = json.loads(primary_json_path.read_text("utf-8"))
 
         def get_clean_name(path: Path) -> str:
@@ -147,7 +206,7 @@ def run_article_by_article_process(primary_file_path: Path, cmp_file_paths: List
             get_clean_name(path): json.loads(path.read_text("utf-8")) for path in cmp_json_paths
         }
 
-        consolidated_report: List[Dict[str, Any]] = [
+        consolidated_report = [
             {
                 "base_article_info": base_art,
                 "country_comparisons": [
@@ -157,29 +216,65 @@ def run_article_by_article_process(primary_file_path: Path, cmp_file_paths: List
             }
             for base_art in base_articles
         ]
-        live_results_path.write_text(json.dumps(consolidated_report, ensure_ascii=False, indent=4), encoding="utf-8")
-
-        # 4) مقارنة مادة بمادة
-        for idx, base_article in enumerate(base_articles):
-            logger.info(f"Job [{job_id}] - Processing Article #{idx + 1} / {len(base_articles)}")
-            for cmp_idx, cmp_json_path in enumerate(cmp_json_paths):
-                country_name = get_clean_name(cmp_file_paths[cmp_idx])
-                logger.info(f"  -> Comparing with '{country_name}'")
-
-                up_cmp = uploaded_files.get(cmp_json_path.name)
-                if up_cmp is None:
-                    consolidated_report[idx]["country_comparisons"][cmp_idx]["status"] = "failed"
-                    live_results_path.write_text(
-                        json.dumps(consolidated_report, ensure_ascii=False, indent=4), encoding="utf-8"
-                    )
-                    continue
+        job_registry.publish(
+            job_id,
+            "initializing",
+            job_registry.dumps(
+                {
+                    "status": "initializing",
+                    "message": "Base file extracted. Preparing for comparison.",
+                    "data": consolidated_report,
+                }
+            ),
+            http_status=202,
+        )
+
+        # 2) رفع
+        job.phase("upload")
+        logger.info(f"Job [{job_id}] - Phase 2: Uploading all JSON files to Google...")
+        with scheduler.slot(job_id):
+            up_primary = _upload_with_retries(primary_json_path, uploaded_files)
+        for json_path in cmp_json_paths:
+            with scheduler.slot(job_id):
+                _upload_with_retries(json_path, uploaded_files)
+        if up_primary is None:
+            raise RuntimeError("Primary file could not be uploaded; stopping job.")
+
+        # 3) تهيئة هيكل النتائج
+        job.phase("comparison")
+        logger.info(f"Job [{job_id}] - Phase 3: Starting article-by-article comparison...")
+        _write_live_results(live_results_path, consolidated_report, job_id)
+
+        # 4) مقارنة مادة بمادة: عمّال المهمة يسحبون الخلايا من طابورها (ترتيب الملف، والصفوف المُركَّز عليها
+        #    عبر /focus أولًا)، وكل خلية تنتظر خانة في المجدول المشترك؛ التحديث والكتابة تحت قفل واحد،
+        #    والصف يُرسل للاقتراح فور اكتمال كل خلاياه.
+        report_lock = threading.Lock()
+        cells_left = [len(cmp_json_paths)] * len(base_articles)
+        cell_queue = scheduler.open_queue(job_id, len(base_articles), len(cmp_json_paths))
+
+        def run_cell(idx: int, cmp_idx: int) -> None:
+            scheduler.check(job_id)
+            base_article = base_articles[idx]
+            cmp_json_path = cmp_json_paths[cmp_idx]
+            country_name = get_clean_name(cmp_file_paths[cmp_idx])
+            cell = consolidated_report[idx]["country_comparisons"][cmp_idx]
+            logger.info(f"Job [{job_id}] - Article #{idx + 1} / {len(base_articles)} -> Comparing with '{country_name}'")
+
+            up_cmp = uploaded_files.get(cmp_json_path.name)
+            update: Dict[str, Any]
+            if up_cmp is None:
+                update = {"status": "failed"}
+            else:
                 try:
-                    raw_sims = compare_single_article_with_api(
-                        article=base_article,
-                        primary_file_upload=up_primary,
-                        comparison_file_upload=up_cmp,
-                        model=model,
-                    )
+                    with scheduler.slot(job_id):
+                        raw_sims = compare_single_article_with_api(
+                            article=base_article,
+                            primary_file_upload=up_primary,
+                            comparison_file_upload=up_cmp,
+                            model=model,
+                        )
+                    # أُلغيت المهمة أثناء النداء: تُهمل نتيجته وتبقى الخلية غير مكتملة
+                    scheduler.check(job_id)
                     similarities = normalize_similarities(raw_sims)
 
                     formatted_similarities = []
@@ -201,69 +296,174 @@ def run_article_by_article_process(primary_file_path: Path, cmp_file_paths: List
                         }
                         formatted_similarities.append(formatted_sim)
 
-                    consolidated_report[idx]["country_comparisons"][cmp_idx]["status"] = "completed"
-                    consolidated_report[idx]["country_comparisons"][cmp_idx]["similar_articles"] = formatted_similarities
+                    update = {"status": "completed", "similar_articles": formatted_similarities}
 
+                except scheduler.JobCancelled:
+                    raise
                 except Exception as e:
                     logger.error(
                         f"Job [{job_id}] - Failed to compare article #{idx + 1} with {country_name}. Error: {e}"
                     )
-                    consolidated_report[idx]["country_comparisons"][cmp_idx]["status"] = "failed"
-                    consolidated_report[idx]["country_comparisons"][cmp_idx]["error"] = str(e)
-
-                live_results_path.write_text(
-                    json.dumps(consolidated_report, ensure_ascii=False, indent=4), encoding="utf-8"
-                )
-                logger.info(f"Job [{job_id}] - Updated results for Article #{idx + 1} vs {country_name}.")
-
-            logger.info(f"Job [{job_id}] - Finished all comparisons for Article #{idx + 1}.")
-
+                    update = {"status": "failed", "error": str(e)}
+
+            with report_lock:
+                cell.update(update)
+                _write_live_results(live_results_path, consolidated_report, job_id)
+                cells_left[idx] -= 1
+                row_done = cells_left[idx] == 0
+            logger.info(f"Job [{job_id}] - Updated results for Article #{idx + 1} vs {country_name}.")
+
+            if row_done:
+                logger.info(f"Job [{job_id}] - Finished all comparisons for Article #{idx + 1}.")
+                if auto_suggest:
+                    submit_suggestion_rows(DATA_DIR, job_id, [idx], lambda i: _suggest_row(job_id, i))
+
+        def drain() -> None:
+            while (cell := cell_queue.pop()) is not None:
+                run_cell(*cell)
+
+        with ThreadPoolExecutor(max_workers=JOB_CELL_PARALLELISM, thread_name_prefix=f"cells-{job_id[:8]}") as pool:
+            # نسخة سياق لكل عامل: تحمل قياسات المهمة إلى الـ thread
+            futures = [pool.submit(contextvars.copy_context().run, drain) for _ in range(JOB_CELL_PARALLELISM)]
+            errors = [fut.exception() for fut in futures]
+        if any(isinstance(e, scheduler.JobCancelled) for e in errors):
+            raise scheduler.JobCancelled(job_id)
+        for e in errors:
+            if e is not None:
+                raise e
+
+        job_registry.set_status(job_id, "completed")
         logger.info(f"Job [{job_id}] - All processing tasks have been completed successfully.")
 
+    except scheduler.JobCancelled:
+        job.mark_cancelled()
+        logger.info(f"Job [{job_id}] - Cancelled; remaining comparisons were not scheduled.")
+        if consolidated_report is not None:
+            for row in consolidated_report:
+                for comp in row["country_comparisons"]:
+                    if comp["status"] == "pending":
+                        comp["status"] = "cancelled"
+            _write_live_results(live_results_path, consolidated_report, job_id)
+        else:
+            payload = job_registry.dumps({"status": "cancelled", "message": "Job was cancelled before comparison started."})
+            live_results_path.write_bytes(payload)
+            job_registry.publish(job_id, "cancelled", payload, http_status=409)
+        job_registry.set_status(job_id, "cancelled")
+
     except Exception as e:
+        job.mark_failed()
         logger.error(f"Job [{job_id}] - A critical error occurred: {e}", exc_info=True)
         error_report = {
             "status": "failed",
             "error_message": "A critical error occurred in the backend process.",
             "error_details": str(e),
         }
-        live_results_path.write_text(json.dumps(error_report, ensure_ascii=False, indent=4), encoding="utf-8")
+        payload = job_registry.dumps(error_report)
+        live_results_path.write_bytes(payload)
+        job_registry.publish(job_id, "failed", payload, http_status=500)
 
     finally:
         logger.info(f"Job [{job_id}] - Phase 4: Cleaning up uploaded files...")
+        job.phase("cleanup")
         for file_name, uploaded_file in uploaded_files.items():
             try:
-                genai.delete_file(uploaded_file.name)
+                with metrics.llm_call("gemini", "file_delete", "file-api"):
+                    genai.delete_file(uploaded_file.name)
                 logger.info(f"Job [{job_id}] - Cleaned up: {file_name}")
             except Exception as e:
                 logger.warning(f"Job [{job_id}] - Could not clean up file {file_name} ({uploaded_file.name}): {e}")
+        scheduler.finish(job_id)
+        metrics.end_job(job)
+
+def _write_live_results(path: Path, report: List[Dict[str, Any]], job_id: str) -> None:
+    """
+    يعيد كتابة ملف النتائج الحية بالكامل وينشر النسخة نفسها في سجل المهام (لخدمة الاستطلاع من الذاكرة)،
+    ويسجّل زمن الكتابة وحجمها في قياسات المهمة.
+    """
+    t0 = time.perf_counter()
+    payload = job_registry.dumps(report)
+    path.write_bytes(payload)
+    # لقطة بالبنية نفسها للقراءة من الذاكرة بلا تحليل: الخلايا تُنسخ لأن العامل يحدّثها في مكانها،
+    # ونصوص المواد وقوائم المطابقات تُشارك (تُستبدل عند التحديث ولا تُعدَّل)
+    snapshot = [
+        {**row, "country_comparisons": [dict(c) for c in row["country_comparisons"]]} for row in report
+    ]
+    job_registry.publish(job_id, "processing", payload, data=snapshot)
+    job = metrics.current_job()
+    if job is not None:
+        job.add_io("results_write", time.perf_counter() - t0, len(payload))
 
 def _upload_with_retries(path: Path, uploaded_files_dict: Dict, retries=3):
     for i in range(retries):
         try:
-            file = genai.upload_file(path=path, display_name=path.name, mime_type="text/plain")
+            with metrics.llm_call("gemini", "file_upload", "file-api", attempt=i + 1):
+                file = genai.upload_file(path=path, display_name=path.name, mime_type="text/plain")
             uploaded_files_dict[path.name] = file
             logger.info(f"Uploaded {path.name} as {file.name}")
             return file
         except (exceptions.ServiceUnavailable, exceptions.InternalServerError) as e:
             logger.warning(f"Upload failed for {path.name} (attempt {i+1}/{retries}): {e}")
             if i < retries - 1:
-                time.sleep(5 * (i + 1))
+                scheduler.sleep(5 * (i + 1))
     logger.error(f"Failed to upload {path.name} after {retries} attempts.")
     return None
 
 # --------------------------------
 # أدوات مساعدة للواجهات الجديدة
 # --------------------------------
+def _job_state(job_id: str) -> Optional[job_registry.JobRecord]:
+    """حالة المهمة من السجل في الذاكرة؛ يُقرأ ملف النتائج فقط إن لم تكن فيه (إعادة تشغيل/إخراج من الكاش)."""
+    rec = job_registry.get(job_id)
+    if rec is not None and (rec.payload is not None or rec.status == "extracting"):
+        return rec
+    return job_registry.load_from_disk(job_id, DATA_DIR / f"results_{job_id}.json") or rec
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    tags = [t.strip() for t in if_none_match.split(",")]
+    # المقارنة الضعيفة كما في RFC 9110 لـ If-None-Match: W/ لا يغيّر التطابق
+    return "*" in tags or any(t.removeprefix("W/") == etag for t in tags)
+
+def _pick_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    accepted = set()
+    for part in (accept_encoding or "").split(","):
+        name, _, params = part.strip().partition(";")
+        if params.replace(" ", "") in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            continue
+        accepted.add(name.strip().lower())
+    return next((enc for enc in job_registry.available_encodings() if enc in accepted), None)
+
+def _conditional_payload(rec: job_registry.JobRecord, request: Request) -> Response:
+    """رد النتائج مع ETag مبني على نسخة المهمة: 304 بلا جسم إن لم يتغير شيء، وإلا الجسم مضغوطًا إن أمكن."""
+    etag = rec.etag
+    headers = {"ETag": etag, "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    body, encoding = job_registry.encoded_payload(rec, _pick_encoding(request.headers.get("accept-encoding")))
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return Response(content=body, status_code=rec.http_status, media_type="application/json", headers=headers)
+
+def _job_report(rec: Optional[job_registry.JobRecord]) -> Optional[List[Dict[str, Any]]]:
+    """صفوف التقرير الحي من السجل (بلا قراءة للقرص)، أو None إن لم تبدأ المقارنة أو فشلت المهمة."""
+    if rec is None or rec.payload is None or rec.http_status != 200:
+        return None
+    data = job_registry.parsed_payload(rec)
+    return data if isinstance(data, list) else None
+
+def _row_pending(row: Dict[str, Any]) -> bool:
+    """صف لم تكتمل كل مقارناته بعد: اقتراحه سيُبنى على مواد مشابهة ناقصة."""
+    return any(comp.get("status") == "pending" for comp in row.get("country_comparisons", []))
+
 def _load_row(job_id: str, article_index: int) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
     """
     يحضّر المادة الأساسية + يجمع كل المواد المشابهة المكتملة في نفس الصف.
     """
-    live_results_path = DATA_DIR / f"results_{job_id}.json"
-    if not live_results_path.exists():
+    data = _job_report(_job_state(job_id))
+    if data is None:
         raise FileNotFoundError("LIVE_RESULTS_NOT_READY")
-    data = json.loads(live_results_path.read_text("utf-8"))
-    if not isinstance(data, list) or article_index < 0 or article_index >= len(data):
+    if article_index < 0 or article_index >= len(data):
         raise IndexError("ARTICLE_INDEX_OUT_OF_RANGE")
 
     row = data[article_index]
@@ -276,11 +476,23 @@ def _load_row(job_id: str, article_index: int) -> Tuple[Dict[str, Any], List[Dic
             sim_list.extend(comp.get("similar_articles", []))
     return base, sim_list
 
+def _row_settled(job_id: str, article_index: int) -> bool:
+    """اكتملت كل مقارنات الصف (أو انتهت بفشل/إلغاء)، فيصلح اقتراحه للحفظ وإعادة الخدمة."""
+    data = _job_report(_job_state(job_id))
+    return data is not None and 0 <= article_index < len(data) and not _row_pending(data[article_index])
+
+def _suggest_row(job_id: str, article_index: int, speculative: Optional[bool] = None) -> Dict[str, Any]:
+    base, row_similars = _load_row(job_id, article_index)
+    with metrics.bind_job(job_id):
+        return generate_legislative_suggestion(model, base, row_similars, speculative=speculative)
+
 # -------------------
 # نقاط النهاية (API)
 # -------------------
 @app.post("/process-demo", summary="Start a new demo comparison job")
 async def process_demo(request: DemoRequest, background_tasks: BackgroundTasks):
+    if request.priority is not None and request.priority not in scheduler.JOB_PRIORITIES:
+        return JSONResponse(status_code=400, content={"error": f"Unknown priority: {request.priority}"})
     job_id = uuid.uuid4().hex
     logger.info(f"Received new DEMO job with ID: {job_id}. Requested files: {request.dict()}")
 
@@ -304,7 +516,12 @@ async def process_demo(request: DemoRequest, background_tasks: BackgroundTasks):
     if not job_cmp_paths:
         return JSONResponse(status_code=404, content={"error": "No valid comparison demo files were found."})
 
-    background_tasks.add_task(run_article_by_article_process, job_primary_path, job_cmp_paths, job_id)
+    job_registry.register(job_id, job_primary_path, job_cmp_paths)
+    scheduler.register(job_id, request.priority, request.tenant)
+
+    background_tasks.add_task(
+        run_article_by_article_process, job_primary_path, job_cmp_paths, job_id, request.auto_suggest
+    )
     return JSONResponse(status_code=202, content={"id": job_id, "status": "processing"})
 
 @app.post("/process", summary="Start a new comparison job from upload")
@@ -312,7 +529,19 @@ async def process_files(
     background_tasks: BackgroundTasks,
     primary: UploadFile = File(...),
     comparisons: List[UploadFile] = File(...),
+    auto_suggest: bool = Form(AUTO_SUGGEST),
+    dry_run: bool = Form(False),
+    priority: Optional[str] = Form(None),
+    tenant: Optional[str] = Form(None),
 ):
+    if priority is not None and priority not in scheduler.JOB_PRIORITIES:
+        return JSONResponse(status_code=400, content={"error": f"Unknown priority: {priority}"})
+    if dry_run:
+        # تقدير فقط: لا يُحفظ شيء ولا تبدأ مهمة
+        primary_law = law_from_bytes(primary.filename, await primary.read())
+        cmp_laws = [law_from_bytes(uf.filename, await uf.read()) for uf in comparisons]
+        return JSONResponse(status_code=200, content=plan_job(primary_law, cmp_laws, auto_suggest, priority))
+
     job_id = uuid.uuid4().hex
     logger.info(f"Received new UPLOAD job with ID: {job_id}")
 
@@ -327,17 +556,34 @@ async def process_files(
             await f.write(await uf.read())
         cmp_paths.append(p)
 
-    background_tasks.add_task(run_article_by_article_process, primary_path, cmp_paths, job_id)
+    job_registry.register(job_id, primary_path, cmp_paths)
+    scheduler.register(job_id, priority, tenant)
+    background_tasks.add_task(run_article_by_article_process, primary_path, cmp_paths, job_id, auto_suggest)
     return JSONResponse(status_code=202, content={"id": job_id, "status": "processing"})
 
+@app.post("/plan", summary="Estimate calls, tokens and duration of a demo job before starting it")
+async def plan_demo(request: PlanRequest):
+    demo_primary_path = DEMO_DIR / request.primary_file
+    if not demo_primary_path.exists():
+        return JSONResponse(status_code=404, content={"error": f"Demo file not found: {request.primary_file}"})
+    cmp_paths = [DEMO_DIR / f for f in request.comparison_files if (DEMO_DIR / f).exists()]
+    if not cmp_paths:
+        return JSONResponse(status_code=404, content={"error": "No valid comparison demo files were found."})
+    if request.priority is not None and request.priority not in scheduler.JOB_PRIORITIES:
+        return JSONResponse(status_code=400, content={"error": f"Unknown priority: {request.priority}"})
+    plan = plan_job(
+        law_from_path(demo_primary_path), [law_from_path(p) for p in cmp_paths], request.auto_suggest, request.priority
+    )
+    return JSONResponse(status_code=200, content=plan)
+
 @app.get("/results/{job_id}", summary="Fetch live comparison results")
-async def get_live_results(job_id: str):
-    live_results_path = DATA_DIR / f"results_{job_id}.json"
-    if live_results_path.exists():
-        results = json.loads(live_results_path.read_text("utf-8"))
-        if isinstance(results, dict) and results.get("status") == "failed":
-            return JSONResponse(status_code=500, content=results)
-        return JSONResponse(status_code=200, content=results)
+async def get_live_results(job_id: str, request: Request):
+    # المسار السريع: آخر حالة نشرها عامل المهمة في الذاكرة، بلا قراءة أو تحليل
+    rec = _job_state(job_id)
+    if rec is not None and rec.payload is not None:
+        return _conditional_payload(rec, request)
+    if rec is not None and rec.status == "extracting":
+        return JSONResponse(status_code=202, content={"status": "extracting", "message": "Extracting base file. Please wait."})
 
     try:
         primary_file_path = next(DATA_DIR.glob(f"{job_id}_primary_*"))
@@ -379,10 +625,17 @@ async def get_live_results(job_id: str):
 # الاقتراح التشريعي (مع الدستور)
 # -------------------------------
 @app.post("/suggest-amendment", summary="Generate AI-backed legislative suggestion for a row")
-async def suggest_amendment(req: SuggestionRequest):
+def suggest_amendment(req: SuggestionRequest):
+    # دالة عادية (لا async): FastAPI يشغّلها في threadpool، فانتظار خانة المجدول لا يوقف حلقة الأحداث
     try:
-        base, row_similars = _load_row(req.job_id, req.article_index)
-        result = generate_legislative_suggestion(model, base, row_similars)
+        if not req.refresh:
+            stored = load_suggestion(DATA_DIR, req.job_id, req.article_index)
+            if stored is not None:
+                return JSONResponse(status_code=200, content=stored)
+        result = _suggest_row(req.job_id, req.article_index, speculative=req.speculative)
+        # اقتراح صف لم تكتمل مقارناته يُعاد للعميل ولا يُحفظ، حتى لا يُخدم لاحقًا بدل الاقتراح الكامل
+        if _row_settled(req.job_id, req.article_index):
+            store_suggestion(DATA_DIR, req.job_id, req.article_index, result)
         return JSONResponse(status_code=200, content=result)
     except FileNotFoundError:
         return JSONResponse(status_code=404, content={"error": f"Job ID {req.job_id} not found or results are not ready."})
@@ -390,11 +643,162 @@ async def suggest_amendment(req: SuggestionRequest):
         logger.exception("suggest-amendment failed")
         return JSONResponse(status_code=500, content={"error": str(e)})
 
+@app.post("/suggest-amendment/stream", summary="Stream a legislative suggestion as Server-Sent Events")
+async def suggest_amendment_stream(req: SuggestionRequest):
+    """
+    الأحداث: stage (pass1/deepsearch/pass2)، delta (مقاطع JSON الخام من النموذج)،
+    ثم result بالاقتراح النهائي المُتحقَّق منه مع usage، أو error.
+    """
+    try:
+        base, row_similars = _load_row(req.job_id, req.article_index)
+    except FileNotFoundError:
+        return JSONResponse(status_code=404, content={"error": f"Job ID {req.job_id} not found or results are not ready."})
+    except IndexError as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
+
+    def events():
+        if not req.refresh:
+            stored = load_suggestion(DATA_DIR, req.job_id, req.article_index)
+            if stored is not None:
+                yield {"event": "result", "data": stored, "usage": {}, "cached": True}
+                return
+        stream = stream_legislative_suggestion(model, base, row_similars, speculative=req.speculative)
+        for ev in metrics.bind_iter(req.job_id, stream):
+            if ev["event"] == "result" and _row_settled(req.job_id, req.article_index):
+                store_suggestion(DATA_DIR, req.job_id, req.article_index, ev["data"])
+            yield ev
+
+    return StreamingResponse(sse_stream(events()), media_type="text/event-stream", headers=SSE_HEADERS)
+
+@app.post("/jobs/{job_id}/suggestions", summary="Generate suggestions for all or selected rows in the background")
+async def bulk_suggestions(job_id: str, req: Optional[BulkSuggestionRequest] = None):
+    """الصفوف التي ما زالت مقارناتها جارية لا تُجدول (تُعاد في incomplete)؛ اطلبها بعد اكتمالها."""
+    req = req or BulkSuggestionRequest()
+    rec = _job_state(job_id)
+    if rec is None or rec.payload is None:
+        return JSONResponse(status_code=404, content={"error": f"Job ID {job_id} not found or results are not ready."})
+    data = _job_report(rec)
+    if data is None:
+        return JSONResponse(status_code=409, content={"error": "Job has no comparable rows.", "status": rec.status})
+
+    indexes = req.article_indexes if req.article_indexes is not None else list(range(len(data)))
+    bad = [i for i in indexes if i < 0 or i >= len(data)]
+    if bad:
+        return JSONResponse(status_code=400, content={"error": "ARTICLE_INDEX_OUT_OF_RANGE", "indexes": bad})
+
+    incomplete = [i for i in indexes if _row_pending(data[i])]
+    ready = [i for i in indexes if not _row_pending(data[i])]
+    summary = submit_suggestion_rows(DATA_DIR, job_id, ready, lambda i: _suggest_row(job_id, i), force=req.force)
+    return JSONResponse(status_code=202, content={"id": job_id, **summary, "incomplete": incomplete})
+
+@app.get("/jobs/{job_id}/suggestions", summary="Bulk suggestion progress per row")
+async def bulk_suggestions_status(job_id: str):
+    rec = _job_state(job_id)
+    if rec is None or rec.payload is None:
+        return JSONResponse(status_code=404, content={"error": f"Job ID {job_id} not found or results are not ready."})
+    data = _job_report(rec)
+    rows = job_suggestion_status(DATA_DIR, job_id, len(data) if data is not None else 0)
+    done = sum(1 for r in rows if r["status"] == "completed")
+    return JSONResponse(status_code=200, content={"id": job_id, "completed": done, "total": len(rows), "rows": rows})
+
+@app.get("/jobs/{job_id}/rows", summary="Paginated results rows with field projection")
+async def job_rows(
+    job_id: str,
+    request: Request,
+    offset: int = 0,
+    limit: int = 50,
+    fields: Optional[str] = None,
+    country: Optional[str] = None,
+):
+    """
+    fields: قائمة مفصولة بفواصل من حقول المادة/المقارنة/المطابقة (الافتراضي: الكل)،
+    مثل fields=article_number,article_title,status,matched_article_title للقوائم دون النصوص الكاملة.
+    country: اسم دولة أو أكثر مفصولة بفواصل.
+    """
+    try:
+        chosen = parse_fields(fields)
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
+    rec = _job_state(job_id)
+    if rec is None:
+        return JSONResponse(status_code=404, content={"status": "error", "message": "Job ID not found."})
+    if rec.payload is None:
+        return JSONResponse(status_code=202, content={"status": rec.status, "message": "Results are not ready yet."})
+
+    # الجسم يحمل الحالة أيضًا فالوسم من النسخة والحالة معًا؛ يُقرأ قبل الـ payload فلا يَسِم جسمًا أقدم منه
+    status, version, etag = rec.status, rec.version, rec.status_etag
+    data = job_registry.parsed_payload(rec)
+    if rec.http_status >= 400:
+        # فشلت المهمة أو أُلغيت قبل المقارنة: لا صفوف، نعيد حالتها كما في /results
+        return JSONResponse(status_code=rec.http_status, content=data)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    report = data.get("data", []) if isinstance(data, dict) else data  # initializing: الهيكل المبدئي
+    countries = {c.strip() for c in country.split(",") if c.strip()} if country else None
+    page = rows_page(report, offset, limit, chosen, countries)
+    body = {"job_id": job_id, "status": status, "version": version, **page}
+    return Response(content=job_registry.dumps(body), media_type="application/json", headers=headers)
+
+@app.post("/jobs/{job_id}/cancel", summary="Cancel a running comparison job")
+async def cancel_job(job_id: str):
+    """
+    يوقف جدولة الخلايا الجديدة ويقطع الانتظارات الجارية؛ التنظيف (حذف الملفات المرفوعة) يتم في عامل المهمة.
+    الاقتراحات المجدولة للمهمة التي لم تبدأ بعد تُلغى أيضًا (حتى لو انتهت المقارنة).
+    """
+    result = scheduler.cancel(job_id)
+    suggestions = cancel_suggestion_rows(job_id)
+    if result is None and not suggestions:
+        return JSONResponse(status_code=404, content={"status": "error", "message": "Job ID not found."})
+    if not result and not suggestions:
+        return JSONResponse(status_code=409, content={"status": "error", "message": "Job has already finished."})
+    return JSONResponse(
+        status_code=202,
+        content={"id": job_id, "status": "cancelling" if result else "finished", "cancelled_suggestions": suggestions},
+    )
+
+@app.post("/jobs/{job_id}/priority", summary="Change the scheduling priority of a running job")
+async def change_job_priority(job_id: str, req: PriorityRequest):
+    try:
+        found = scheduler.set_priority(job_id, req.priority)
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
+    if not found:
+        return JSONResponse(status_code=404, content={"status": "error", "message": "Job ID not found."})
+    return JSONResponse(status_code=200, content={"id": job_id, **scheduler.job_info(job_id)})
+
+@app.post("/jobs/{job_id}/focus", summary="Compare the given rows next (the rows the user is looking at)")
+async def focus_job_rows(job_id: str, req: FocusRequest):
+    result = scheduler.focus(job_id, req.article_indexes)
+    if result is None:
+        return JSONResponse(status_code=404, content={"status": "error", "message": "Job ID not found."})
+    return JSONResponse(status_code=200, content={"id": job_id, **result})
+
+@app.get("/jobs/{job_id}/metrics", summary="Per-job phase timings and model call statistics")
+async def job_metrics(job_id: str):
+    summary = metrics.job_summary(job_id)
+    if summary is None:
+        return JSONResponse(status_code=404, content={"error": f"No metrics recorded for job {job_id} in this process."})
+    return JSONResponse(status_code=200, content={**summary, "scheduler": scheduler.job_info(job_id)})
+
+@app.get("/scheduler", summary="Shared model scheduler: slots, rate limit, per-job share and queue wait")
+async def scheduler_stats():
+    return JSONResponse(status_code=200, content=scheduler.stats())
+
+@app.get("/metrics", summary="Prometheus metrics", include_in_schema=False)
+async def prometheus_metrics():
+    body, content_type = metrics.prometheus_payload()
+    return Response(content=body, media_type=content_type)
+
+@app.get("/suggestions/stats", summary="How often suggestions were repaired locally vs. sent to a second pass")
+async def suggestions_stats():
+    return JSONResponse(status_code=200, content=suggestion_path_stats())
+
 # -------------------------------
 # البحث المعمّق (الأسئلة + التنفيذ)
 # -------------------------------
 @app.post("/deep-search/start", summary="Start Deep Search Q&A for an article")
-async def deep_search_start(req: DeepSearchStartRequest):
+def deep_search_start(req: DeepSearchStartRequest):
     """
     **تعديل رئيسي:** تحديث قسم الـ fallback ليتوافق مع هيكل الأسئلة الجديد والإلزامي.
     """
@@ -449,7 +853,7 @@ async def deep_search_start(req: DeepSearchStartRequest):
 
 
 @app.post("/deep-search/execute", summary="Execute Deep Search after Q&A clarifications")
-async def deep_search_execute(req: DeepSearchExecRequest):
+def deep_search_execute(req: DeepSearchExecRequest):
     """
     **تعديل رئيسي:** إضافة التحقق من وجود `law_subject` الإلزامي.
     """
@@ -1,9 +1,26 @@
 # services/azure_ai.py
 from __future__ import annotations
 import os
-from typing import List, Literal, Optional
+import hashlib
+import json
+import math
+import threading
+import time
+from collections import Counter, OrderedDict
+from typing import Any, Dict, Iterator, List, Literal, Optional, Tuple
 from pydantic import BaseModel, Field
-from openai import AzureOpenAI
+from openai import AzureOpenAI, BadRequestError
+
+from services import metrics
+from services.law_index import law_index
+from services.text_norm import tokenize
+
+# عدّاد توكنات دقيق إن توفّر tiktoken، وإلا تقدير تقريبي
+try:
+    import tiktoken
+    _ENC = tiktoken.get_encoding("cl100k_base")
+except Exception:  # pragma: no cover
+    _ENC = None
 
 # (محليًا فقط) لقراءة .env
 try:
@@ -29,6 +46,20 @@ client = AzureOpenAI(
     api_version=API_VERSION,
 )
 
+# ميزانية التوكنات لسجل المحادثة، ولمقتطفات القوانين المسترجعة
+CHAT_HISTORY_TOKEN_BUDGET = int(os.getenv("CHAT_HISTORY_TOKEN_BUDGET", "3000"))
+CHAT_LAW_CONTEXT_TOP_K    = int(os.getenv("CHAT_LAW_CONTEXT_TOP_K", "4"))
+CHAT_LAW_CONTEXT_TOKENS   = int(os.getenv("CHAT_LAW_CONTEXT_TOKENS", "1500"))
+
+# كاش الردود: مفعّل افتراضيًا فقط للحرارة المنخفضة (ردود شبه حتمية)
+CHAT_CACHE_ENABLED         = os.getenv("CHAT_CACHE_ENABLED", "1").lower() in {"1", "true", "yes", "on"}
+CHAT_CACHE_MAX_TEMPERATURE = float(os.getenv("CHAT_CACHE_MAX_TEMPERATURE", "0.3"))
+CHAT_CACHE_TTL_SEC         = float(os.getenv("CHAT_CACHE_TTL_SEC", "3600"))
+CHAT_CACHE_MAX_ENTRIES     = int(os.getenv("CHAT_CACHE_MAX_ENTRIES", "1000"))
+# الطبقة التقريبية (أسئلة شبه متطابقة) اختيارية
+CHAT_CACHE_NEAR_DUP        = os.getenv("CHAT_CACHE_NEAR_DUP", "0").lower() in {"1", "true", "yes", "on"}
+CHAT_CACHE_NEAR_THRESHOLD  = float(os.getenv("CHAT_CACHE_NEAR_THRESHOLD", "0.92"))
+
 class ChatMessage(BaseModel):
     role: Literal["system", "user", "assistant"]
     content: str
@@ -41,30 +72,328 @@ class ChatRequest(BaseModel):
         "You are a helpful assistant for legal document management in the UAE. "
         "Reply in Arabic when the user writes Arabic."
     )
+    history_token_budget: int = Field(CHAT_HISTORY_TOKEN_BUDGET, gt=0)
+    law_context_top_k: int = Field(CHAT_LAW_CONTEXT_TOP_K, ge=0)  # 0 = بدون استرجاع
+    cache: Optional[bool] = None  # None = حسب الحرارة والإعدادات
 
 class ChatResponse(BaseModel):
     content: str
     prompt_tokens: int
     completion_tokens: int
     total_tokens: int
+    context_articles: List[str] = Field(default_factory=list)  # المواد المحقونة في السياق
+    trimmed_turns: int = 0  # عدد الرسائل القديمة التي لُخّصت بدل إرسالها
+    cached: Optional[Literal["exact", "near"]] = None  # مصدر الرد إن جاء من الكاش
+
+# =========[ إدارة السياق: سجل محدود + مواد ذات صلة ]=========
+def estimate_tokens(text: str) -> int:
+    if not text:
+        return 0
+    if _ENC is not None:
+        return len(_ENC.encode(text))
+    return len(text) // 3 + 1  # العربية أكثف من الإنجليزية في التوكنات
+
+def _clip(text: str, max_tokens: int) -> str:
+    """يقص النص تقريبيًا إلى max_tokens."""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    ratio = max_tokens / max(estimate_tokens(text), 1)
+    return text[: max(int(len(text) * ratio) - 1, 0)] + "…"
+
+def fit_history(messages: List[Dict[str, str]], budget: int) -> Tuple[List[Dict[str, str]], Optional[str], int]:
+    """
+    يُبقي أحدث الرسائل ضمن الميزانية (آخر رسالة تبقى دائمًا ولو قُصّت)،
+    ويحوّل الأقدم إلى ملخص استخراجي قصير بدل إسقاطها كليًا — بلا نداء إضافي للنموذج.
+    يعيد (الرسائل المُبقاة، الملخص أو None، عدد الرسائل الملخّصة).
+    """
+    if not messages:
+        return [], None, 0
+    summary_budget = max(budget // 6, 64)
+    remaining = budget - summary_budget
+    kept: List[Dict[str, str]] = []
+    for i in range(len(messages) - 1, -1, -1):
+        m = messages[i]
+        cost = estimate_tokens(m["content"]) + 4
+        if cost <= remaining or not kept:
+            if cost > remaining:
+                m = {**m, "content": _clip(m["content"], max(remaining - 4, 32))}
+            kept.append(m)
+            remaining -= min(cost, remaining)
+            continue
+        break
+    kept.reverse()
+    dropped = messages[: len(messages) - len(kept)]
+    if not dropped:
+        return kept, None, 0
+
+    # ملخص: أسئلة المستخدم السابقة (الأحدث أولًا) حتى تنفد ميزانية الملخص
+    lines: List[str] = []
+    used = 0
+    for m in reversed(dropped):
+        if m["role"] != "user":
+            continue
+        line = "- " + _clip(" ".join(m["content"].split()), 60)
+        cost = estimate_tokens(line)
+        if used + cost > summary_budget:
+            break
+        lines.append(line)
+        used += cost
+    summary = None
+    if lines:
+        summary = "ملخص أسئلة سابقة في هذه المحادثة (الأحدث أولًا):\n" + "\n".join(lines)
+    return kept, summary, len(dropped)
+
+def _law_context(query: str, top_k: int) -> Tuple[Optional[str], List[str]]:
+    """يسترجع أفضل المواد من القوانين المستخرجة محليًا ويصوغها كرسالة نظام."""
+    if top_k <= 0 or not query.strip():
+        return None, []
+    hits = law_index.search(query, top_k=top_k)
+    if not hits:
+        return None, []
+    per_article = max(CHAT_LAW_CONTEXT_TOKENS // len(hits), 80)
+    blocks: List[str] = []
+    refs: List[str] = []
+    for h in hits:
+        ref = f"{h['source']} — {h.get('article_number') or ''}".strip(" —")
+        title = f" ({h['article_title']})" if h.get("article_title") else ""
+        blocks.append(f"[{ref}{title}]\n{_clip(h['article_text'], per_article)}")
+        refs.append(ref)
+    text = (
+        "مقتطفات من القوانين المستخرجة في النظام قد تكون ذات صلة بالسؤال. "
+        "استند إليها عند الاقتضاء واذكر المرجع بين معقوفين، ولا تفترض ما ليس فيها:\n\n"
+        + "\n\n".join(blocks)
+    )
+    return text, refs
+
+def _build_messages(req: ChatRequest) -> Tuple[List[Dict[str, str]], Dict[str, Any]]:
+    history = [m.model_dump() for m in req.messages]
+    kept, summary, trimmed = fit_history(history, req.history_token_budget)
+
+    last_user = next((m["content"] for m in reversed(history) if m["role"] == "user"), "")
+    law_text, refs = _law_context(last_user, req.law_context_top_k)
 
-def chat(req: ChatRequest) -> ChatResponse:
     msgs = []
     if req.system_prompt:
         msgs.append({"role": "system", "content": req.system_prompt})
-    msgs += [m.model_dump() for m in req.messages]
+    if summary:
+        msgs.append({"role": "system", "content": summary})
+    if law_text:
+        msgs.append({"role": "system", "content": law_text})
+    msgs += kept
+    return msgs, {"context_articles": refs, "trimmed_turns": trimmed}
 
-    resp = client.chat.completions.create(
-        model=AZURE_OPENAI_DEPLOYMENT,  # اسم الـ deployment (مثلاً gpt35-legal-dev)
-        messages=msgs,
-        temperature=req.temperature,
-        max_tokens=req.max_tokens,
-    )
+# =========[ كاش الردود: مطابقة تامة + طبقة تقريبية اختيارية ]=========
+def _norm_text(text: str) -> str:
+    return " ".join((text or "").split())
+
+def _cosine(a: Counter, b: Counter) -> float:
+    if not a or not b:
+        return 0.0
+    dot = sum(v * b.get(k, 0) for k, v in a.items())
+    na = math.sqrt(sum(v * v for v in a.values()))
+    nb = math.sqrt(sum(v * v for v in b.values()))
+    return dot / (na * nb) if na and nb else 0.0
+
+class ChatCache:
+    """
+    LRU مع TTL. المفتاح التام: (system_prompt, messages, temperature, max_tokens, deployment,
+    إعدادات السياق) بعد توحيد المسافات. الطبقة التقريبية تقارن آخر رسالة مستخدم فقط
+    بين طلبات لها نفس "البادئة" (كل ما سبقها + الإعدادات).
+    """
+
+    def __init__(self, max_entries: int, ttl_sec: float):
+        self.max_entries = max_entries
+        self.ttl_sec = ttl_sec
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self.stats = {"hits_exact": 0, "hits_near": 0, "misses": 0, "bypassed": 0,
+                      "stores": 0, "evicted": 0, "expired": 0}
+
+    @staticmethod
+    def keys_for(req: ChatRequest) -> Tuple[str, str, str]:
+        """يعيد (المفتاح التام، مفتاح البادئة، نص آخر رسالة)."""
+        msgs = [(m.role, _norm_text(m.content)) for m in req.messages]
+        settings = [_norm_text(req.system_prompt or ""), req.temperature, req.max_tokens,
+                    AZURE_OPENAI_DEPLOYMENT, req.history_token_budget, req.law_context_top_k]
+        last = msgs[-1][1] if msgs and msgs[-1][0] == "user" else ""
+        prefix = msgs[:-1] if last else msgs
+        h = lambda obj: hashlib.sha256(json.dumps(obj, ensure_ascii=False).encode("utf-8")).hexdigest()
+        return h([settings, msgs]), h([settings, prefix]), last
+
+    def _expire(self, now: float) -> None:
+        # المدخلات مرتبة حسب آخر استخدام؛ نفحص الأقدم فقط
+        while self._entries:
+            key, entry = next(iter(self._entries.items()))
+            if now - entry["stored_at"] <= self.ttl_sec:
+                break
+            self._entries.pop(key)
+            self.stats["expired"] += 1
+
+    def get(self, req: ChatRequest, near_dup: bool) -> Tuple[Optional[ChatResponse], Optional[str]]:
+        key, prefix, last = self.keys_for(req)
+        now = time.time()
+        with self._lock:
+            self._expire(now)
+            entry = self._entries.get(key)
+            if entry and now - entry["stored_at"] <= self.ttl_sec:
+                self._entries.move_to_end(key)
+                self.stats["hits_exact"] += 1
+                return entry["response"], "exact"
+            if near_dup and last:
+                vec = Counter(tokenize(last))
+                best, best_sim = None, 0.0
+                for k, e in self._entries.items():
+                    if e["prefix"] != prefix:
+                        continue
+                    sim = _cosine(vec, e["vec"])
+                    if sim > best_sim:
+                        best, best_sim = k, sim
+                if best is not None and best_sim >= CHAT_CACHE_NEAR_THRESHOLD:
+                    self._entries.move_to_end(best)
+                    self.stats["hits_near"] += 1
+                    return self._entries[best]["response"], "near"
+            self.stats["misses"] += 1
+            return None, None
+
+    def put(self, req: ChatRequest, resp: ChatResponse) -> None:
+        key, prefix, last = self.keys_for(req)
+        with self._lock:
+            self._entries[key] = {
+                "response": resp.model_copy(update={"cached": None}),
+                "prefix": prefix,
+                "vec": Counter(tokenize(last)),
+                "stored_at": time.time(),
+            }
+            self._entries.move_to_end(key)
+            self.stats["stores"] += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats["evicted"] += 1
+
+    def bypass(self) -> None:
+        with self._lock:
+            self.stats["bypassed"] += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.stats["hits_exact"] + self.stats["hits_near"] + self.stats["misses"]
+            hits = self.stats["hits_exact"] + self.stats["hits_near"]
+            return {
+                **self.stats,
+                "entries": len(self._entries),
+                "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+                "near_dup_enabled": CHAT_CACHE_NEAR_DUP,
+            }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+chat_cache = ChatCache(CHAT_CACHE_MAX_ENTRIES, CHAT_CACHE_TTL_SEC)
+
+def _cache_enabled(req: ChatRequest) -> bool:
+    if req.cache is not None:
+        return req.cache
+    return CHAT_CACHE_ENABLED and req.temperature <= CHAT_CACHE_MAX_TEMPERATURE
+
+def _from_cache(hit: ChatResponse, how: str) -> ChatResponse:
+    """رد من الكاش: لم يُرسل أي طلب، فالاستهلاك صفر (لا تُحسب توكنات الرد الأصلي مرة أخرى)."""
+    return hit.model_copy(update={"cached": how, "prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0})
+
+def _rejects_stream_options(e: BadRequestError) -> bool:
+    """400 سببه أن إصدار الـ API لا يعرف stream_options، لا فلتر المحتوى أو طول السياق."""
+    return getattr(e, "param", None) == "stream_options" or "stream_options" in str(e)
+
+def chat(req: ChatRequest) -> ChatResponse:
+    use_cache = _cache_enabled(req)
+    if use_cache:
+        hit, how = chat_cache.get(req, CHAT_CACHE_NEAR_DUP)
+        if hit is not None:
+            return _from_cache(hit, how)
+    else:
+        chat_cache.bypass()
+
+    msgs, ctx = _build_messages(req)
+
+    with metrics.llm_call("azure_openai", "chat", AZURE_OPENAI_DEPLOYMENT) as call:
+        resp = client.chat.completions.create(
+            model=AZURE_OPENAI_DEPLOYMENT,  # اسم الـ deployment (مثلاً gpt35-legal-dev)
+            messages=msgs,
+            temperature=req.temperature,
+            max_tokens=req.max_tokens,
+        )
+        call.usage(resp)
     choice = resp.choices[0].message
     usage = resp.usage
-    return ChatResponse(
+    out = ChatResponse(
         content=choice.content or "",
         prompt_tokens=getattr(usage, "prompt_tokens", 0),
         completion_tokens=getattr(usage, "completion_tokens", 0),
         total_tokens=getattr(usage, "total_tokens", 0),
+        **ctx,
+    )
+    if use_cache and out.content:
+        chat_cache.put(req, out)
+    return out
+
+def chat_stream(req: ChatRequest) -> Iterator[Dict[str, Any]]:
+    """
+    نسخة البث من chat: تُصدر {"event": "delta", "content": ...} لكل مقطع فور وصوله،
+    ثم {"event": "done", ...} بالاستهلاك (ChatResponse كاملة) في النهاية.
+    """
+    use_cache = _cache_enabled(req)
+    if use_cache:
+        hit, how = chat_cache.get(req, CHAT_CACHE_NEAR_DUP)
+        if hit is not None:
+            yield {"event": "delta", "content": hit.content}
+            yield {"event": "done", **_from_cache(hit, how).model_dump(), "usage_reported": True}
+            return
+    else:
+        chat_cache.bypass()
+
+    msgs, ctx = _build_messages(req)
+
+    kwargs = dict(
+        model=AZURE_OPENAI_DEPLOYMENT,
+        messages=msgs,
+        temperature=req.temperature,
+        max_tokens=req.max_tokens,
+        stream=True,
+    )
+    parts: List[str] = []
+    usage = None
+    n_chunks = 0
+    with metrics.llm_call("azure_openai", "chat_stream", AZURE_OPENAI_DEPLOYMENT) as call:
+        try:
+            stream = client.chat.completions.create(**kwargs, stream_options={"include_usage": True})
+        except BadRequestError as e:
+            # إصدارات API أقدم من 2024-09-01-preview ترفض stream_options؛ أي 400 آخر يُرفع كما هو
+            if not _rejects_stream_options(e):
+                raise
+            stream = client.chat.completions.create(**kwargs)
+        for chunk in stream:
+            if getattr(chunk, "usage", None):
+                usage = chunk.usage
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta
+            piece = getattr(delta, "content", None)
+            if piece:
+                parts.append(piece)
+                n_chunks += 1
+                yield {"event": "delta", "content": piece}
+
+        # بعض إصدارات الـ API لا ترسل usage مع البث؛ كل مقطع ≈ توكن واحد في Azure
+        completion_tokens = getattr(usage, "completion_tokens", None) or n_chunks
+        prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+        call.prompt_tokens, call.completion_tokens = prompt_tokens, completion_tokens
+    final = ChatResponse(
+        content="".join(parts),
+        prompt_tokens=prompt_tokens,
+        completion_tokens=completion_tokens,
+        total_tokens=getattr(usage, "total_tokens", None) or (prompt_tokens + completion_tokens),
+        **ctx,
     )
+    if use_cache and final.content:
+        chat_cache.put(req, final)
+    yield {"event": "done", **final.model_dump(), "usage_reported": usage is not None}
@@ -0,0 +1,284 @@
+# services/batch_pipeline.py
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import shutil
+import tempfile
+import time
+import uuid
+import zipfile
+from collections import OrderedDict
+from typing import Any, BinaryIO, Callable, Dict, List, Optional, Tuple
+
+from services.classifier import Classification, classify_text
+from services.catalog import record_document, record_duplicate
+from services.dedup import (
+    DEDUP_ENABLED,
+    check_duplicate,
+    content_metadata,
+    duplicate_response,
+    register as register_blob,
+)
+from services.ocr import extract_text_any
+from services.storage_aio import upload_async
+
+logger = logging.getLogger(__name__)
+
+# حدود التوازي لكل مرحلة: spool → OCR → classify → route
+# (OCR الأثقل والأكثر عرضة لحدود Gemini؛ الرفع يتوسع بعدد اتصالات مجمع Blob)
+SPOOL_CONCURRENCY    = int(os.getenv("BATCH_SPOOL_CONCURRENCY", "4"))
+OCR_CONCURRENCY      = int(os.getenv("BATCH_OCR_CONCURRENCY", "4"))
+CLASSIFY_CONCURRENCY = int(os.getenv("BATCH_CLASSIFY_CONCURRENCY", "8"))
+ROUTE_CONCURRENCY    = int(os.getenv("BATCH_ROUTE_CONCURRENCY", "8"))
+
+BATCH_MAX_FILES     = int(os.getenv("BATCH_MAX_FILES", "500"))
+BATCH_MAX_FILE_MB   = float(os.getenv("BATCH_MAX_FILE_MB", "100"))
+BATCH_KEEP          = int(os.getenv("BATCH_KEEP", "50"))       # عدد الدفعات المحفوظة في الذاكرة للاستعلام
+_SPOOL_MEMORY_BYTES = 1024 * 1024                               # ما فوقه يُكتب على القرص
+
+STAGES = ("queued", "ocr", "classifying", "routing")
+FINAL_STATES = ("done", "failed", "skipped")
+
+_ocr_slots      = asyncio.Semaphore(OCR_CONCURRENCY)
+_classify_slots = asyncio.Semaphore(CLASSIFY_CONCURRENCY)
+_route_slots    = asyncio.Semaphore(ROUTE_CONCURRENCY)
+
+_batches: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+_tasks: Dict[str, asyncio.Task] = {}
+
+Destination = Callable[[Classification, str], Tuple[str, str]]
+
+
+# =========[ 1) spool: نسخ الملفات إلى ملفات مؤقتة خاصة بالدفعة ]=========
+# UploadFile يُغلق بانتهاء الطلب، فنسخ كل ملف إلى SpooledTemporaryFile قبل الرد.
+def _new_spool() -> BinaryIO:
+    return tempfile.SpooledTemporaryFile(max_size=_SPOOL_MEMORY_BYTES)
+
+
+def _spool_copy(src: BinaryIO) -> BinaryIO:
+    src.seek(0)
+    dst = _new_spool()
+    shutil.copyfileobj(src, dst)
+    dst.seek(0)
+    return dst
+
+
+def _basename(name: str) -> str:
+    return name.replace("\\", "/").rstrip("/").split("/")[-1]
+
+
+def _zip_members(zf: zipfile.ZipFile) -> List[zipfile.ZipInfo]:
+    """أعضاء الأرشيف التي تُعالج: بلا مجلدات أو ملفات نظام (من الفهرس المركزي، دون فك ضغط)."""
+    out = []
+    for info in zf.infolist():
+        name = _basename(info.filename)
+        if info.is_dir() or not name or name.startswith(".") or "__MACOSX/" in info.filename:
+            continue
+        out.append(info)
+    return out
+
+
+def _expand_zip(src: BinaryIO) -> List[Tuple[str, Optional[BinaryIO], Optional[str]]]:
+    """يفك أرشيف zip إلى (اسم، ملف مؤقت، خطأ) لكل عضو؛ يتجاهل المجلدات وملفات النظام."""
+    src.seek(0)
+    out: List[Tuple[str, Optional[BinaryIO], Optional[str]]] = []
+    limit = BATCH_MAX_FILE_MB * 1024 * 1024
+    with zipfile.ZipFile(src) as zf:
+        for info in _zip_members(zf):
+            name = _basename(info.filename)
+            if info.file_size > limit:
+                out.append((name, None, f"File exceeds {BATCH_MAX_FILE_MB:.0f} MB"))
+                continue
+            dst = _new_spool()
+            with zf.open(info) as member:
+                shutil.copyfileobj(member, dst)
+            dst.seek(0)
+            out.append((name, dst, None))
+    return out
+
+
+def _count_members(name: str, f: BinaryIO) -> int:
+    if not name.lower().endswith(".zip"):
+        return 1
+    f.seek(0)
+    try:
+        with zipfile.ZipFile(f) as zf:
+            return len(_zip_members(zf))
+    except zipfile.BadZipFile:
+        return 1  # يظهر في الدفعة كملف متخطى "Invalid zip archive"
+    finally:
+        f.seek(0)
+
+
+async def count_uploads(uploads: List[Tuple[str, BinaryIO]]) -> int:
+    """عدد الملفات التي ستنتج عن الرفع (أعضاء zip من الفهرس المركزي) قبل أي نسخ أو فك ضغط."""
+    return sum(await asyncio.gather(*(asyncio.to_thread(_count_members, n, f) for n, f in uploads)))
+
+
+async def spool_uploads(uploads: List[Tuple[str, BinaryIO]]) -> List[Tuple[str, Optional[BinaryIO], Optional[str]]]:
+    """
+    مرحلة spool: ينسخ الملفات المرفوعة (ويفك ملفات zip) بتوازٍ محدود في threads.
+    يعيد قائمة (اسم الملف، ملف مؤقت أو None، خطأ أو None) بنفس الترتيب.
+    """
+    slots = asyncio.Semaphore(SPOOL_CONCURRENCY)
+
+    async def one(name: str, f: BinaryIO) -> List[Tuple[str, Optional[BinaryIO], Optional[str]]]:
+        async with slots:
+            if name.lower().endswith(".zip"):
+                try:
+                    return await asyncio.to_thread(_expand_zip, f)
+                except zipfile.BadZipFile:
+                    return [(_basename(name), None, "Invalid zip archive")]
+            return [(_basename(name), await asyncio.to_thread(_spool_copy, f), None)]
+
+    groups = await asyncio.gather(*(one(n, f) for n, f in uploads))
+    return [item for g in groups for item in g]
+
+
+# =========[ 2) حالة الدفعة ]=========
+def _unique_in_batch(name: str, used: set) -> str:
+    """
+    أعضاء zip تُسطَّح إلى اسمها الأخير (a/scan001.pdf و b/scan001.pdf → scan001.pdf)،
+    فالاسم المكرر داخل الدفعة يأخذ لاحقة رقمية حتى لا يكتب ملف فوق آخر في الوجهة.
+    """
+    stem, ext = os.path.splitext(name)
+    candidate, n = name, 1
+    while candidate.lower() in used:
+        n += 1
+        candidate = f"{stem} ({n}){ext}"
+    used.add(candidate.lower())
+    return candidate
+
+
+def create_batch(spooled: List[Tuple[str, Optional[BinaryIO], Optional[str]]]) -> Dict[str, Any]:
+    batch_id = uuid.uuid4().hex
+    files = []
+    used: set = set()
+    for i, (name, _, err) in enumerate(spooled):
+        unique = _unique_in_batch(name, used)
+        entry: Dict[str, Any] = {"index": i, "filename": unique, "status": "skipped" if err else "queued"}
+        if unique != name:
+            entry["original_filename"] = name
+        if err:
+            entry["error"] = err
+        files.append(entry)
+    batch = {"batch_id": batch_id, "created_at": time.time(), "finished_at": None, "files": files}
+    _batches[batch_id] = batch
+    # نُسقط أقدم الدفعات المنتهية فقط؛ الجارية تبقى حتى تكتمل
+    for old_id in [b for b, v in _batches.items() if v["finished_at"] is not None][: max(0, len(_batches) - BATCH_KEEP)]:
+        del _batches[old_id]
+    return batch
+
+
+def get_batch(batch_id: str) -> Optional[Dict[str, Any]]:
+    return _batches.get(batch_id)
+
+
+def batch_progress(batch: Dict[str, Any]) -> Dict[str, Any]:
+    """ملخص التقدم: عدد الملفات في كل حالة ونسبة الإنجاز والزمن المنقضي."""
+    counts = {s: 0 for s in STAGES + FINAL_STATES}
+    for f in batch["files"]:
+        counts[f["status"]] = counts.get(f["status"], 0) + 1
+    total = len(batch["files"])
+    finished = sum(counts[s] for s in FINAL_STATES)
+    end = batch["finished_at"] or time.time()
+    return {
+        "batch_id": batch["batch_id"],
+        "total": total,
+        "finished": finished,
+        "percent": round(100.0 * finished / total, 1) if total else 100.0,
+        "counts": counts,
+        "complete": batch["finished_at"] is not None,
+        "elapsed_sec": round(end - batch["created_at"], 2),
+    }
+
+
+# =========[ 3) المراحل: OCR → classify → route ]=========
+# كل ملف يمر بالمراحل بالتسلسل، لكن لكل مرحلة حدها الخاص، فتعمل المراحل على ملفات مختلفة في الوقت نفسه.
+async def _process_file(entry: Dict[str, Any], f: BinaryIO, destination: Destination) -> None:
+    name = entry["filename"]
+    timings: Dict[str, float] = {}
+    try:
+        sha256, size = None, None
+        if DEDUP_ENABLED:
+            # محتوى موجّه سابقًا → القرار السابق دون OCR أو تصنيف أو نقل
+            sha256, size, prior = await check_duplicate(f, name, "classify-batch")
+            if prior is not None:
+                try:
+                    await asyncio.to_thread(
+                        record_duplicate, prior["container"], prior["blob_name"], name,
+                        prior["decision"], sha256, size, "classify-batch",
+                    )
+                except Exception as e:
+                    logger.warning(f"Catalog update failed for duplicate '{name}': {e}")
+                entry.update({"status": "done", **duplicate_response(prior)})
+                return
+
+        async with _ocr_slots:
+            entry["status"] = "ocr"
+            t0 = time.perf_counter()
+            text = await asyncio.to_thread(extract_text_any, name, f)
+            timings["ocr"] = round(time.perf_counter() - t0, 3)
+
+        async with _classify_slots:
+            entry["status"] = "classifying"
+            t0 = time.perf_counter()
+            result = await asyncio.to_thread(classify_text, text, name)
+            timings["classify"] = round(time.perf_counter() - t0, 3)
+
+        container, blob_name = destination(result, name)
+        async with _route_slots:
+            entry["status"] = "routing"
+            t0 = time.perf_counter()
+            f.seek(0)
+            await upload_async(container, blob_name, _read_chunks(f), metadata=content_metadata(sha256))
+            timings["route"] = round(time.perf_counter() - t0, 3)
+
+        if sha256:
+            await asyncio.to_thread(register_blob, sha256, size, container, blob_name, name, result)
+        try:
+            await asyncio.to_thread(record_document, container, blob_name, name, result, text, sha256, size, "classify-batch")
+        except Exception as e:
+            # الفهرس مساعد؛ الملف وصل وجهته
+            logger.warning(f"Catalog update failed for {container}/{blob_name}: {e}")
+        entry.update({"status": "done", "moved_to": f"{container}/{blob_name}", "ai_decision": result, "sha256": sha256})
+    except Exception as e:
+        logger.error(f"Batch file '{name}' failed at stage '{entry['status']}': {e}")
+        entry.update({"status": "failed", "failed_stage": entry["status"], "error": str(e)})
+    finally:
+        entry["timings"] = timings
+        f.close()
+
+
+async def _read_chunks(f: BinaryIO, size: int = 4 * 1024 * 1024):
+    while True:
+        chunk = await asyncio.to_thread(f.read, size)
+        if not chunk:
+            return
+        yield chunk
+
+
+async def _run_batch(batch: Dict[str, Any], spooled: List[Tuple[str, Optional[BinaryIO], Optional[str]]], destination: Destination) -> None:
+    try:
+        await asyncio.gather(*(
+            _process_file(entry, f, destination)
+            for entry, (_, f, _) in zip(batch["files"], spooled)
+            if f is not None
+        ))
+    finally:
+        batch["finished_at"] = time.time()
+        _tasks.pop(batch["batch_id"], None)
+        p = batch_progress(batch)
+        logger.info(f"Batch [{batch['batch_id']}] finished: {p['counts']} in {p['elapsed_sec']}s")
+
+
+def start_batch(
+    spooled: List[Tuple[str, Optional[BinaryIO], Optional[str]]],
+    destination: Destination,
+) -> Dict[str, Any]:
+    """ينشئ الدفعة ويشغل خط المعالجة في الخلفية على حلقة الأحداث الحالية."""
+    batch = create_batch(spooled)
+    _tasks[batch["batch_id"]] = asyncio.create_task(_run_batch(batch, spooled, destination))
+    return batch
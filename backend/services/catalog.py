@@ -0,0 +1,279 @@
+# services/catalog.py
+from __future__ import annotations
+
+import os
+import threading
+import time
+from collections import deque
+from itertools import islice
+from typing import Any, Dict, List, Optional
+
+from services.dedup import connect
+from services.text_norm import token_spans, tokenize
+
+# فهرس محلي لكل مستند موجَّه (نفس قاعدة documents.sqlite): المسار، البصمة، الحجم، التصنيف، الأوقات،
+# مع FTS5 على نص الـ OCR. التصفح والبحث من هنا بالمللي ثانية دون سرد الكونتينرات.
+CATALOG_MAX_TEXT = int(os.getenv("CATALOG_MAX_TEXT", "200000"))
+CATALOG_PAGE_MAX = 200
+SNIPPET_WORDS    = 12
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    id          INTEGER PRIMARY KEY AUTOINCREMENT,
+    blob_path   TEXT NOT NULL UNIQUE,
+    container   TEXT NOT NULL,
+    blob_name   TEXT NOT NULL,
+    filename    TEXT,
+    sha256      TEXT,
+    size        INTEGER,
+    bucket      TEXT,
+    subfolder   TEXT,
+    confidence  REAL,
+    reasoning   TEXT,
+    source      TEXT,
+    routed_at   REAL NOT NULL,
+    updated_at  REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_documents_bucket ON documents(bucket, subfolder, routed_at);
+CREATE INDEX IF NOT EXISTS ix_documents_routed ON documents(routed_at);
+CREATE INDEX IF NOT EXISTS ix_documents_sha ON documents(sha256);
+CREATE VIRTUAL TABLE IF NOT EXISTS documents_fts USING fts5(filename, body, tokenize='unicode61', prefix='2 3 4');
+-- documents_fts يحمل الرموز الموحَّدة للمطابقة؛ النص الأصلي هنا لبناء المقتطف المعروض
+CREATE TABLE IF NOT EXISTS documents_text (
+    doc_id      INTEGER PRIMARY KEY REFERENCES documents(id) ON DELETE CASCADE,
+    body        TEXT NOT NULL
+);
+"""
+
+_schema_lock = threading.Lock()
+_schema_ready = False
+
+_COLUMNS = (
+    "id, blob_path, container, blob_name, filename, sha256, size, bucket, subfolder, "
+    "confidence, reasoning, source, routed_at, updated_at"
+)
+
+
+def _ensure_schema(conn) -> None:
+    global _schema_ready
+    if _schema_ready:
+        return
+    with _schema_lock:
+        if not _schema_ready:
+            conn.executescript(_SCHEMA)
+            _schema_ready = True
+
+
+def _index_text(text: str) -> str:
+    # يُفهرس النص بعد نفس التوحيد والتقطيع المستخدمين في الاستعلام (بلا حذف كلمات الوقف)
+    return " ".join(tokenize((text or "")[:CATALOG_MAX_TEXT], drop_stopwords=False))
+
+
+def _fts_query(q: str) -> Optional[str]:
+    toks = tokenize(q)
+    if not toks:
+        return None
+    # كل كلمة مطلوبة، مع مطابقة البادئة (للواحق العربية)
+    return " ".join(f'"{t}"*' for t in toks)
+
+
+def _snippet(text: str, terms: List[str], words: int = SNIPPET_WORDS) -> Optional[str]:
+    """
+    مقتطف من النص الأصلي حول أول كلمة تطابق الاستعلام، والكلمات المطابقة بين [ ].
+    المطابقة على الرموز الموحَّدة بالبادئة كما في استعلام FTS؛ إن طابق اسم الملف وحده نعيد أول النص.
+    """
+    def hit(tok: str) -> bool:
+        return any(tok.startswith(t) for t in terms)
+
+    before: deque = deque(maxlen=words // 2)
+    window: Optional[List[tuple]] = None
+    skipped = 0
+    more = False
+    for span in token_spans(text):
+        if window is None:
+            if hit(span[2]):
+                window = [*before, span]
+                continue
+            skipped += len(before) == before.maxlen
+            before.append(span)
+        elif len(window) < words:
+            window.append(span)
+        else:
+            more = True
+            break
+    if window is None:
+        head = list(islice(token_spans(text), words + 1))
+        window, skipped, more = head[:words], 0, len(head) > words
+    if not window:
+        return None
+
+    out = ["… " if skipped else ""]
+    pos = window[0][0]
+    for start, end, tok in window:
+        out.append(text[pos:start])
+        out.append(f"[{text[start:end]}]" if hit(tok) else text[start:end])
+        pos = end
+    if more:
+        out.append(" …")
+    return "".join(out)
+
+
+def record_document(
+    container: str,
+    blob_name: str,
+    filename: str,
+    decision: Dict[str, Any],
+    text: str = "",
+    sha256: Optional[str] = None,
+    size: Optional[int] = None,
+    source: str = "classify-upload",
+) -> int:
+    """يضيف المستند الموجَّه إلى الفهرس أو يحدّثه إن أُعيد توجيه نفس المسار؛ يعيد معرّفه."""
+    now = time.time()
+    blob_path = f"{container}/{blob_name}"
+    with connect() as conn:
+        _ensure_schema(conn)
+        conn.execute(
+            """
+            INSERT INTO documents (blob_path, container, blob_name, filename, sha256, size, bucket, subfolder,
+                                   confidence, reasoning, source, routed_at, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(blob_path) DO UPDATE SET
+                filename=excluded.filename, sha256=excluded.sha256, size=excluded.size,
+                bucket=excluded.bucket, subfolder=excluded.subfolder, confidence=excluded.confidence,
+                reasoning=excluded.reasoning, source=excluded.source, updated_at=excluded.updated_at
+            """,
+            (blob_path, container, blob_name, filename, sha256, size,
+             decision.get("bucket"), decision.get("subfolder"), decision.get("confidence"),
+             decision.get("reasoning"), source, now, now),
+        )
+        doc_id = conn.execute("SELECT id FROM documents WHERE blob_path = ?", (blob_path,)).fetchone()[0]
+        conn.execute("DELETE FROM documents_fts WHERE rowid = ?", (doc_id,))
+        conn.execute(
+            "INSERT INTO documents_fts (rowid, filename, body) VALUES (?, ?, ?)",
+            (doc_id, _index_text(filename), _index_text(text)),
+        )
+        conn.execute(
+            "INSERT OR REPLACE INTO documents_text (doc_id, body) VALUES (?, ?)",
+            (doc_id, (text or "")[:CATALOG_MAX_TEXT]),
+        )
+    return doc_id
+
+
+def record_duplicate(
+    container: str,
+    blob_name: str,
+    filename: str,
+    decision: Optional[Dict[str, Any]],
+    sha256: str,
+    size: Optional[int],
+    source: str,
+) -> int:
+    """
+    رفع مكرر يشير إلى blob موجَّه سابقًا: يُضاف اسم ملفه إلى فهرس البحث لمستند الأصل
+    (فيُعثر عليه بأي من الاسمين) ويُحدَّث updated_at. إن لم يكن الأصل في الفهرس (وُجّه قبل إنشائه
+    أو فشل تسجيله) يُسجَّل بقرار التصنيف السابق دون نص، إذ لا OCR للمكرر.
+    """
+    blob_path = f"{container}/{blob_name}"
+    with connect() as conn:
+        _ensure_schema(conn)
+        row = conn.execute("SELECT id FROM documents WHERE blob_path = ?", (blob_path,)).fetchone()
+        if row is not None:
+            doc_id = row[0]
+            conn.execute("UPDATE documents SET updated_at = ? WHERE id = ?", (time.time(), doc_id))
+            fts = conn.execute("SELECT filename, body FROM documents_fts WHERE rowid = ?", (doc_id,)).fetchone()
+            names, body = (fts[0], fts[1]) if fts else ("", "")
+            alias = _index_text(filename)
+            if alias and not set(alias.split()) <= set(names.split()):
+                conn.execute("DELETE FROM documents_fts WHERE rowid = ?", (doc_id,))
+                conn.execute(
+                    "INSERT INTO documents_fts (rowid, filename, body) VALUES (?, ?, ?)",
+                    (doc_id, f"{names} {alias}".strip(), body),
+                )
+            return doc_id
+    return record_document(container, blob_name, filename, decision or {}, "", sha256, size, source)
+
+
+def query_documents(
+    q: Optional[str] = None,
+    bucket: Optional[str] = None,
+    subfolder: Optional[str] = None,
+    min_confidence: Optional[float] = None,
+    since: Optional[float] = None,
+    until: Optional[float] = None,
+    limit: int = 50,
+    offset: int = 0,
+) -> Dict[str, Any]:
+    """
+    بحث/تصفح مرقّم. مع q: ترتيب حسب صلة FTS5 (bm25) ومقتطف مطابق؛ بدونه: الأحدث أولًا.
+    يعيد {"total", "limit", "offset", "items"}.
+    """
+    limit = max(1, min(int(limit), CATALOG_PAGE_MAX))
+    offset = max(0, int(offset))
+    where: List[str] = []
+    args: List[Any] = []
+    for col, val in (("d.bucket", bucket), ("d.subfolder", subfolder)):
+        if val:
+            where.append(f"{col} = ?")
+            args.append(val)
+    if min_confidence is not None:
+        where.append("d.confidence >= ?")
+        args.append(min_confidence)
+    if since is not None:
+        where.append("d.routed_at >= ?")
+        args.append(since)
+    if until is not None:
+        where.append("d.routed_at < ?")
+        args.append(until)
+
+    match = _fts_query(q) if q else None
+    if q and match is None:
+        return {"total": 0, "limit": limit, "offset": offset, "items": []}
+
+    cols = ", ".join(f"d.{c.strip()}" for c in _COLUMNS.split(","))
+    if match:
+        frm = "documents_fts f JOIN documents d ON d.id = f.rowid"
+        where.insert(0, "documents_fts MATCH ?")
+        args.insert(0, match)
+        order = "bm25(documents_fts)"
+    else:
+        frm = "documents d"
+        order = "d.routed_at DESC"
+    clause = f"WHERE {' AND '.join(where)}" if where else ""
+
+    with connect() as conn:
+        _ensure_schema(conn)
+        total = conn.execute(f"SELECT COUNT(*) FROM {frm} {clause}", args).fetchone()[0]
+        rows = conn.execute(
+            f"SELECT {cols} FROM {frm} {clause} ORDER BY {order} LIMIT ? OFFSET ?",
+            args + [limit, offset],
+        ).fetchall()
+        items = [dict(r) for r in rows]
+        if match and items:
+            # المقتطف من النص الأصلي (documents_fts يحمل الرموز الموحَّدة فقط) لصفوف الصفحة وحدها
+            ids = [it["id"] for it in items]
+            texts = dict(conn.execute(
+                f"SELECT doc_id, body FROM documents_text WHERE doc_id IN ({','.join('?' * len(ids))})", ids
+            ).fetchall())
+            terms = tokenize(q)
+            for it in items:
+                it["snippet"] = _snippet(texts.get(it["id"], ""), terms)
+    return {"total": total, "limit": limit, "offset": offset, "items": items}
+
+
+def get_document(doc_id: int) -> Optional[Dict[str, Any]]:
+    with connect() as conn:
+        _ensure_schema(conn)
+        row = conn.execute(f"SELECT {_COLUMNS} FROM documents WHERE id = ?", (doc_id,)).fetchone()
+    return dict(row) if row else None
+
+
+def facets() -> List[Dict[str, Any]]:
+    """عدد المستندات لكل (bucket, subfolder) — لشجرة التصفح في الواجهة."""
+    with connect() as conn:
+        _ensure_schema(conn)
+        rows = conn.execute(
+            "SELECT bucket, subfolder, COUNT(*) AS count, MAX(routed_at) AS last_routed_at "
+            "FROM documents GROUP BY bucket, subfolder ORDER BY bucket, subfolder"
+        ).fetchall()
+    return [dict(r) for r in rows]
@@ -3,7 +3,10 @@ from __future__ import annotations
 import os, json, re
 from typing import Optional, TypedDict
 from openai import AzureOpenAI
-from services.ocr import extract_text_any
+from services.ocr import Source, extract_text_any
+from services import local_classifier
+from services.keyword_matcher import KeywordScorer, bucket_decision
+from services import metrics
 
 _client = AzureOpenAI(
     api_key=os.getenv("AZURE_OPENAI_KEY"),
@@ -21,13 +24,62 @@ MAIN_BUCKETS = {
     "reports": {"sub": ["expert_report","audit","summary_report","financial","investigation","compliance"]},
 }
 
-# كلمات مفتاحية بسيطة لتوجيه سريع عند فشل OCR
+# كلمات مفتاحية لكل (bucket, subfolder) مع أوزان؛ تُطابق كلها في مرور واحد (Aho–Corasick)
+# على النص الموحّد. subfolder=None = إشارة عامة للكونتينر دون مجلد فرعي محدد.
 FAMILY_HINTS = ["طلاق","خلع","حضانة","نفقة","زيارة","ولاية","محضون","مطلق","مطلقة"]
 LABOR_HINTS  = ["عمل","عمال","رواتب","مكافأة","انذار","انهاء خدمة"]
 CRIM_HINTS   = ["جنائي","جناية","جنحة","حيازة","تعاطي","سرقة","قتل"]
 REAL_HINTS   = ["عقار","عقاري","إيجار","ملكية","تمليك","بيع","شراء","رهن","أرض"]
 ENF_HINTS    = ["تنفيذ","ايقاف خدمات","حجز","سداد","شيك","كمبيالة"]
 
+KEYWORDS: dict[tuple[str, Optional[str]], list[tuple[str, float]]] = {
+    ("cases", None): [("المدعي",1.0),("المدعى عليه",1.5),("صحيفة دعوى",2.0),("صك الحكم",1.5),("الدائرة",0.5),("الجلسة",0.5)],
+    ("cases","family"): [(w,1.5) for w in FAMILY_HINTS] + [("الأحوال الشخصية",2.0),("عقد النكاح",1.5),("النفقة الزوجية",2.0)],
+    ("cases","labor"): [("عمل",0.5)] + [(w,1.0) for w in LABOR_HINTS[1:]] + [("المحكمة العمالية",2.0),("نظام العمل",1.5),("نهاية الخدمة",1.5),("صاحب العمل",1.0)],
+    ("cases","criminal"): [(w,1.5) for w in CRIM_HINTS] + [("النيابة العامة",1.5),("المتهم",1.5),("الحق العام",1.5)],
+    ("cases","real_estate"): [(w,0.5) for w in REAL_HINTS] + [("صك ملكية",2.0),("الإفراغ",1.5)],
+    ("cases","enforcement"): [(w,1.0) for w in ENF_HINTS] + [("محكمة التنفيذ",2.0),("سند تنفيذي",2.0),("طلب تنفيذ",2.0)],
+    ("cases","inheritance"): [("تركة",1.5),("الورثة",1.5),("حصر ورثة",2.0),("إرث",1.5),("قسمة التركة",2.0)],
+    ("cases","commercial"): [("المحكمة التجارية",2.0),("سجل تجاري",1.0),("إفلاس",1.5),("الأوراق التجارية",1.5)],
+    ("cases","administrative"): [("ديوان المظالم",2.0),("المحكمة الإدارية",2.0),("قرار إداري",1.5)],
+    ("cases","civil"): [("دعوى مدنية",2.0),("تعويض",1.0),("المسؤولية التقصيرية",2.0)],
+    ("cases","medical_malpractice"): [("خطأ طبي",2.0),("الهيئة الصحية الشرعية",2.0),("الممارس الصحي",1.5)],
+    ("contracts", None): [("عقد",0.5),("الطرف الأول",1.5),("الطرف الثاني",1.5),("يلتزم الطرف",1.5),("مدة العقد",1.5)],
+    ("contracts","employment"): [("عقد عمل",2.0),("الراتب الأساسي",1.5),("فترة التجربة",1.5)],
+    ("contracts","sales"): [("عقد بيع",2.0),("البائع",1.0),("المشتري",1.0),("الثمن",0.5)],
+    ("contracts","lease"): [("عقد إيجار",2.0),("المؤجر",1.5),("المستأجر",1.5),("العين المؤجرة",2.0)],
+    ("contracts","nda"): [("عدم الإفصاح",2.0),("سرية المعلومات",2.0),("المعلومات السرية",1.5)],
+    ("contracts","service"): [("عقد خدمات",2.0),("تقديم الخدمات",1.5),("مقدم الخدمة",1.5)],
+    ("contracts","partnership"): [("عقد شراكة",2.0),("عقد تأسيس",2.0),("الشركاء",1.0)],
+    ("contracts","government"): [("منافسة عامة",2.0),("الجهة الحكومية",1.0),("نظام المنافسات",2.0)],
+    ("consultations", None): [("استشارة",1.5),("استفسار",1.0)],
+    ("consultations","legal_opinion"): [("رأي قانوني",2.0),("الرأي القانوني",2.0)],
+    ("consultations","advice"): [("نوصي",1.0),("ننصح",1.0)],
+    ("correspondence", None): [("تحية طيبة",1.5),("وبعد",0.5),("المكرم",1.5),("خطاب",1.0)],
+    ("correspondence","court"): [("فضيلة رئيس",2.0),("فضيلة القاضي",2.0)],
+    ("correspondence","government"): [("معالي",1.5),("سعادة",1.0)],
+    ("correspondence","client"): [("عزيزي العميل",2.0)],
+    ("memos", None): [("مذكرة",1.5)],
+    ("memos","court_memo"): [("مذكرة دفاع",2.0),("مذكرة رد",2.0),("لائحة اعتراضية",2.0)],
+    ("memos","legal_memo"): [("مذكرة قانونية",2.0)],
+    ("memos","internal"): [("مذكرة داخلية",2.0)],
+    ("memos","case_summary"): [("ملخص القضية",2.0),("ملخص الدعوى",2.0)],
+    ("memos","research_note"): [("بحث قانوني",2.0)],
+    ("reports", None): [("تقرير",1.5)],
+    ("reports","expert_report"): [("تقرير خبير",2.0),("الخبير",1.0)],
+    ("reports","audit"): [("تدقيق",1.5),("مراجعة الحسابات",2.0)],
+    ("reports","financial"): [("القوائم المالية",2.0),("الميزانية",1.0)],
+    ("reports","investigation"): [("محضر تحقيق",2.0),("تحقيق",1.0)],
+    ("reports","compliance"): [("الامتثال",2.0)],
+    ("reports","summary_report"): [("ملخص",1.0)],
+}
+_keyword_scorer = KeywordScorer(KEYWORDS)
+
+# تخطي النموذج اللغوي عندما يفوز كونتينر بوضوح بالكلمات المفتاحية وحدها
+KEYWORD_SKIP_LLM       = os.getenv("KEYWORD_SKIP_LLM", "1").lower() in {"1", "true", "yes", "on"}
+KEYWORD_SKIP_MIN_SHARE = float(os.getenv("KEYWORD_SKIP_MIN_SHARE", "0.8"))
+KEYWORD_SKIP_MIN_SCORE = float(os.getenv("KEYWORD_SKIP_MIN_SCORE", "8"))
+
 class Classification(TypedDict):
     bucket: str
     subfolder: Optional[str]
@@ -43,27 +95,30 @@ SYSTEM_PROMPT = f"""
 التزم بـ JSON صالح فقط.
 """
 
+def keyword_distribution(filename: str, text: str) -> list[dict]:
+    """توزيع مرتب لكل (bucket, subfolder) من الكلمات المفتاحية على كامل النص واسم الملف."""
+    return _keyword_scorer.score(filename, text)
+
+def _keyword_reason(decision: dict) -> str:
+    return "توجيه بالكلمات المفتاحية: " + "، ".join(decision["keywords"][:5]) + "."
+
 def _heuristic_bucket(filename: str, text: str) -> tuple[str, Optional[str], float, str]:
-    """تخمين سريع عند نقص النص."""
-    hint_src = filename + " " + text[:500]
-    def has_any(words): 
-        return any(w in hint_src for w in words)
-
-    if has_any(FAMILY_HINTS):
-        return ("cases","family",0.65,"توجيه بالاعتماد على كلمات أحوال شخصية (مثال: طلاق/نفقة/حضانة).")
-    if has_any(ENF_HINTS):
-        return ("cases","enforcement",0.6,"توجيه بالاعتماد على كلمات تنفيذ/إيقاف خدمات.")
-    if has_any(LABOR_HINTS):
-        return ("cases","labor",0.6,"توجيه بالاعتماد على كلمات عمالية.")
-    if has_any(REAL_HINTS):
-        return ("cases","real_estate",0.55,"توجيه بالاعتماد على مفردات عقارية/إيجار.")
-    if has_any(CRIM_HINTS):
-        return ("cases","criminal",0.55,"توجيه بالاعتماد على ألفاظ جنائية.")
-    return ("reports","summary_report",0.3,"فشل OCR/نص قليل؛ توجيه افتراضي لتقارير.")
-
-def classify_bytes(file_bytes: bytes, filename: str) -> Classification:
-    # 1) OCR للنص
-    text = extract_text_any(filename, file_bytes)
+    """
+    تخمين سريع عند نقص النص: أفضل كونتينر من توزيع الكلمات المفتاحية. المجلد الفرعي فقط عند تطابق
+    كلمة خاصة به؛ الإشارات العامة وحدها (subfolder=None) تُحفظ في جذر الكونتينر.
+    """
+    decision = bucket_decision(keyword_distribution(filename, text))
+    if decision is None:
+        return ("reports","summary_report",0.3,"فشل OCR/نص قليل؛ توجيه افتراضي لتقارير.")
+    conf = round(min(0.7, 0.4 + 0.3 * decision["share"]), 2)
+    return (decision["bucket"], decision["subfolder"], conf, _keyword_reason(decision))
+
+def classify_bytes(file_bytes: Source, filename: str) -> Classification:
+    # 1) OCR للنص ثم 2) التصنيف
+    return classify_text(extract_text_any(filename, file_bytes), filename)
+
+def classify_text(text: str, filename: str) -> Classification:
+    """التصنيف فقط لنص مستخرج مسبقًا (يسمح بفصل مرحلة OCR عن مرحلة التصنيف في خط المعالجة)."""
     text_short = (text or "").strip()
 
     # 1.أ لو النص ضعيف جدًا → heuristics على اسم الملف/القليل الموجود
@@ -71,18 +126,35 @@ def classify_bytes(file_bytes: bytes, filename: str) -> Classification:
         bucket, sub, conf, why = _heuristic_bucket(filename, text_short)
         return {"bucket":bucket,"subfolder":sub,"confidence":conf,"reasoning":why}
 
+    # 1.ب الكلمات المفتاحية (مرور واحد على كامل النص): فوز واضح لكونتينر → لا حاجة للنموذج اللغوي
+    if KEYWORD_SKIP_LLM:
+        decision = bucket_decision(keyword_distribution(filename, text_short))
+        if decision and decision["subfolder"] and decision["share"] >= KEYWORD_SKIP_MIN_SHARE \
+                and decision["score"] >= KEYWORD_SKIP_MIN_SCORE:
+            conf = round(min(0.9, 0.5 + 0.4 * decision["share"]), 2)
+            return {"bucket":decision["bucket"],"subfolder":decision["subfolder"],"confidence":conf,
+                    "reasoning":_keyword_reason(decision)}
+
+    # 1.ج المصنف المحلي (مدرَّب من قرارات سابقة): يجيب مباشرةً عند الثقة العالية، وإلا نصعّد للنموذج اللغوي
+    local = local_classifier.predict(text_short, filename)
+    if local and local[0] in MAIN_BUCKETS and local[2] >= local_classifier.LOCAL_CLASSIFIER_THRESHOLD:
+        bucket, sub, conf = local
+        return {"bucket":bucket,"subfolder":sub,"confidence":round(conf,3),"reasoning":"تصنيف محلي (نموذج مدرَّب من قرارات سابقة)."}
+
     # 2) تصنيف عبر Azure OpenAI مع تمرير اسم الملف كإشارة
     user_prompt = f"صنّف المستند التالي (اسم الملف: {filename}):\n---\n{text_short[:18000]}\n---"
-    resp = _client.chat.completions.create(
-        model=DEPLOYMENT,
-        temperature=0.1,
-        response_format={"type":"json_object"},
-        messages=[
-            {"role":"system","content":SYSTEM_PROMPT},
-            {"role":"user","content":user_prompt}
-        ],
-        max_tokens=500,
-    )
+    with metrics.llm_call("azure_openai", "classify", DEPLOYMENT) as call:
+        resp = _client.chat.completions.create(
+            model=DEPLOYMENT,
+            temperature=0.1,
+            response_format={"type":"json_object"},
+            messages=[
+                {"role":"system","content":SYSTEM_PROMPT},
+                {"role":"user","content":user_prompt}
+            ],
+            max_tokens=500,
+        )
+        call.usage(resp)
     data = json.loads(resp.choices[0].message.content)
 
     bucket = data.get("bucket","reports")
@@ -95,5 +167,8 @@ def classify_bytes(file_bytes: bytes, filename: str) -> Classification:
         bucket, sub, conf, why = _heuristic_bucket(filename, text_short)
     elif sub and sub not in MAIN_BUCKETS[bucket]["sub"]:
         sub = MAIN_BUCKETS[bucket]["sub"][0] if MAIN_BUCKETS[bucket]["sub"] else None
+    else:
+        # قرار صالح من النموذج اللغوي → مثال تدريب للمصنف المحلي
+        local_classifier.log_decision(text_short, filename, bucket, sub, conf)
 
     return {"bucket":bucket,"subfolder":sub,"confidence":conf,"reasoning":why}
@@ -6,7 +6,6 @@ import os
 import json
 import logging
 import re
-import time
 from pathlib import Path
 from typing import Any, List, Dict, Union
 from dotenv import load_dotenv
@@ -15,6 +14,8 @@ from google.generativeai import GenerativeModel
 from google.generativeai.types import HarmCategory, HarmBlockThreshold, File
 from google.api_core import exceptions
 
+from services import metrics, scheduler
+
 # --- 1. الإعدادات الأولية ---
 load_dotenv()
 logger = logging.getLogger(__name__)
@@ -101,19 +102,21 @@ def compare_single_article_with_api(
             
             request_options = {"timeout": 300}
 
-            resp = model.generate_content(
-                [article_prompt, primary_file_upload, comparison_file_upload],
-                generation_config=generation_config,
-                safety_settings=safety_settings,
-                request_options=request_options
-            )
+            with metrics.llm_call("gemini", "compare", metrics.model_name(model), attempt=attempt + 1) as call:
+                resp = model.generate_content(
+                    [article_prompt, primary_file_upload, comparison_file_upload],
+                    generation_config=generation_config,
+                    safety_settings=safety_settings,
+                    request_options=request_options
+                )
+                call.usage(resp)
             
             return _extract_json(resp.text)
 
         except (exceptions.ServiceUnavailable, exceptions.InternalServerError, exceptions.DeadlineExceeded) as e:
             logger.warning(f"API connection error on article '{article.get('article_number')}', attempt {attempt + 1}: {e}. Retrying...")
             if attempt < max_retries - 1:
-                time.sleep(5 * (attempt + 1))
+                scheduler.sleep(5 * (attempt + 1))  # ينقطع فورًا إن أُلغيت المهمة
             else:
                 logger.error(f"Max retries reached for article '{article.get('article_number')}'.")
                 return {"error": "Max retries reached", "details": str(e)}
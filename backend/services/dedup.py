@@ -0,0 +1,183 @@
+# services/dedup.py
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional, Tuple
+
+from services.storage_aio import blob_metadata_async
+
+# فهرس المحتوى: sha256 → الـ blob الأصلي (canonical) وقرار التصنيف، مع مراجع لكل رفع مكرر.
+# الرفع المكرر لا يُنقل ولا يمر بـ OCR ولا بالتصنيف؛ يعاد القرار السابق فورًا.
+_DATA_DIR = Path(__file__).resolve().parent.parent / "data"
+DOCUMENTS_DB  = Path(os.getenv("DOCUMENTS_DB", str(_DATA_DIR / "documents.sqlite")))
+DEDUP_ENABLED = os.getenv("DEDUP_ENABLED", "1").lower() in {"1", "true", "yes", "on"}
+# التحقق من أن الـ blob الأصلي ما زال موجودًا وبنفس المحتوى قبل اعتماد التكرار (طلب HEAD واحد)
+DEDUP_VERIFY  = os.getenv("DEDUP_VERIFY", "1").lower() in {"1", "true", "yes", "on"}
+
+_HASH_CHUNK = 1024 * 1024
+# مفتاح metadata يحمل sha256 المحتوى على كل blob يُرفع مع dedup. الوجهة <bucket>/<sub>/<filename>
+# ليست مشتقة من المحتوى ويُكتب فوقها (overwrite)، فالبصمة على الـ blob هي ما يثبت أن الأصل لم يتغير.
+CONTENT_HASH_KEY = "sha256"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS blobs (
+    sha256      TEXT PRIMARY KEY,
+    size        INTEGER NOT NULL,
+    container   TEXT NOT NULL,
+    blob_name   TEXT NOT NULL,
+    filename    TEXT,
+    decision    TEXT,
+    created_at  REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS blob_refs (
+    id          INTEGER PRIMARY KEY AUTOINCREMENT,
+    sha256      TEXT NOT NULL REFERENCES blobs(sha256) ON DELETE CASCADE,
+    filename    TEXT,
+    source      TEXT,
+    created_at  REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_blob_refs_sha ON blob_refs(sha256);
+"""
+
+_init_lock = threading.Lock()
+_initialized = False
+
+
+@contextmanager
+def connect() -> Iterator[sqlite3.Connection]:
+    """اتصال قصير لكل عملية (sqlite آمن بين الـ threads بهذه الطريقة)؛ WAL يسمح بالقراءة أثناء الكتابة."""
+    global _initialized
+    DOCUMENTS_DB.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(DOCUMENTS_DB, timeout=30)
+    conn.row_factory = sqlite3.Row
+    try:
+        if not _initialized:
+            with _init_lock:
+                if not _initialized:
+                    conn.execute("PRAGMA journal_mode=WAL")
+                    conn.executescript(_SCHEMA)
+                    _initialized = True
+        conn.execute("PRAGMA foreign_keys=ON")
+        yield conn
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def hash_file(f: BinaryIO) -> Tuple[str, int]:
+    """sha256 وحجم ملف قابل لـ seek (يُعاد المؤشر للبداية)."""
+    f.seek(0)
+    h = hashlib.sha256()
+    size = 0
+    while True:
+        chunk = f.read(_HASH_CHUNK)
+        if not chunk:
+            break
+        h.update(chunk)
+        size += len(chunk)
+    f.seek(0)
+    return h.hexdigest(), size
+
+
+def lookup(sha256: str) -> Optional[Dict[str, Any]]:
+    with connect() as conn:
+        row = conn.execute("SELECT * FROM blobs WHERE sha256 = ?", (sha256,)).fetchone()
+    if row is None:
+        return None
+    out = dict(row)
+    out["decision"] = json.loads(out["decision"]) if out["decision"] else None
+    return out
+
+
+def register(
+    sha256: str,
+    size: int,
+    container: str,
+    blob_name: str,
+    filename: str,
+    decision: Optional[Dict[str, Any]],
+) -> None:
+    """يسجّل الـ blob الأصلي لهذا المحتوى (أول رفع يفوز؛ لا يُستبدل)."""
+    with connect() as conn:
+        conn.execute(
+            "INSERT OR IGNORE INTO blobs (sha256, size, container, blob_name, filename, decision, created_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (sha256, size, container, blob_name, filename,
+             json.dumps(decision, ensure_ascii=False) if decision is not None else None, time.time()),
+        )
+
+
+def add_reference(sha256: str, filename: str, source: str) -> None:
+    """يسجّل رفعًا مكررًا كمرجع للمحتوى الأصلي بدل نسخة جديدة."""
+    with connect() as conn:
+        conn.execute(
+            "INSERT INTO blob_refs (sha256, filename, source, created_at) VALUES (?, ?, ?, ?)",
+            (sha256, filename, source, time.time()),
+        )
+
+
+def forget(sha256: str) -> None:
+    """يحذف المحتوى من الفهرس (مثلاً إن حُذف الـ blob الأصلي من خارج التطبيق)."""
+    with connect() as conn:
+        conn.execute("DELETE FROM blobs WHERE sha256 = ?", (sha256,))
+
+
+def references(sha256: str) -> List[Dict[str, Any]]:
+    with connect() as conn:
+        rows = conn.execute(
+            "SELECT filename, source, created_at FROM blob_refs WHERE sha256 = ? ORDER BY id", (sha256,)
+        ).fetchall()
+    return [dict(r) for r in rows]
+
+
+def stats() -> Dict[str, Any]:
+    with connect() as conn:
+        blobs, stored = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM blobs").fetchone()
+        refs, saved = conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(b.size), 0) FROM blob_refs r JOIN blobs b USING (sha256)"
+        ).fetchone()
+    return {"unique_blobs": blobs, "bytes_stored": stored, "duplicate_uploads": refs, "bytes_saved": saved}
+
+
+def content_metadata(sha256: Optional[str]) -> Optional[Dict[str, str]]:
+    """metadata تُرفع مع الـ blob ليتحقق check_duplicate لاحقًا من أن محتواه لم يُستبدل."""
+    return {CONTENT_HASH_KEY: sha256} if sha256 else None
+
+
+def duplicate_response(entry: Dict[str, Any]) -> Dict[str, Any]:
+    """الحقول المشتركة في الرد عند اكتشاف رفع مكرر."""
+    return {
+        "deduplicated": True,
+        "sha256": entry["sha256"],
+        "moved_to": f"{entry['container']}/{entry['blob_name']}",
+        "duplicate_of": entry["filename"],
+        "ai_decision": entry["decision"],
+    }
+
+
+async def check_duplicate(f: BinaryIO, filename: str, source: str) -> Tuple[str, int, Optional[Dict[str, Any]]]:
+    """
+    يحسب sha256 للملف المحلي (في thread) ويبحث عنه في الفهرس.
+    عند التكرار: يتحقق (اختياريًا) من أن الأصل موجود وما زال يحمل البصمة نفسها، ويسجّل مرجعًا،
+    ويعيد (sha، الحجم، سجل الأصل).
+    """
+    sha, size = await asyncio.to_thread(hash_file, f)
+    entry = await asyncio.to_thread(lookup, sha)
+    if entry is None:
+        return sha, size, None
+    if DEDUP_VERIFY:
+        meta = await blob_metadata_async(entry["container"], entry["blob_name"])
+        if meta is None or meta.get(CONTENT_HASH_KEY) != sha:
+            # الأصل حُذف أو كُتب فوقه محتوى آخر → نعيد المعالجة ونسجّل الرفع الجديد أصلًا
+            await asyncio.to_thread(forget, sha)
+            return sha, size, None
+    await asyncio.to_thread(add_reference, sha, filename, source)
+    return sha, size, entry
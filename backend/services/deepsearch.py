@@ -13,6 +13,8 @@ from typing import Any, Dict, List, Tuple, Optional, Iterable, Set
 import httpx
 import tldextract
 
+from services import metrics, scheduler
+
 # 1) Gemini SDK
 try:
     import google.generativeai as genai
@@ -276,7 +278,10 @@ def _translate_quick_with_gemini(prompt_text: str) -> List[str]:
             "Translate/extract 5-10 concise English keywords (comma-separated) capturing the legal topic. "
             "Return ONLY the comma-separated keywords."
         )
-        resp = model.generate_content([instr + "\n\nText:\n" + prompt_text], request_options={"timeout": 30})
+        with scheduler.model_slot("deepsearch"), \
+                metrics.llm_call("gemini", "translate", GEMINI_FALLBACK_MODEL or "gemini-1.5-flash") as call:
+            resp = model.generate_content([instr + "\n\nText:\n" + prompt_text], request_options={"timeout": 30})
+            call.usage(resp)
         text = getattr(resp, "text", "") or ""
         if not text:
             return []
@@ -425,12 +430,17 @@ def _call_gemini_json(prompt: str) -> Tuple[Optional[Dict[str, Any]], Optional[s
             model = _setup_gemini_model(use_grounding=True)
             system_hint = "Return STRICT JSON only as described. No markdown, no extra keys."
             contents = [{"role": "user", "parts": [system_hint + "\n\n" + prompt]}]
-            resp = model.generate_content(contents, request_options={"timeout": 120})
-            text = getattr(resp, "text", None)
+            with scheduler.model_slot("deepsearch"), \
+                    metrics.llm_call("gemini", "deepsearch", GEMINI_MODEL, attempt=attempt) as call:
+                resp = model.generate_content(contents, request_options={"timeout": 120})
+                call.usage(resp)
+                text = getattr(resp, "text", None)
+                data = _parse_json_only(text) if text else None
+                if not (data and isinstance(data.get("results"), list)):
+                    call.outcome = "invalid"  # نجح النداء لكن الرد غير صالح → محاولة أخرى
             if not text:
                 last_err = f"Empty response on attempt {attempt}."
                 continue
-            data = _parse_json_only(text)
             if data and isinstance(data.get("results"), list):
                 return data, None
             last_err = f"Invalid JSON on attempt {attempt}. Snippet: {text[:200]}"
@@ -575,10 +585,13 @@ def deepsearch_execute(_model_unused: Any, scope: Dict[str, Any]) -> Dict[str, A
                     safety_settings="BLOCK_NONE" if GEMINI_SAFETY_OFF else None,
                 )
                 system_hint = "Return STRICT JSON only as described. No markdown, no extra keys."
-                resp = model.generate_content(
-                    [{"role": "user", "parts": [system_hint + "\n\n" + prompt]}],
-                    request_options={"timeout": 120},
-                )
+                with scheduler.model_slot("deepsearch"), \
+                        metrics.llm_call("gemini", "deepsearch_fallback", GEMINI_FALLBACK_MODEL) as call:
+                    resp = model.generate_content(
+                        [{"role": "user", "parts": [system_hint + "\n\n" + prompt]}],
+                        request_options={"timeout": 120},
+                    )
+                    call.usage(resp)
                 text = getattr(resp, "text", "") or ""
                 data = _parse_json_only(text)
                 if not (data and isinstance(data.get("results"), list)):
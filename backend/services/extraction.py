@@ -12,6 +12,8 @@ from google.generativeai import GenerativeModel, delete_file, configure, upload_
 from google.generativeai.types import HarmCategory, HarmBlockThreshold
 from dotenv import load_dotenv
 
+from services import metrics
+
 load_dotenv()
 logger = logging.getLogger(__name__)
 
@@ -78,7 +80,8 @@ def extract_law(file_path: Path, model: GenerativeModel, output_json: Path) -> N
     logger.info(f"Extracting articles from {file_path.name}...")
     raw_response_text = ""
     try:
-        uploaded_file = upload_file(path=file_path)
+        with metrics.llm_call("gemini", "file_upload", "file-api"):
+            uploaded_file = upload_file(path=file_path)
         
         # 💡 الإصلاح الأول: زيادة الحد الأقصى للإنتاج
         generation_config = {
@@ -86,16 +89,18 @@ def extract_law(file_path: Path, model: GenerativeModel, output_json: Path) -> N
             "max_output_tokens": 50000, # زيادة الحد الأقصى للسماح بمستندات كبيرة
         }
 
-        resp = model.generate_content(
-            [_EXTRACT_PROMPT, uploaded_file],
-            generation_config=generation_config, # استخدام الإعدادات الجديدة
-            safety_settings={
-                HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT: HarmBlockThreshold.BLOCK_NONE,
-                HarmCategory.HARM_CATEGORY_HARASSMENT: HarmBlockThreshold.BLOCK_NONE,
-                HarmCategory.HARM_CATEGORY_HATE_SPEECH: HarmBlockThreshold.BLOCK_NONE,
-                HarmCategory.HARM_CATEGORY_SEXUALLY_EXPLICIT: HarmBlockThreshold.BLOCK_NONE,
-            }
-        )
+        with metrics.llm_call("gemini", "extract", metrics.model_name(model)) as call:
+            resp = model.generate_content(
+                [_EXTRACT_PROMPT, uploaded_file],
+                generation_config=generation_config, # استخدام الإعدادات الجديدة
+                safety_settings={
+                    HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT: HarmBlockThreshold.BLOCK_NONE,
+                    HarmCategory.HARM_CATEGORY_HARASSMENT: HarmBlockThreshold.BLOCK_NONE,
+                    HarmCategory.HARM_CATEGORY_HATE_SPEECH: HarmBlockThreshold.BLOCK_NONE,
+                    HarmCategory.HARM_CATEGORY_SEXUALLY_EXPLICIT: HarmBlockThreshold.BLOCK_NONE,
+                }
+            )
+            call.usage(resp)
         
         raw_response_text = resp.text
         articles: List[dict[str, Any]] = _extract_json(raw_response_text)
@@ -106,7 +111,8 @@ def extract_law(file_path: Path, model: GenerativeModel, output_json: Path) -> N
         )
         logger.info(f"Extraction complete. Saved to → {output_json}")
         
-        delete_file(uploaded_file.name)
+        with metrics.llm_call("gemini", "file_delete", "file-api"):
+            delete_file(uploaded_file.name)
 
     except Exception as e:
         logger.error(f"Failed during extraction for {file_path.name}: {e}")
@@ -0,0 +1,224 @@
+# services/job_registry.py
+from __future__ import annotations
+
+import gzip
+import itertools
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import orjson
+
+try:  # brotli اختياري؛ بدونه نكتفي بـ gzip
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+# سجل المهام في الذاكرة: job_id → المسارات والحالة ورقم النسخة، مع آخر حالة نتائج مُسلسلة
+# يحدّثها عامل المهمة مباشرة. الاستطلاع يُخدم من هنا دون قراءة القرص ما دامت الحالة في الذاكرة.
+JOB_STATE_CACHE_SIZE = int(os.getenv("JOB_STATE_CACHE_SIZE", "64"))  # حالات نتائج محفوظة (LRU)
+JOB_REGISTRY_KEEP = int(os.getenv("JOB_REGISTRY_KEEP", "10000"))  # سجلات مهام (بلا النتائج)
+RESULTS_COMPRESS_MIN_BYTES = int(os.getenv("RESULTS_COMPRESS_MIN_BYTES", "1024"))
+
+# أرقام النسخ تبدأ من جديد مع كل تشغيل؛ البادئة تمنع تطابق ETag قديم مع نسخة مختلفة بعد إعادة التشغيل
+_BOOT_ID = uuid.uuid4().hex[:8]
+# عداد نسخ واحد لكل السجلات: سجل أُخرج ثم أُعيد إنشاؤه لا يكرر رقم نسخة (ولا ETag) سبق إرساله
+_versions = itertools.count(1)
+# حالات المهمة الجارية: سجلها لا يُحذف عند تجاوز JOB_REGISTRY_KEEP
+ACTIVE_STATES = ("extracting", "initializing", "processing")
+
+
+@dataclass
+class JobRecord:
+    """
+    status: extracting | initializing | processing | completed | failed | cancelled
+    payload: آخر JSON للرد كما هو (بايتات JSON مدمجة بلا مسافات)، وhttp_status المرافق له؛
+             None إن لم يُنشر بعد أو أُخرج من الكاش.
+    version: يتغير مع كل payload جديد فقط (من عداد عام متزايد)، وعليه يُبنى ETag؛ 0 = لم يُنشر شيء.
+    """
+
+    job_id: str
+    primary_path: Optional[Path] = None
+    cmp_paths: List[Path] = field(default_factory=list)
+    status: str = "extracting"
+    version: int = 0
+    http_status: int = 202
+    payload: Optional[bytes] = None
+    updated_at: float = field(default_factory=time.time)
+    _encoded: Dict[str, bytes] = field(default_factory=dict, repr=False)  # نسخ مضغوطة للـ payload الحالي
+    _parsed: Any = field(default=None, repr=False)  # الـ payload الحالي كبنية (من publish أو عند أول طلب)
+
+    @property
+    def etag(self) -> str:
+        return f'"{self.job_id}.{_BOOT_ID}.{self.version}"'
+
+    @property
+    def status_etag(self) -> str:
+        """ETag لردود تحمل الحالة مع النتائج (/rows): set_status لا يغيّر النسخة، فالحالة جزء من الوسم."""
+        return f'"{self.job_id}.{_BOOT_ID}.{self.version}.{self.status}"'
+
+
+_jobs: "OrderedDict[str, JobRecord]" = OrderedDict()
+_cached: "OrderedDict[str, None]" = OrderedDict()  # ترتيب LRU للسجلات التي تحمل payload
+_lock = threading.Lock()
+
+
+def _touch_payload(rec: JobRecord) -> None:
+    _cached[rec.job_id] = None
+    _cached.move_to_end(rec.job_id)
+    while len(_cached) > JOB_STATE_CACHE_SIZE:
+        old, _ = _cached.popitem(last=False)
+        evicted = _jobs.get(old)
+        if evicted is not None:
+            evicted.payload = None
+            evicted._encoded = {}
+            evicted._parsed = None
+
+
+def _get_or_create(job_id: str) -> JobRecord:
+    rec = _jobs.get(job_id)
+    if rec is None:
+        rec = _jobs[job_id] = JobRecord(job_id)
+        if len(_jobs) > JOB_REGISTRY_KEEP:
+            # الأقدم أولًا، والمهام الجارية تبقى حتى تنتهي
+            idle = [k for k, r in _jobs.items() if k != job_id and r.status not in ACTIVE_STATES]
+            for old in idle[: len(_jobs) - JOB_REGISTRY_KEEP]:
+                del _jobs[old]
+                _cached.pop(old, None)
+    return rec
+
+
+def register(job_id: str, primary_path: Path, cmp_paths: List[Path]) -> JobRecord:
+    """يسجّل مهمة جديدة (أو يحدّث مساراتها) عند إنشائها."""
+    with _lock:
+        rec = _get_or_create(job_id)
+        rec.primary_path = primary_path
+        rec.cmp_paths = list(cmp_paths)
+        return rec
+
+
+def dumps(obj: Any) -> bytes:
+    """تسلسل مضغوط سريع (orjson) للنتائج، كما تُكتب على القرص وتُرسل للعميل."""
+    return orjson.dumps(obj)
+
+
+def publish(job_id: str, status: str, payload: bytes, http_status: int = 200, data: Any = None) -> int:
+    """
+    ينشر حالة نتائج جديدة للمهمة (JSON مُسلسل) ويعيد رقم النسخة الجديد.
+    data: البنية نفسها التي سُلسلت (اختياري؛ لا تُعدَّل بعد النشر) فلا يُعاد تحليل الـ payload عند القراءة.
+    """
+    with _lock:
+        rec = _get_or_create(job_id)
+        rec.status = status
+        rec.payload = payload
+        rec._encoded = {}
+        rec._parsed = data
+        rec.http_status = http_status
+        rec.version = next(_versions)
+        rec.updated_at = time.time()
+        _touch_payload(rec)
+        return rec.version
+
+
+def set_status(job_id: str, status: str) -> None:
+    """يغيّر الحالة دون نتائج جديدة (مثل completed بعد آخر كتابة)؛ لا يغيّر النسخة."""
+    with _lock:
+        rec = _get_or_create(job_id)
+        rec.status = status
+        rec.updated_at = time.time()
+
+
+def available_encodings() -> List[str]:
+    return (["br"] if brotli is not None else []) + ["gzip"]
+
+
+def encoded_payload(rec: JobRecord, encoding: Optional[str]) -> tuple[Optional[bytes], Optional[str]]:
+    """
+    (الجسم، الترميز) لنسخة الـ payload الحالية. الضغط يُحسب مرة لكل نسخة ويُعاد استخدامه لكل المستطلعين؛
+    الحمولات الصغيرة تُرسل كما هي.
+    """
+    with _lock:
+        payload, version, cached = rec.payload, rec.version, rec._encoded.get(encoding or "")
+    if payload is None or not encoding or len(payload) < RESULTS_COMPRESS_MIN_BYTES:
+        return payload, None
+    if cached is None:
+        if encoding == "br" and brotli is not None:
+            cached = brotli.compress(payload, quality=5)
+        elif encoding == "gzip":
+            cached = gzip.compress(payload, compresslevel=6)
+        else:
+            return payload, None
+        with _lock:
+            if rec.version == version and rec.payload is payload:
+                rec._encoded[encoding] = cached
+    return cached, encoding
+
+
+def parsed_payload(rec: JobRecord) -> Any:
+    """الـ payload الحالي كبنية بايثون؛ يُحلَّل مرة لكل نسخة ويُشارك بين الطلبات (للقراءة فقط)."""
+    with _lock:
+        payload, parsed = rec.payload, rec._parsed
+    if payload is None or parsed is not None:
+        return parsed
+    parsed = orjson.loads(payload)
+    with _lock:
+        if rec.payload is payload:
+            rec._parsed = parsed
+    return parsed
+
+
+def get(job_id: str) -> Optional[JobRecord]:
+    with _lock:
+        rec = _jobs.get(job_id)
+        if rec is not None and rec.payload is not None:
+            _cached.move_to_end(job_id)
+        return rec
+
+
+def _stored_status(data: Any) -> tuple[str, int]:
+    """
+    (الحالة النهائية، http_status) من ملف النتائج كما كتبه عامل المهمة: رد خطأ بحالة failed/cancelled
+    (قبل المقارنة)، أو تقرير فيه خلايا "cancelled" (أُلغيت بعد بدء المقارنة)، وإلا completed.
+    """
+    if isinstance(data, dict):
+        status = data.get("status")
+        if status == "failed":
+            return "failed", 500
+        if status == "cancelled":
+            return "cancelled", 409
+    elif isinstance(data, list) and any(
+        comp.get("status") == "cancelled" for row in data for comp in row.get("country_comparisons", ())
+    ):
+        return "cancelled", 200
+    return "completed", 200
+
+
+def load_from_disk(job_id: str, results_path: Path) -> Optional[JobRecord]:
+    """
+    للمهام غير الموجودة في الذاكرة (بعد إعادة التشغيل أو الإخراج من الكاش): يقرأ ملف النتائج مرة
+    واحدة ويخزّنه. None إن لم يوجد الملف.
+    """
+    try:
+        text = results_path.read_bytes()
+    except FileNotFoundError:
+        return None
+    data: Any = orjson.loads(text)
+    status, http_status = _stored_status(data)
+    with _lock:
+        rec = _get_or_create(job_id)
+        if rec.payload is None:
+            rec.payload = text
+            rec._encoded = {}
+            rec._parsed = data
+            rec.http_status = http_status
+            if rec.version == 0:
+                # مهمة لم يرها هذا العامل: ما على القرص هو حالتها النهائية
+                rec.status = status
+                rec.version = next(_versions)
+            _touch_payload(rec)
+        return rec
@@ -0,0 +1,152 @@
+# services/keyword_matcher.py
+from __future__ import annotations
+
+import math
+from collections import deque
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from services.text_norm import normalize_ar
+
+# السوابق المسموح بها قبل الكلمة داخل نفس الرمز (واو العطف، حروف الجر، أداة التعريف)
+_ALLOWED_PREFIXES = {"", "و", "ف", "ب", "ل", "ك", "ال", "وال", "فال", "بال", "كال", "لل", "ول", "وب", "فب", "وبال", "ولل"}
+
+
+class AhoCorasick:
+    """
+    مطابق متعدد الأنماط (Aho–Corasick): يمر على النص مرة واحدة مهما كان عدد الكلمات المفتاحية.
+    الأنماط والنص يُوحَّدان بـ normalize_ar (التشكيل، أشكال الألف/الياء/التاء المربوطة).
+    """
+
+    def __init__(self, patterns: Iterable[Tuple[str, Any]]):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[List[Tuple[int, Any]]] = [[]]
+        for pattern, payload in patterns:
+            self._add(normalize_ar(pattern), payload)
+        self._build()
+
+    def _add(self, pattern: str, payload: Any) -> None:
+        if not pattern:
+            return
+        node = 0
+        for ch in pattern:
+            nxt = self._goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            node = nxt
+        self._out[node].append((len(pattern), payload))
+
+    def _build(self) -> None:
+        # روابط الفشل بالعرض (BFS)؛ مخرجات كل عقدة تشمل مخرجات رابط فشلها
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in self._goto[node].items():
+                queue.append(nxt)
+                if node:
+                    f = self._fail[node]
+                    while f and ch not in self._goto[f]:
+                        f = self._fail[f]
+                    self._fail[nxt] = self._goto[f].get(ch, 0)
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def iter_matches(self, text: str, normalized: bool = False) -> Iterator[Tuple[int, int, Any]]:
+        """يعيد (بداية، نهاية، payload) لكل تطابق يبدأ عند بداية كلمة (مع السوابق الشائعة)."""
+        if not normalized:
+            text = normalize_ar(text)
+        node = 0
+        goto, fail, out = self._goto, self._fail, self._out
+        for i, ch in enumerate(text):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            if not out[node]:
+                continue
+            for length, payload in out[node]:
+                start = i - length + 1
+                if _at_word_start(text, start):
+                    yield start, i + 1, payload
+
+
+def _at_word_start(text: str, start: int) -> bool:
+    s = start
+    while s > 0 and (text[s - 1].isalnum() or text[s - 1] == "_") and start - s <= 4:
+        s -= 1
+    if s > 0 and (text[s - 1].isalnum() or text[s - 1] == "_"):
+        return False
+    return text[s:start] in _ALLOWED_PREFIXES
+
+
+# =========[ التقييم: توزيع مرتب على التصنيفات ]=========
+Label = Tuple[str, Optional[str]]
+
+
+class KeywordScorer:
+    """
+    يبني مطابقًا واحدًا لجدول {(bucket, subfolder): [(كلمة، وزن), ...]} ويقيّم كل التصنيفات في مرور واحد.
+    تكرار الكلمة نفسها يضيف لوغاريتميًا حتى لا يطغى مستند طويل بكلمة واحدة؛ تطابقات اسم الملف مضاعفة.
+    """
+
+    FILENAME_WEIGHT = 2.0
+
+    def __init__(self, table: Dict[Label, List[Tuple[str, float]]]):
+        self._matcher = AhoCorasick(
+            (kw, (label, kw, weight)) for label, words in table.items() for kw, weight in words
+        )
+
+    def _hits(self, text: str, factor: float, hits: Dict[Tuple[Label, str, float], List[float]]) -> None:
+        for _, _, (label, kw, weight) in self._matcher.iter_matches(text):
+            hits.setdefault((label, kw, factor), [0, weight * factor])[0] += 1
+
+    def score(self, filename: str, text: str, max_chars: int = 200_000) -> List[Dict[str, Any]]:
+        """توزيع مرتب تنازليًا: [{bucket, subfolder, score, share, keywords}]؛ فارغ إن لم تطابق أي كلمة."""
+        hits: Dict[Tuple[Label, str, float], List[float]] = {}
+        self._hits(filename or "", self.FILENAME_WEIGHT, hits)
+        self._hits((text or "")[:max_chars], 1.0, hits)
+
+        scores: Dict[Label, float] = {}
+        keywords: Dict[Label, List[str]] = {}
+        for (label, kw, _), (count, weight) in hits.items():
+            scores[label] = scores.get(label, 0.0) + weight * (1 + math.log(count))
+            if kw not in keywords.setdefault(label, []):
+                keywords[label].append(kw)
+        total = sum(scores.values())
+        ranked = sorted(scores.items(), key=lambda kv: kv[1], reverse=True)
+        return [
+            {
+                "bucket": bucket,
+                "subfolder": sub,
+                "score": round(sc, 3),
+                "share": round(sc / total, 3),
+                "keywords": keywords[(bucket, sub)],
+            }
+            for (bucket, sub), sc in ranked
+        ]
+
+
+def bucket_decision(ranked: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """
+    يجمع التوزيع على مستوى الكونتينر ثم يختار أفضل مجلد فرعي داخله
+    (الإشارات العامة مثل "المدعى عليه" تدعم الكونتينر دون مجلد فرعي محدد).
+    """
+    if not ranked:
+        return None
+    per_bucket: Dict[str, float] = {}
+    for r in ranked:
+        per_bucket[r["bucket"]] = per_bucket.get(r["bucket"], 0.0) + r["score"]
+    total = sum(per_bucket.values())
+    bucket = max(per_bucket, key=per_bucket.get)
+    subs = [r for r in ranked if r["bucket"] == bucket]
+    best_sub = next((r for r in subs if r["subfolder"]), None)
+    keywords = [kw for r in subs for kw in r["keywords"]]
+    return {
+        "bucket": bucket,
+        "subfolder": best_sub["subfolder"] if best_sub else None,
+        "score": round(per_bucket[bucket], 3),
+        "share": round(per_bucket[bucket] / total, 3),
+        "keywords": keywords,
+    }
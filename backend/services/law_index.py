@@ -0,0 +1,189 @@
+# services/law_index.py
+from __future__ import annotations
+
+import json
+import logging
+import math
+import os
+import re
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from services.text_norm import tokenize
+
+logger = logging.getLogger(__name__)
+
+_BACKEND_ROOT = Path(__file__).resolve().parent.parent
+
+# المجلدات التي تحوي قوانين مُستخرجة (قائمة مواد JSON)؛ مفصولة بفواصل
+LAW_INDEX_DIRS = [
+    Path(p.strip())
+    for p in os.getenv("LAW_INDEX_DIRS", f"{_BACKEND_ROOT / 'data'},{_BACKEND_ROOT / 'demo_files'}").split(",")
+    if p.strip()
+]
+# أقل مدة بين فحصين لتغيّر الملفات (ثوانٍ)
+LAW_INDEX_REFRESH_SEC = float(os.getenv("LAW_INDEX_REFRESH_SEC", "30"))
+
+# ملفات المهام الأخرى في data/ ليست قوانين
+_SKIP_PREFIXES = ("results_", "suggestion_")
+_JOB_PREFIX_RE = re.compile(r"^[0-9a-f]{32}_(?:primary|cmp)_")
+
+_BM25_K1 = 1.5
+_BM25_B = 0.75
+
+
+@dataclass(frozen=True)
+class _Snapshot:
+    """نسخة فهرس كاملة لا تتغير بعد بنائها؛ البحث يقرأ مرجعًا واحدًا لها فلا يرى بناءً نصف مكتمل."""
+
+    signature: Tuple
+    docs: List[Dict[str, Any]]
+    postings: Dict[str, List[Tuple[int, int]]]
+    doc_len: List[int]
+    avg_len: float
+
+
+class LawIndex:
+    """
+    فهرس BM25 داخل العملية لمواد القوانين المستخرجة محليًا.
+    يُبنى عند أول بحث، ثم يُفحص تغيّر الملفات ويُعاد البناء في الخلفية بينما يخدم البحث النسخة السابقة.
+    """
+
+    def __init__(self, dirs: List[Path]):
+        self.dirs = dirs
+        self._lock = threading.Lock()
+        self._snapshot: Optional[_Snapshot] = None
+        self._checked_at = 0.0
+        self._refreshing = False
+
+    # ---------- البناء ----------
+    def _law_files(self) -> List[Path]:
+        """
+        ملفات مواد القوانين فقط: أحدث نسخة لكل قانون. نسخ المهام ({job}_primary_/{job}_cmp_) لنفس
+        القانون تُعامل كملف واحد، فلا يكبر الفهرس (ولا زمن بنائه) مع تاريخ المهام.
+        """
+        latest: Dict[str, Tuple[int, Path]] = {}
+        for d in self.dirs:
+            if not d.is_dir():
+                continue
+            for p in d.glob("*.json"):
+                if p.name.startswith(_SKIP_PREFIXES) or p.name.endswith(".error.json"):
+                    continue
+                try:
+                    mtime = p.stat().st_mtime_ns
+                except OSError:
+                    continue
+                source = _JOB_PREFIX_RE.sub("", p.stem)
+                if source not in latest or mtime > latest[source][0]:
+                    latest[source] = (mtime, p)
+        return sorted(p for _, p in latest.values())
+
+    def _current_signature(self) -> Tuple:
+        sig = []
+        for p in self._law_files():
+            try:
+                st = p.stat()
+            except OSError:
+                continue
+            sig.append((str(p), st.st_mtime_ns, st.st_size))
+        return tuple(sig)
+
+    @staticmethod
+    def _build(signature: Tuple) -> _Snapshot:
+        docs: List[Dict[str, Any]] = []
+        seen = set()
+        for path_str, _, _ in signature:
+            path = Path(path_str)
+            try:
+                articles = json.loads(path.read_text("utf-8"))
+            except (OSError, json.JSONDecodeError):
+                continue
+            if not isinstance(articles, list):
+                continue
+            source = _JOB_PREFIX_RE.sub("", path.stem)
+            for art in articles:
+                if not isinstance(art, dict) or not art.get("article_text"):
+                    continue
+                key = (source, art.get("article_number"), art.get("article_text"))
+                if key in seen:
+                    continue
+                seen.add(key)
+                docs.append({
+                    "source": source,
+                    "article_number": art.get("article_number"),
+                    "article_title": art.get("article_title"),
+                    "article_text": art.get("article_text"),
+                })
+
+        postings: Dict[str, List[Tuple[int, int]]] = {}
+        doc_len: List[int] = []
+        for i, d in enumerate(docs):
+            toks = tokenize(f"{d.get('article_title') or ''} {d['article_text']}")
+            doc_len.append(len(toks))
+            for tok, tf in Counter(toks).items():
+                postings.setdefault(tok, []).append((i, tf))
+
+        avg_len = (sum(doc_len) / len(doc_len)) if doc_len else 0.0
+        logger.info("Law index rebuilt: %d articles from %d files.", len(docs), len(signature))
+        return _Snapshot(signature, docs, postings, doc_len, avg_len)
+
+    def _refresh(self) -> None:
+        """يفحص التوقيع ويبني نسخة جديدة إن تغيّر، ثم يبدّلها بإسناد واحد."""
+        try:
+            sig = self._current_signature()
+            current = self._snapshot
+            if current is None or sig != current.signature:
+                self._snapshot = self._build(sig)
+        except Exception:
+            logger.exception("Law index refresh failed; keeping the previous snapshot.")
+        finally:
+            with self._lock:
+                self._checked_at = time.monotonic()
+                self._refreshing = False
+
+    def _ensure_fresh(self) -> Optional[_Snapshot]:
+        """
+        أول بحث يبني الفهرس متزامنًا (لا شيء غيره يُخدم)؛ بعدها يُجدول الفحص/البناء في thread خلفي
+        كل LAW_INDEX_REFRESH_SEC على الأكثر، ويعود الطلب فورًا بالنسخة الحالية.
+        """
+        snap = self._snapshot
+        with self._lock:
+            if self._refreshing or (snap is not None and time.monotonic() - self._checked_at < LAW_INDEX_REFRESH_SEC):
+                background = None
+            else:
+                self._refreshing = True
+                background = snap is not None
+        if background is None:
+            return snap if snap is not None else self._snapshot
+        if background:
+            threading.Thread(target=self._refresh, name="law-index-refresh", daemon=True).start()
+            return snap
+        self._refresh()
+        return self._snapshot
+
+    # ---------- البحث ----------
+    def search(self, query: str, top_k: int = 4) -> List[Dict[str, Any]]:
+        """يعيد أفضل top_k مواد مع score، مرتبة تنازليًا."""
+        snap = self._ensure_fresh()
+        q = set(tokenize(query))
+        if snap is None or not q or not snap.docs:
+            return []
+        n = len(snap.docs)
+        scores: Dict[int, float] = {}
+        for tok in q:
+            plist = snap.postings.get(tok)
+            if not plist:
+                continue
+            idf = math.log(1 + (n - len(plist) + 0.5) / (len(plist) + 0.5))
+            for doc_id, tf in plist:
+                norm = 1 - _BM25_B + _BM25_B * snap.doc_len[doc_id] / (snap.avg_len or 1)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (_BM25_K1 + 1) / (tf + _BM25_K1 * norm)
+        best = sorted(scores.items(), key=lambda kv: kv[1], reverse=True)[:top_k]
+        return [{**snap.docs[i], "score": round(s, 3)} for i, s in best]
+
+
+law_index = LawIndex(LAW_INDEX_DIRS)
@@ -0,0 +1,257 @@
+# services/local_classifier.py
+"""
+مصنف محلي سريع (TF-IDF + نموذج خطي معايَر، CPU فقط) يُدرَّب من قرارات Azure OpenAI السابقة.
+يُجيب مباشرةً عندما تكون ثقته المعايَرة عالية، وإلا يُصعَّد المستند إلى النموذج اللغوي.
+
+إعادة التدريب (دون اتصال):
+    python -m services.local_classifier train [--min-per-label 5] [--holdout 0.2]
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import os
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from services.text_norm import normalize_ar
+
+logger = logging.getLogger(__name__)
+
+_DATA_DIR = Path(__file__).resolve().parent.parent / "data"
+
+DECISIONS_LOG = Path(os.getenv("CLASSIFIER_DECISIONS_LOG", str(_DATA_DIR / "classifier_decisions.jsonl")))
+MODEL_PATH    = Path(os.getenv("LOCAL_CLASSIFIER_PATH", str(_DATA_DIR / "local_classifier.joblib")))
+# تفعيل المصنف المحلي (يعمل فقط إن وُجد نموذج مدرَّب)
+LOCAL_CLASSIFIER_ENABLED   = os.getenv("LOCAL_CLASSIFIER", "1").lower() in {"1", "true", "yes", "on"}
+# أقل ثقة معايَرة للإجابة محليًا دون النموذج اللغوي
+LOCAL_CLASSIFIER_THRESHOLD = float(os.getenv("LOCAL_CLASSIFIER_THRESHOLD", "0.85"))
+# تسجيل قرارات النموذج اللغوي لاستخدامها في التدريب
+LOG_DECISIONS = os.getenv("CLASSIFIER_LOG_DECISIONS", "1").lower() in {"1", "true", "yes", "on"}
+
+_MAX_CHARS = 6000  # يكفي لتمييز نوع المستند ويبقي التدريب والاستدلال سريعين
+
+_log_lock = threading.Lock()
+_model_lock = threading.Lock()
+_model: Optional[Dict[str, Any]] = None
+_model_mtime: Optional[float] = None
+
+
+def _label(bucket: str, subfolder: Optional[str]) -> str:
+    return f"{bucket}/{subfolder or ''}"
+
+
+def _split_label(label: str) -> Tuple[str, Optional[str]]:
+    bucket, _, sub = label.partition("/")
+    return bucket, (sub or None)
+
+
+def _doc(text: str, filename: str) -> str:
+    return f"{filename}\n{(text or '')[:_MAX_CHARS]}"
+
+
+# =========[ سجل القرارات ]=========
+def log_decision(text: str, filename: str, bucket: str, subfolder: Optional[str], confidence: float, source: str = "llm") -> None:
+    """يضيف قرار تصنيف إلى سجل JSONL (سطر لكل مستند)."""
+    if not LOG_DECISIONS or not (text or "").strip():
+        return
+    rec = {
+        "ts": round(time.time(), 3),
+        "source": source,
+        "filename": filename,
+        "bucket": bucket,
+        "subfolder": subfolder,
+        "confidence": confidence,
+        "text": (text or "")[:_MAX_CHARS],
+    }
+    try:
+        with _log_lock:
+            DECISIONS_LOG.parent.mkdir(parents=True, exist_ok=True)
+            with DECISIONS_LOG.open("a", encoding="utf-8") as f:
+                f.write(json.dumps(rec, ensure_ascii=False) + "\n")
+    except OSError as e:
+        logger.warning(f"Could not log classifier decision: {e}")
+
+
+def _read_decisions(path: Path) -> List[Dict[str, Any]]:
+    rows: List[Dict[str, Any]] = []
+    if not path.exists():
+        return rows
+    with path.open(encoding="utf-8") as f:
+        for line in f:
+            try:
+                rec = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if rec.get("bucket") and rec.get("text"):
+                rows.append(rec)
+    return rows
+
+
+# =========[ الاستدلال ]=========
+def _load_model() -> Optional[Dict[str, Any]]:
+    """يحمّل النموذج كسولًا ويعيد تحميله إن أُعيد تدريبه (تغيّر وقت تعديل الملف)."""
+    global _model, _model_mtime
+    try:
+        mtime = MODEL_PATH.stat().st_mtime
+    except OSError:
+        return None
+    if _model is not None and mtime == _model_mtime:
+        return _model
+    with _model_lock:
+        if _model is None or mtime != _model_mtime:
+            try:
+                import joblib
+                _model = joblib.load(MODEL_PATH)
+                _model_mtime = mtime
+                logger.info(
+                    f"Local classifier loaded: {len(_model['labels'])} labels, "
+                    f"{_model['n_samples']} samples, trained {_model['trained_at']}."
+                )
+            except Exception as e:
+                logger.warning(f"Local classifier unavailable: {e}")
+                _model, _model_mtime = None, mtime
+    return _model
+
+
+def predict(text: str, filename: str = "") -> Optional[Tuple[str, Optional[str], float]]:
+    """
+    يعيد (bucket, subfolder, confidence) من النموذج المحلي، أو None إن لم يتوفر نموذج.
+    القرار بالإجابة محليًا أو التصعيد يعود للمستدعي عبر LOCAL_CLASSIFIER_THRESHOLD.
+    """
+    if not LOCAL_CLASSIFIER_ENABLED:
+        return None
+    bundle = _load_model()
+    if bundle is None:
+        return None
+    try:
+        proba = bundle["pipeline"].predict_proba([_doc(text, filename)])[0]
+    except Exception as e:
+        logger.warning(f"Local classifier prediction failed; escalating: {e}")
+        return None
+    best = int(proba.argmax())
+    bucket, sub = _split_label(bundle["pipeline"].classes_[best])
+    return bucket, sub, float(proba[best])
+
+
+# =========[ التدريب ]=========
+def _build_pipeline(n_per_label_min: int):
+    """n_per_label_min: أقل عدد أمثلة لتصنيف في بيانات التدريب (≥ 2: المعايرة تحتاج طيّتين على الأقل)."""
+    from sklearn.calibration import CalibratedClassifierCV
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    from sklearn.pipeline import FeatureUnion, Pipeline
+    from sklearn.svm import LinearSVC
+
+    # المعالج المسبق دالة من وحدة أخرى حتى يُحفظ مع النموذج (pickle) حتى عند التشغيل بـ -m
+    features = FeatureUnion([
+        ("words", TfidfVectorizer(preprocessor=normalize_ar, ngram_range=(1, 2), min_df=2, sublinear_tf=True, max_features=50000)),
+        ("chars", TfidfVectorizer(preprocessor=normalize_ar, analyzer="char_wb", ngram_range=(2, 4), min_df=2, sublinear_tf=True, max_features=100000)),
+    ])
+    # المعايرة (sigmoid) تجعل الاحتمالات صالحة للمقارنة بعتبة ثابتة
+    clf = CalibratedClassifierCV(LinearSVC(C=1.0), method="sigmoid", cv=min(3, n_per_label_min))
+    return Pipeline([("features", features), ("clf", clf)])
+
+
+def train(
+    log_path: Path = DECISIONS_LOG,
+    out_path: Path = MODEL_PATH,
+    min_per_label: int = 5,
+    holdout: float = 0.2,
+    threshold: float = LOCAL_CLASSIFIER_THRESHOLD,
+) -> Dict[str, Any]:
+    """
+    يدرّب النموذج من سجل القرارات ويحفظه؛ يعيد تقرير التقييم على عينة مستبعدة.
+    min_per_label ≥ 2؛ يُتخطّى التقييم المستبعد إن ترك تصنيفًا بأقل من مثالين للتدريب.
+    """
+    if min_per_label < 2:
+        raise ValueError(f"min_per_label must be >= 2 (calibration needs 2 folds), got {min_per_label}.")
+    import joblib
+    from sklearn.model_selection import train_test_split
+
+    rows = _read_decisions(log_path)
+    # آخر قرار لكل (ملف، نص) يغلب على القرارات الأقدم
+    latest: Dict[Tuple[str, str], Dict[str, Any]] = {}
+    for r in rows:
+        latest[(r.get("filename") or "", r["text"])] = r
+    rows = list(latest.values())
+
+    labels = [_label(r["bucket"], r.get("subfolder")) for r in rows]
+    counts = Counter(labels)
+    keep = {lab for lab, n in counts.items() if n >= min_per_label}
+    docs = [_doc(r["text"], r.get("filename") or "") for r, lab in zip(rows, labels) if lab in keep]
+    y = [lab for lab in labels if lab in keep]
+    if len(keep) < 2:
+        raise ValueError(
+            f"Not enough labelled decisions to train: {len(rows)} rows, "
+            f"{len(keep)} labels with >= {min_per_label} examples (need at least 2)."
+        )
+
+    report: Dict[str, Any] = {
+        "n_samples": len(y),
+        "labels": sorted(keep),
+        "dropped_labels": {lab: n for lab, n in counts.items() if lab not in keep},
+        "threshold": threshold,
+    }
+
+    # تقييم على عينة مستبعدة: الدقة الكلية + نسبة المستندات التي تُجاب محليًا ودقتها
+    split = None
+    if holdout > 0 and len(y) * holdout >= len(keep):
+        split = train_test_split(docs, y, test_size=holdout, stratify=y, random_state=13)
+        if min(Counter(split[2]).values()) < 2:
+            report["holdout_skipped"] = "a label would keep fewer than 2 training examples"
+            split = None
+    if split is not None:
+        x_tr, x_te, y_tr, y_te = split
+        pipe = _build_pipeline(min(Counter(y_tr).values())).fit(x_tr, y_tr)
+        proba = pipe.predict_proba(x_te)
+        pred = pipe.classes_[proba.argmax(axis=1)]
+        conf = proba.max(axis=1)
+        covered = conf >= threshold
+        n_cov = int(covered.sum())
+        report.update({
+            "holdout_size": len(y_te),
+            "holdout_accuracy": round(float((pred == y_te).mean()), 4),
+            "coverage_at_threshold": round(n_cov / len(y_te), 4),
+            "accuracy_when_local": round(float((pred[covered] == [t for t, c in zip(y_te, covered) if c]).mean()), 4) if n_cov else None,
+        })
+
+    pipe = _build_pipeline(min(Counter(y).values())).fit(docs, y)
+    bundle = {
+        "pipeline": pipe,
+        "labels": sorted(keep),
+        "n_samples": len(y),
+        "trained_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "report": report,
+    }
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = out_path.with_name(out_path.name + ".tmp")
+    joblib.dump(bundle, tmp)
+    os.replace(tmp, out_path)
+    return report
+
+
+def _main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(prog="python -m services.local_classifier")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    t = sub.add_parser("train", help="retrain the local classifier from the decisions log")
+    t.add_argument("--log", type=Path, default=DECISIONS_LOG)
+    t.add_argument("--out", type=Path, default=MODEL_PATH)
+    t.add_argument("--min-per-label", type=int, default=5)
+    t.add_argument("--holdout", type=float, default=0.2)
+    t.add_argument("--threshold", type=float, default=LOCAL_CLASSIFIER_THRESHOLD)
+    args = parser.parse_args(argv)
+
+    if args.cmd == "train":
+        if args.min_per_label < 2:
+            parser.error("--min-per-label must be at least 2")
+        report = train(args.log, args.out, args.min_per_label, args.holdout, args.threshold)
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+        print(f"Saved model to {args.out}")
+
+
+if __name__ == "__main__":
+    _main()
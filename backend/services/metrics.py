@@ -0,0 +1,397 @@
+# services/metrics.py
+from __future__ import annotations
+
+import contextvars
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, Iterator, List, Optional, TypeVar
+
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+
+T = TypeVar("T")
+
+# قياسات لكل مهمة (مراحل + نداءات النماذج) في الذاكرة، وعدادات/مدرّجات Prometheus لكل العملية.
+# المهمة الحالية تُمرَّر ضمنيًا عبر contextvar، فلا تحتاج الخدمات لمعرفة job_id.
+JOB_METRICS_KEEP = int(os.getenv("JOB_METRICS_KEEP", "200"))
+# عدد آخر النداءات الناجحة المحفوظة لكل (مزوّد/عملية) لتقدير الزمن مسبقًا (services/planner)
+RECENT_CALLS_KEEP = int(os.getenv("RECENT_CALLS_KEEP", "200"))
+
+_LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40, 80, 160, 320)
+_PHASE_BUCKETS = (0.1, 0.5, 1, 5, 10, 30, 60, 120, 300, 600, 1200, 2400, 4800)
+
+LLM_CALL_SECONDS = Histogram(
+    "ailegal_llm_call_seconds", "Latency of model/file API calls",
+    ["provider", "operation", "model", "outcome"], buckets=_LATENCY_BUCKETS,
+)
+LLM_CALLS = Counter(
+    "ailegal_llm_calls_total", "Model/file API calls by outcome",
+    ["provider", "operation", "model", "outcome"],
+)
+LLM_RETRIES = Counter(
+    "ailegal_llm_retries_total", "Calls that were a retry (attempt > 1)",
+    ["provider", "operation"],
+)
+LLM_TOKENS = Counter(
+    "ailegal_llm_tokens_total", "Tokens reported by the provider (usage metadata)",
+    ["provider", "operation", "model", "kind"],
+)
+JOB_PHASE_SECONDS = Histogram(
+    "ailegal_job_phase_seconds", "Duration of comparison job phases",
+    ["phase", "outcome"], buckets=_PHASE_BUCKETS,
+)
+SCHED_QUEUE_WAIT_SECONDS = Histogram(
+    "ailegal_scheduler_queue_wait_seconds", "Time a job waited for a shared model slot",
+    ["priority"], buckets=_LATENCY_BUCKETS,
+)
+JOBS = Counter("ailegal_jobs_total", "Finished comparison jobs", ["outcome"])
+JOBS_IN_PROGRESS = Gauge("ailegal_jobs_in_progress", "Comparison jobs currently running")
+
+_RATE_LIMITED = {"ResourceExhausted", "TooManyRequests", "RateLimitError"}
+_TIMEOUTS = {"DeadlineExceeded", "APITimeoutError", "Timeout", "TimeoutError", "ReadTimeout"}
+_UNAVAILABLE = {"ServiceUnavailable", "InternalServerError", "APIConnectionError"}
+
+
+def _outcome_of(exc: BaseException) -> str:
+    name = type(exc).__name__
+    if isinstance(exc, GeneratorExit):
+        return "cancelled"  # المستهلك أوقف البث قبل نهايته
+    if name in _RATE_LIMITED:
+        return "rate_limited"
+    if name in _TIMEOUTS:
+        return "timeout"
+    if name in _UNAVAILABLE:
+        return "unavailable"
+    return "error"
+
+
+def _pct(values: List[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    s = sorted(values)
+    return round(s[min(len(s) - 1, int(q * len(s)))], 3)
+
+
+# =========[ نداء نموذج واحد ]=========
+class LLMCall:
+    """سجل نداء واحد؛ يضبط المستدعي الاستهلاك عبر usage(resp) والنتيجة عبر outcome عند الحاجة."""
+
+    __slots__ = ("provider", "operation", "model", "attempt", "outcome", "error",
+                 "latency", "prompt_tokens", "completion_tokens")
+
+    def __init__(self, provider: str, operation: str, model: str, attempt: int):
+        self.provider = provider
+        self.operation = operation
+        self.model = model
+        self.attempt = attempt
+        self.outcome = "ok"
+        self.error: Optional[str] = None
+        self.latency = 0.0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+
+    def usage(self, resp: Any) -> None:
+        """يقرأ الاستهلاك من usage_metadata (Gemini) أو usage (OpenAI)."""
+        um = getattr(resp, "usage_metadata", None)
+        if um is not None:
+            self.prompt_tokens = int(getattr(um, "prompt_token_count", 0) or 0)
+            self.completion_tokens = int(getattr(um, "candidates_token_count", 0) or 0)
+            return
+        u = getattr(resp, "usage", None)
+        if u is not None:
+            self.prompt_tokens = int(getattr(u, "prompt_tokens", 0) or 0)
+            self.completion_tokens = int(getattr(u, "completion_tokens", 0) or 0)
+
+
+def model_name(model: Any) -> str:
+    name = getattr(model, "model_name", None) or getattr(model, "_model_name", None) or str(model or "")
+    return name.rsplit("/", 1)[-1] or "unknown"
+
+
+@contextmanager
+def llm_call(provider: str, operation: str, model: str, attempt: int = 1) -> Iterator[LLMCall]:
+    """
+    يقيس نداءً واحدًا: الزمن والنتيجة (ok/rate_limited/timeout/unavailable/error/cancelled) والتوكنات.
+    الاستثناء يُعاد رفعه كما هو بعد التسجيل.
+    """
+    call = LLMCall(provider, operation, model, attempt)
+    t0 = time.perf_counter()
+    try:
+        yield call
+    except BaseException as e:
+        call.outcome = _outcome_of(e)
+        call.error = f"{type(e).__name__}: {e}"[:300]
+        raise
+    finally:
+        call.latency = time.perf_counter() - t0
+        _record_call(call)
+
+
+def _record_call(call: LLMCall) -> None:
+    labels = (call.provider, call.operation, call.model)
+    LLM_CALL_SECONDS.labels(*labels, call.outcome).observe(call.latency)
+    LLM_CALLS.labels(*labels, call.outcome).inc()
+    if call.attempt > 1:
+        LLM_RETRIES.labels(call.provider, call.operation).inc()
+    if call.prompt_tokens:
+        LLM_TOKENS.labels(*labels, "prompt").inc(call.prompt_tokens)
+    if call.completion_tokens:
+        LLM_TOKENS.labels(*labels, "completion").inc(call.completion_tokens)
+    with _recent_lock:
+        rec = _recent.get((call.provider, call.operation))
+        if rec is None:
+            rec = _recent[(call.provider, call.operation)] = {"ok": deque(maxlen=RECENT_CALLS_KEEP), "calls": 0, "failed": 0}
+        rec["calls"] += 1
+        if call.outcome == "ok":
+            rec["ok"].append((call.latency, call.prompt_tokens))
+        else:
+            rec["failed"] += 1
+    job = _current_job.get()
+    if job is not None:
+        job.add_call(call)
+
+
+_recent: Dict[tuple, Dict[str, Any]] = {}
+_recent_lock = threading.Lock()
+
+
+def recent_call_stats(provider: str, operation: str) -> Optional[Dict[str, Any]]:
+    """
+    إحصاءات آخر النداءات الناجحة لعملية منذ تشغيل العملية: p50/p95 للزمن، متوسط توكنات المدخل،
+    ونسبة الفشل. None إن لم يُرصد أي نداء ناجح بعد.
+    """
+    with _recent_lock:
+        rec = _recent.get((provider, operation))
+        if not rec or not rec["ok"]:
+            return None
+        ok = list(rec["ok"])
+        calls, failed = rec["calls"], rec["failed"]
+    lat = [x[0] for x in ok]
+    toks = [x[1] for x in ok if x[1]]
+    return {
+        "samples": len(ok),
+        "p50": _pct(lat, 0.5),
+        "p95": _pct(lat, 0.95),
+        "avg_prompt_tokens": round(sum(toks) / len(toks)) if toks else None,
+        "failure_rate": round(failed / calls, 4) if calls else 0.0,
+    }
+
+
+# =========[ قياسات المهمة ]=========
+class JobMetrics:
+    """مراحل المهمة المتتالية + تجميع النداءات لكل (مزوّد/عملية) + أزمنة الكتابة على القرص."""
+
+    def __init__(self, job_id: str):
+        self.job_id = job_id
+        self.status = "running"
+        self.started_at = time.time()
+        self.finished_at: Optional[float] = None
+        self._lock = threading.Lock()
+        self._phases: List[Dict[str, Any]] = []
+        self._open: Optional[Dict[str, Any]] = None
+        self._calls: Dict[str, Dict[str, Any]] = {}
+        self._io: Dict[str, Dict[str, float]] = {}
+        self._failed = False
+        self._cancelled = False
+        self._token: Optional[contextvars.Token] = None
+
+    # ---- المراحل ----
+    def phase(self, name: str) -> None:
+        """يُنهي المرحلة المفتوحة (إن وُجدت) ويبدأ المرحلة name."""
+        with self._lock:
+            self._close_phase("ok")
+            self._open = {"name": name, "t0": time.perf_counter(), "started_at": time.time()}
+
+    def _close_phase(self, outcome: str) -> None:
+        if self._open is None:
+            return
+        dur = time.perf_counter() - self._open.pop("t0")
+        self._open.update(duration_sec=round(dur, 3), outcome=outcome)
+        self._phases.append(self._open)
+        JOB_PHASE_SECONDS.labels(self._open["name"], outcome).observe(dur)
+        self._open = None
+
+    def mark_failed(self) -> None:
+        """تُغلق المرحلة الجارية كفاشلة؛ المهمة تنتهي failed حتى لو تابعت مرحلة التنظيف."""
+        with self._lock:
+            self._close_phase("failed")
+            self._failed = True
+
+    def mark_cancelled(self) -> None:
+        with self._lock:
+            self._close_phase("cancelled")
+            self._cancelled = True
+
+    def finish(self) -> str:
+        with self._lock:
+            self._close_phase("ok")
+            self.status = "cancelled" if self._cancelled else "failed" if self._failed else "completed"
+            self.finished_at = time.time()
+            return self.status
+
+    # ---- النداءات والكتابة ----
+    def add_call(self, call: LLMCall) -> None:
+        key = f"{call.provider}/{call.operation}"
+        with self._lock:
+            agg = self._calls.setdefault(key, {
+                "calls": 0, "retries": 0, "outcomes": {}, "models": set(),
+                "latencies": [], "prompt_tokens": 0, "completion_tokens": 0, "last_error": None,
+            })
+            agg["calls"] += 1
+            agg["retries"] += call.attempt > 1
+            agg["outcomes"][call.outcome] = agg["outcomes"].get(call.outcome, 0) + 1
+            agg["models"].add(call.model)
+            agg["latencies"].append(call.latency)
+            agg["prompt_tokens"] += call.prompt_tokens
+            agg["completion_tokens"] += call.completion_tokens
+            if call.error:
+                agg["last_error"] = call.error
+
+    def add_io(self, name: str, seconds: float, nbytes: int) -> None:
+        with self._lock:
+            io = self._io.setdefault(name, {"count": 0, "seconds": 0.0, "bytes": 0})
+            io["count"] += 1
+            io["seconds"] += seconds
+            io["bytes"] += nbytes
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            phases = [dict(p) for p in self._phases]
+            if self._open is not None:
+                phases.append({
+                    "name": self._open["name"], "started_at": self._open["started_at"],
+                    "duration_sec": round(time.perf_counter() - self._open["t0"], 3), "outcome": "running",
+                })
+            calls = {}
+            totals = {"calls": 0, "retries": 0, "prompt_tokens": 0, "completion_tokens": 0, "llm_seconds": 0.0}
+            for key, agg in self._calls.items():
+                lat = agg["latencies"]
+                calls[key] = {
+                    "calls": agg["calls"],
+                    "retries": agg["retries"],
+                    "outcomes": dict(agg["outcomes"]),
+                    "models": sorted(agg["models"]),
+                    "latency_sec": {"total": round(sum(lat), 3), "p50": _pct(lat, 0.5),
+                                    "p95": _pct(lat, 0.95), "max": round(max(lat), 3)},
+                    "prompt_tokens": agg["prompt_tokens"],
+                    "completion_tokens": agg["completion_tokens"],
+                    "last_error": agg["last_error"],
+                }
+                for k in ("calls", "retries", "prompt_tokens", "completion_tokens"):
+                    totals[k] += agg[k]
+                totals["llm_seconds"] += sum(lat)
+            totals["llm_seconds"] = round(totals["llm_seconds"], 3)
+            io = {k: {"count": v["count"], "seconds": round(v["seconds"], 3), "bytes": v["bytes"]}
+                  for k, v in self._io.items()}
+        end = self.finished_at or time.time()
+        return {
+            "job_id": self.job_id,
+            "status": self.status,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "duration_sec": round(end - self.started_at, 3),
+            "phases": phases,
+            "calls": calls,
+            "totals": totals,
+            "io": io,
+        }
+
+
+_current_job: contextvars.ContextVar[Optional[JobMetrics]] = contextvars.ContextVar("current_job", default=None)
+_jobs: "OrderedDict[str, JobMetrics]" = OrderedDict()
+_jobs_lock = threading.Lock()
+
+
+def _get_or_create(job_id: str, detached: bool = False) -> JobMetrics:
+    with _jobs_lock:
+        job = _jobs.get(job_id)
+        if job is None:
+            job = _jobs[job_id] = JobMetrics(job_id)
+            if detached:
+                # سجل عارض لنداءات مهمة غير معروفة هنا (أُعيد تشغيل الخادم، أو معرّف خاطئ): ليس مهمة جارية
+                job.status = "detached"
+            # نُبقي آخر JOB_METRICS_KEEP مهمة؛ الأقدم المنتهية تُحذف أولًا
+            while len(_jobs) > JOB_METRICS_KEEP:
+                old = next((k for k, j in _jobs.items() if j.finished_at is not None), None)
+                if old is None:
+                    break
+                del _jobs[old]
+        return job
+
+
+def start_job(job_id: str) -> JobMetrics:
+    """بداية مهمة مقارنة: تُنسب نداءات هذا السياق إليها حتى end_job."""
+    job = _get_or_create(job_id)
+    with job._lock:
+        job.status, job.finished_at = "running", None
+    job._token = _current_job.set(job)
+    JOBS_IN_PROGRESS.inc()
+    return job
+
+
+def end_job(job: JobMetrics) -> None:
+    """نهاية المهمة (completed أو failed/cancelled حسب mark_failed/mark_cancelled) وفك ربط السياق."""
+    JOBS.labels(job.finish()).inc()
+    JOBS_IN_PROGRESS.dec()
+    token, job._token = job._token, None
+    if token is not None:
+        _current_job.reset(token)
+
+
+def _release(job: JobMetrics) -> None:
+    # السجل العارض يُعدّ منتهيًا بعد كل ربط، فيخضع للحذف كأي مهمة منتهية
+    with job._lock:
+        if job.status == "detached":
+            job.finished_at = time.time()
+
+
+@contextmanager
+def bind_job(job_id: str) -> Iterator[JobMetrics]:
+    """
+    ينسب نداءات عمل لاحق (مثل الاقتراحات) إلى المهمة دون تغيير حالتها.
+    مهمة غير معروفة لا تُنشأ كجارية: تُسجَّل نداءاتها في سجل "detached" منتهٍ.
+    """
+    job = _get_or_create(job_id, detached=True)
+    token = _current_job.set(job)
+    try:
+        yield job
+    finally:
+        _current_job.reset(token)
+        _release(job)
+
+
+def bind_iter(job_id: str, items: Iterable[T]) -> Iterator[T]:
+    """
+    مثل bind_job لمُولِّد يُستهلك خطوة خطوة (بث SSE): كل next() قد يجري في سياق مختلف
+    (thread pool)، فيُربط السياق ويُفك داخل كل خطوة بدل أن يمتد عبر yield.
+    """
+    job = _get_or_create(job_id, detached=True)
+    it = iter(items)
+    try:
+        while True:
+            token = _current_job.set(job)
+            try:
+                item = next(it)
+            except StopIteration:
+                return
+            finally:
+                _current_job.reset(token)
+            yield item
+    finally:
+        _release(job)
+
+
+def current_job() -> Optional[JobMetrics]:
+    return _current_job.get()
+
+
+def job_summary(job_id: str) -> Optional[Dict[str, Any]]:
+    with _jobs_lock:
+        job = _jobs.get(job_id)
+    return job.summary() if job else None
+
+
+def prometheus_payload() -> tuple[bytes, str]:
+    return generate_latest(), CONTENT_TYPE_LATEST
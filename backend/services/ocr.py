@@ -1,7 +1,7 @@
 # services/ocr.py
 from __future__ import annotations
-import os, io, logging, mimetypes, tempfile
-from typing import Optional
+import os, io, logging, mimetypes, shutil, tempfile
+from typing import BinaryIO, Optional, Union
 from dotenv import load_dotenv
 
 # اختياري: استخراج نص PDF/DOCX كـ fallback سريع
@@ -19,6 +19,8 @@ import google.generativeai as genai
 from google.generativeai import GenerativeModel, upload_file, delete_file
 from google.api_core import exceptions as gex
 
+from services import metrics, scheduler
+
 load_dotenv()
 logger = logging.getLogger(__name__)
 
@@ -44,13 +46,21 @@ def _guess_mime(filename: str) -> str:
     t, _ = mimetypes.guess_type(filename)
     return t or "application/octet-stream"
 
-def _basic_pdf_text(bytes_data: bytes) -> str:
+# bytes أو ملف قابل لإعادة القراءة (مثل SpooledTemporaryFile للرفع) حتى لا نحمّل ملفات ضخمة في الذاكرة
+Source = Union[bytes, BinaryIO]
+
+def _as_stream(data: Source) -> BinaryIO:
+    if isinstance(data, (bytes, bytearray)):
+        return io.BytesIO(data)
+    data.seek(0)
+    return data
+
+def _basic_pdf_text(bytes_data: Source) -> str:
     """محاولة سريعة لاستخراج نص PDF عبر PyPDF2 قبل الذهاب لـ OCR."""
     if not PdfReader:
         return ""
     try:
-        from io import BytesIO
-        r = PdfReader(BytesIO(bytes_data))
+        r = PdfReader(_as_stream(bytes_data))
         parts = []
         for pg in r.pages:
             try:
@@ -61,28 +71,27 @@ def _basic_pdf_text(bytes_data: bytes) -> str:
     except Exception:
         return ""
 
-def _basic_docx_text(bytes_data: bytes) -> str:
+def _basic_docx_text(bytes_data: Source) -> str:
     if not docx:
         return ""
     try:
-        from io import BytesIO
-        d = docx.Document(BytesIO(bytes_data))
+        d = docx.Document(_as_stream(bytes_data))
         return "\n".join(p.text for p in d.paragraphs).strip()
     except Exception:
         return ""
 
-def _upload_any_compat(filename: str, data: bytes, mime: str):
+def _upload_any_compat(filename: str, data: Source, mime: str):
     """
     يرفع الملف إلى File API بتوافقية:
-    - يحاول upload_file(file=BytesIO(...))
+    - يحاول upload_file(file=<stream>)
     - وإن فشل (TypeError في النسخ القديمة) يكتب ملف مؤقت ويستخدم path=
     """
     try:
-        return upload_file(file=io.BytesIO(data), display_name=filename, mime_type=mime)
+        return upload_file(file=_as_stream(data), display_name=filename, mime_type=mime)
     except TypeError:
         # نسخة قديمة لا تدعم 'file='
         with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(filename)[1]) as tmp:
-            tmp.write(data)
+            shutil.copyfileobj(_as_stream(data), tmp)
             tmp_path = tmp.name
         try:
             return upload_file(path=tmp_path, display_name=filename, mime_type=mime)
@@ -92,25 +101,30 @@ def _upload_any_compat(filename: str, data: bytes, mime: str):
             except Exception:
                 pass
 
-def _run_gemini_ocr(model_name: str, filename: str, data: bytes) -> str:
+def _run_gemini_ocr(model_name: str, filename: str, data: Source) -> str:
     mime = _guess_mime(filename)
     up = None
     try:
-        up = _upload_any_compat(filename, data, mime)
+        with scheduler.model_slot("ocr"), metrics.llm_call("gemini", "file_upload", "file-api"):
+            up = _upload_any_compat(filename, data, mime)
         model = _make_model(model_name)
-        resp = model.generate_content([_OCR_PROMPT, up], generation_config=_GEN_CFG)
+        with scheduler.model_slot("ocr"), metrics.llm_call("gemini", "ocr", model_name) as call:
+            resp = model.generate_content([_OCR_PROMPT, up], generation_config=_GEN_CFG)
+            call.usage(resp)
         return (getattr(resp, "text", "") or "").strip()
     finally:
         try:
             if up is not None:
-                delete_file(up.name)
+                with metrics.llm_call("gemini", "file_delete", "file-api"):
+                    delete_file(up.name)
         except Exception:
             pass
 
-def extract_text_any(filename: str, file_bytes: bytes) -> str:
+def extract_text_any(filename: str, file_bytes: Source) -> str:
     """
     1) جرّب استخراج بسيط من PDF/DOCX محليًا (لو كفى نرجعه).
     2) جرّب Gemini بالموديل الأساسي؛ وإن فشل جرّب الـ fallback.
+    file_bytes: bytes أو ملف قابل لـ seek.
     """
     lower = filename.lower()
 
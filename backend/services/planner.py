@@ -0,0 +1,308 @@
+# services/planner.py
+from __future__ import annotations
+
+import json
+import math
+import os
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from services import metrics, scheduler
+from services.comparison import _PROMPT_WITH_FILES
+from services.extraction import _EXTRACT_PROMPT
+from services.suggestion_jobs import SUGGESTION_CONCURRENCY
+from services.suggestions import IMPROVE_PROMPT, SUGGESTION_PROMPT, _cached_evidence, suggestion_path_stats
+
+# تقدير مسبق (بلا أي نداء للنموذج) لعدد النداءات والتوكنات والزمن لمهمة مقارنة قبل تشغيلها.
+# الأزمنة من آخر النداءات المرصودة في services.metrics، وإلا فمن القيم الافتراضية أدناه.
+PLAN_CHARS_PER_TOKEN = float(os.getenv("PLAN_CHARS_PER_TOKEN", "3.0"))  # نص عربي + JSON
+PLAN_PDF_BYTES_PER_ARTICLE = int(os.getenv("PLAN_PDF_BYTES_PER_ARTICLE", "2500"))
+PLAN_PDF_BYTES_PER_TOKEN = float(os.getenv("PLAN_PDF_BYTES_PER_TOKEN", "12"))
+# حدود الحصة (0 = بلا حد): المهمة التي تتجاوزها تُعلَّم في الخطة ولا تُرفض تلقائيًا
+PLAN_MAX_PROMPT_TOKENS = int(os.getenv("PLAN_MAX_PROMPT_TOKENS", "0"))
+PLAN_MAX_WALL_SEC = float(os.getenv("PLAN_MAX_WALL_SEC", "0"))
+
+# خلايا المهمة (مادة × دولة) المنفّذة معًا: حد المهمة ضمن خانات المجدول المشترك
+COMPARE_CONCURRENCY = min(
+    int(os.getenv("JOB_CELL_PARALLELISM", str(scheduler.CELL_CONCURRENCY))), scheduler.CELL_CONCURRENCY
+)
+
+# (p50, p95) بالثواني حين لا توجد نداءات مرصودة بعد
+_DEFAULT_LATENCY = {
+    "file_upload": (1.5, 4.0),
+    "file_delete": (0.4, 1.0),
+    "extract": (90.0, 240.0),
+    "compare": (12.0, 30.0),
+    "suggest_pass1": (25.0, 60.0),
+    "suggest_pass2": (20.0, 50.0),
+    "deepsearch": (30.0, 80.0),
+}
+_DEFAULT_SECOND_PASS_RATE = 0.5
+_SIMILARS_PER_COUNTRY = 2  # متوسط المواد المشابهة التي تعيدها المقارنة لكل دولة
+
+
+@dataclass
+class LawInput:
+    """ملف قانون داخل المهمة: مواده معروفة إن كان JSON مستخرجًا، وإلا تُقدَّر من الحجم."""
+
+    name: str
+    size_bytes: int
+    articles: Optional[List[Dict[str, Any]]] = None
+
+    @property
+    def extracted(self) -> bool:
+        return self.articles is not None
+
+    @property
+    def article_count(self) -> int:
+        if self.articles is not None:
+            return len(self.articles)
+        return max(1, math.ceil(self.size_bytes / PLAN_PDF_BYTES_PER_ARTICLE))
+
+    @property
+    def json_chars(self) -> int:
+        """حجم JSON المواد كما يُرفع إلى File API (أو تقديره قبل الاستخراج)."""
+        if self.articles is not None:
+            return len(json.dumps(self.articles, ensure_ascii=False, indent=4))
+        return self.article_count * _avg_article_chars(None)
+
+
+def _parse_articles(data: bytes) -> Optional[List[Dict[str, Any]]]:
+    try:
+        parsed = json.loads(data.decode("utf-8"))
+    except (UnicodeDecodeError, json.JSONDecodeError):
+        return None
+    return parsed if isinstance(parsed, list) else None
+
+
+def law_from_bytes(filename: str, data: bytes) -> LawInput:
+    """ملف مرفوع: JSON المواد يُقرأ مباشرة (لا استخراج)، وغيره يحتاج استخراجًا."""
+    articles = _parse_articles(data) if filename.lower().endswith(".json") else None
+    return LawInput(Path(filename).stem, len(data), articles)
+
+
+def law_from_path(path: Path) -> LawInput:
+    """ملف على القرص: يكفي وجود JSON المستخرج بجانبه (نفس شرط run_article_by_article_process)."""
+    json_path = path.with_suffix(".json")
+    articles = _parse_articles(json_path.read_bytes()) if json_path.exists() else None
+    return LawInput(path.stem, path.stat().st_size, articles)
+
+
+def _tokens(chars: int) -> int:
+    return math.ceil(chars / PLAN_CHARS_PER_TOKEN)
+
+
+def _avg_article_chars(law: Optional[LawInput]) -> int:
+    if law is not None and law.articles:
+        return max(1, sum(len(json.dumps(a, ensure_ascii=False)) for a in law.articles) // len(law.articles))
+    return 1200
+
+
+def _latency(operation: str) -> Dict[str, Any]:
+    stats = metrics.recent_call_stats("gemini", operation)
+    p50, p95 = _DEFAULT_LATENCY[operation]
+    if stats is None:
+        return {"p50": p50, "p95": p95, "source": "default", "samples": 0, "failure_rate": 0.0}
+    return {"p50": stats["p50"], "p95": stats["p95"], "source": "observed",
+            "samples": stats["samples"], "failure_rate": stats["failure_rate"]}
+
+
+def _second_pass_rate() -> float:
+    stats = suggestion_path_stats()
+    if not stats["total"]:
+        return _DEFAULT_SECOND_PASS_RATE
+    counts = stats["counts"]
+    second = counts.get("second_pass_quality", 0) + counts.get("second_pass_unparseable", 0)
+    return second / stats["total"]
+
+
+def _rpm_seconds(calls: float) -> float:
+    """أقل زمن يسمح به MODEL_RPM_LIMIT لعدد من خانات المجدول (كل خانة تستهلك توكنًا)؛ 0 بلا حد."""
+    return calls * 60.0 / scheduler.MODEL_RPM_LIMIT if scheduler.MODEL_RPM_LIMIT > 0 else 0.0
+
+
+def _cells_ahead(cells: int, priority: str) -> Dict[str, Any]:
+    """
+    خلايا المهام النشطة التي ستُخدم قبل خلايا هذه المهمة أو معها (من scheduler.stats()):
+    الأولوية الأعلى كلها قبلها؛ ونفس الأولوية بحصتها العادلة، فكل تدفق وزنه w يُخدم منه حتى
+    cells × w خلية بينما تُخدم خلايا هذه المهمة؛ الأولوية الأدنى لا تؤخرها.
+    """
+    rank = scheduler.JOB_PRIORITIES[priority]
+    higher = 0
+    flows: Dict[str, Dict[str, float]] = {}
+    for info in scheduler.stats()["jobs"].values():
+        backlog = info["waiting_cells"] + (info["queued_cells"] or 0)
+        other = scheduler.JOB_PRIORITIES[info["priority"]]
+        if other < rank:
+            higher += backlog
+        elif other == rank:
+            f = flows.setdefault(info["flow"], {"backlog": 0, "weight": info["weight"]})
+            f["backlog"] += backlog
+    shared = sum(min(f["backlog"], cells * f["weight"]) for f in flows.values())
+    return {"higher_priority": higher, "same_priority": math.ceil(shared), "total": higher + math.ceil(shared)}
+
+
+class _Tally:
+    """يجمع النداءات المتوقعة لكل عملية مع توكنات المدخل وزمنها التراكمي (p50/p95)."""
+
+    def __init__(self) -> None:
+        self.ops: Dict[str, Dict[str, Any]] = {}
+
+    def add(self, operation: str, calls: float, prompt_tokens: float = 0) -> None:
+        if calls <= 0:
+            return
+        lat = _latency(operation)
+        op = self.ops.setdefault(operation, {"calls": 0.0, "prompt_tokens": 0.0, "latency_sec": lat})
+        op["calls"] += calls
+        op["prompt_tokens"] += prompt_tokens
+
+    def seconds(self, operation: str, calls: float, q: str = "p50") -> float:
+        return calls * _latency(operation)[q] if calls > 0 else 0.0
+
+    def report(self) -> Dict[str, Any]:
+        ops = {
+            name: {**op, "calls": math.ceil(op["calls"]), "prompt_tokens": math.ceil(op["prompt_tokens"])}
+            for name, op in self.ops.items()
+        }
+        return {
+            "calls": ops,
+            "total_calls": sum(op["calls"] for op in ops.values()),
+            "total_prompt_tokens": sum(op["prompt_tokens"] for op in ops.values()),
+        }
+
+
+def plan_job(
+    primary: LawInput,
+    comparisons: List[LawInput],
+    auto_suggest: bool = False,
+    priority: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    يقدّر مسبقًا ما ستصرفه المهمة: النداءات وتوكنات المدخل لكل عملية، والزمن المتوقع (p50/p95)
+    بالتوازي المضبوط حاليًا وحد MODEL_RPM_LIMIT وما ينتظر في المجدول الآن، وأي الكاشات ستُصاب.
+    لا يقرأ أو يكتب شيئًا خارج الذاكرة.
+    """
+    tally = _Tally()
+    laws = [primary] + comparisons
+    wall = {"p50": 0.0, "p95": 0.0}
+    slots_used = 0.0  # خانات المجدول (= توكنات حد الطلبات) التي ستأخذها المهمة
+
+    def spend(operation: str, calls: float, prompt_tokens: float = 0, concurrency: int = 1,
+              scheduled: bool = False) -> Dict[str, float]:
+        nonlocal slots_used
+        tally.add(operation, calls, prompt_tokens)
+        # المجدَّل: الأبطأ بين التوازي وحد الطلبات في الدقيقة
+        floor = _rpm_seconds(calls) if scheduled else 0.0
+        sec = {q: max(tally.seconds(operation, calls, q) / max(1, concurrency), floor) for q in wall}
+        slots_used += calls if scheduled else 0
+        for q in wall:
+            wall[q] += sec[q]
+        return sec
+
+    # 1) استخراج ما لم يُستخرج بعد (رفع + استخراج + حذف لكل ملف، تباعًا، في خانة واحدة لكل ملف)
+    to_extract = [law for law in laws if not law.extracted]
+    for law in to_extract:
+        spend("file_upload", 1)
+        spend("extract", 1, _tokens(len(_EXTRACT_PROMPT)) + law.size_bytes / PLAN_PDF_BYTES_PER_TOKEN,
+              scheduled=True)
+        spend("file_delete", 1)
+
+    # 2) رفع JSON كل القوانين إلى File API (كل رفع في خانة)، وحذفها في التنظيف
+    spend("file_upload", len(laws), scheduled=True)
+
+    # 3) المقارنة: كل خلية ترسل المادة + الملفين المرفوعين كاملين
+    rows = primary.article_count
+    cells = rows * len(comparisons)
+    template = _tokens(len(_PROMPT_WITH_FILES))
+    article = _tokens(_avg_article_chars(primary))
+    cmp_tokens = sum(
+        rows * (template + article + _tokens(primary.json_chars) + _tokens(law.json_chars)) for law in comparisons
+    )
+    compare_sec = spend("compare", cells, cmp_tokens, COMPARE_CONCURRENCY, scheduled=True)
+    # خلايا المهام الأخرى في المجدول الآن: تتقاسم الخانات وحد الطلبات مع خلايا هذه المهمة
+    ahead = _cells_ahead(cells, priority or scheduler.DEFAULT_PRIORITY)
+    if ahead["total"] and cells:
+        for q in wall:
+            per_slot = max(_latency("compare")[q] / max(1, scheduler.CELL_CONCURRENCY), _rpm_seconds(1))
+            shared = (cells + ahead["total"]) * per_slot
+            extra = max(0.0, shared - compare_sec[q])
+            compare_sec[q] += extra
+            wall[q] += extra
+    spend("file_delete", len(laws))
+
+    # 4) الاقتراحات التلقائية: تعمل بالتوازي مع المقارنة، فلا يُضاف إلا ما يتجاوزها
+    evidence_hits = 0
+    suggestions: Optional[Dict[str, Any]] = None
+    if auto_suggest:
+        p2_rate = _second_pass_rate()
+        if primary.articles is not None:
+            evidence_hits = sum(1 for a in primary.articles if _cached_evidence(a) is not None)
+        similar_chars = sum(
+            _SIMILARS_PER_COUNTRY * min(2000, _avg_article_chars(law)) for law in comparisons
+        )
+        observed = metrics.recent_call_stats("gemini", "suggest_pass1")
+        pass1_tokens = (observed or {}).get("avg_prompt_tokens") or (
+            _tokens(len(SUGGESTION_PROMPT)) + article + _tokens(similar_chars)
+        )
+        second = rows * p2_rate
+        ds_calls = max(0.0, second - evidence_hits * p2_rate)
+
+        tally.add("suggest_pass1", rows, rows * pass1_tokens)
+        tally.add("suggest_pass2", second, second * (_tokens(len(IMPROVE_PROMPT)) + pass1_tokens / 2))
+        tally.add("deepsearch", ds_calls)
+        per_row = {
+            q: _latency("suggest_pass1")[q]
+            + p2_rate * (_latency("suggest_pass2")[q] + _latency("deepsearch")[q])
+            for q in wall
+        }
+        suggest_calls = rows + second + ds_calls
+        for q in wall:
+            busy = rows * per_row[q] / max(1, SUGGESTION_CONCURRENCY)
+            # آخر صف يبدأ بعد آخر مقارنة على الأقل
+            wall[q] += max(per_row[q], busy - compare_sec[q])
+            # الاقتراحات تأخذ خانات من حد الطلبات نفسه الذي تأخذه المقارنة والخلايا التي أمامها
+            wall[q] = max(wall[q], _rpm_seconds(slots_used + suggest_calls + ahead["total"]))
+        slots_used += suggest_calls
+        suggestions = {
+            "rows": rows,
+            "concurrency": SUGGESTION_CONCURRENCY,
+            "second_pass_rate": round(p2_rate, 3),
+        }
+
+    report = tally.report()
+    exceeds: List[str] = []
+    if PLAN_MAX_PROMPT_TOKENS and report["total_prompt_tokens"] > PLAN_MAX_PROMPT_TOKENS:
+        exceeds.append("prompt_tokens")
+    if PLAN_MAX_WALL_SEC and wall["p50"] > PLAN_MAX_WALL_SEC:
+        exceeds.append("wall_time")
+
+    return {
+        "laws": [
+            {"name": law.name, "size_bytes": law.size_bytes, "articles": law.article_count,
+             "articles_estimated": not law.extracted}
+            for law in laws
+        ],
+        "rows": rows,
+        "cells": cells,
+        **report,
+        "wall_sec": {q: round(v, 1) for q, v in wall.items()},
+        "concurrency": {"compare": COMPARE_CONCURRENCY, "suggestions": SUGGESTION_CONCURRENCY},
+        "scheduler": {
+            "priority": priority or scheduler.DEFAULT_PRIORITY,
+            "slots": math.ceil(slots_used),
+            "rpm_limit": scheduler.MODEL_RPM_LIMIT or None,
+            "cells_ahead": ahead,
+        },
+        "suggestions": suggestions,
+        "cache": {
+            "extraction": {"hits": len(laws) - len(to_extract), "misses": len(to_extract),
+                           "files": {law.name: law.extracted for law in laws}},
+            "deepsearch_evidence": {"hits": evidence_hits} if auto_suggest else None,
+        },
+        "quota": {
+            "max_prompt_tokens": PLAN_MAX_PROMPT_TOKENS or None,
+            "max_wall_sec": PLAN_MAX_WALL_SEC or None,
+            "exceeds": exceeds,
+        },
+    }
@@ -0,0 +1,73 @@
+# services/results_rows.py
+from __future__ import annotations
+
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+# صفحات من تقرير النتائج مع إسقاط الحقول: قوائم الواجهة تطلب العناوين والحالات فقط،
+# وتجلب النصوص الكاملة لاحقًا لصف واحد (offset=i&limit=1).
+ROWS_PAGE_MAX = 200
+
+ARTICLE_FIELDS = ("article_number", "article_title", "article_text")
+COMPARISON_FIELDS = ("status", "error")
+MATCH_FIELDS = (
+    "matched_article_identifier",
+    "matched_article_title",
+    "reason_for_similarity",
+    "matched_article_full_text",
+)
+ALL_FIELDS = frozenset(ARTICLE_FIELDS + COMPARISON_FIELDS + MATCH_FIELDS)
+
+
+def parse_fields(fields: Optional[str]) -> Optional[Set[str]]:
+    """'a,b' → {"a", "b"}؛ None = كل الحقول. يرفع ValueError بالحقول غير المعروفة."""
+    if fields is None:
+        return None
+    chosen = {f.strip() for f in fields.split(",") if f.strip()}
+    unknown = chosen - ALL_FIELDS
+    if unknown:
+        raise ValueError(f"Unknown fields: {sorted(unknown)}. Allowed: {sorted(ALL_FIELDS)}")
+    return chosen
+
+
+def _pick(src: Dict[str, Any], keys: Iterable[str]) -> Dict[str, Any]:
+    return {k: src[k] for k in keys if k in src}
+
+
+def _project_comparison(comp: Dict[str, Any], fields: Set[str]) -> Dict[str, Any]:
+    out = {"country_name": comp.get("country_name")}
+    out.update(_pick(comp, (f for f in COMPARISON_FIELDS if f in fields)))
+    match_keys = [f for f in MATCH_FIELDS if f in fields]
+    if match_keys:
+        out["similar_articles"] = [_pick(sim, match_keys) for sim in comp.get("similar_articles") or []]
+    return out
+
+
+def rows_page(
+    report: List[Dict[str, Any]],
+    offset: int = 0,
+    limit: int = 50,
+    fields: Optional[Set[str]] = None,
+    countries: Optional[Set[str]] = None,
+) -> Dict[str, Any]:
+    """
+    صفحة [offset, offset+limit) من صفوف التقرير. العمل والحجم يتناسبان مع الصفحة لا مع التقرير:
+    يُقطع التقرير أولًا ثم تُنسخ الحقول المطلوبة فقط من صفوف الصفحة.
+    يعيد {"total", "offset", "limit", "rows"}، وكل صف يحمل "index" في التقرير الكامل.
+    """
+    limit = max(1, min(int(limit), ROWS_PAGE_MAX))
+    offset = max(0, int(offset))
+    rows = []
+    for i, row in enumerate(report[offset:offset + limit], start=offset):
+        comps = row.get("country_comparisons") or []
+        if countries:
+            comps = [c for c in comps if c.get("country_name") in countries]
+        if fields is None:
+            rows.append({"index": i, "base_article_info": row.get("base_article_info"), "country_comparisons": comps})
+            continue
+        out: Dict[str, Any] = {"index": i}
+        article_keys = [f for f in ARTICLE_FIELDS if f in fields]
+        if article_keys:
+            out["base_article_info"] = _pick(row.get("base_article_info") or {}, article_keys)
+        out["country_comparisons"] = [_project_comparison(c, fields) for c in comps]
+        rows.append(out)
+    return {"total": len(report), "offset": offset, "limit": limit, "rows": rows}
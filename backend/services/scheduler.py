@@ -0,0 +1,441 @@
+# services/scheduler.py
+from __future__ import annotations
+
+import contextvars
+import heapq
+import itertools
+import logging
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from services import metrics
+
+logger = logging.getLogger(__name__)
+
+# مجدول مشترك لنداءات Gemini: مهام المقارنة (استخراج + رفع + خلايا مادة × دولة) عبر slot، والاقتراح
+# والبحث المعمّق وOCR عبر model_slot. الكل يتقاسم CELL_CONCURRENCY خانة وحد MODEL_RPM_LIMIT طلب/دقيقة
+# (نفس حصة النموذج). نداءات Azure OpenAI (المحادثة والتصنيف) خارجه: لها حصة نشر (deployment) مستقلة.
+# عند الازدحام تُقدَّم الأولوية الأعلى (interactive قبل bulk)، وداخل الأولوية الواحدة توزَّع الخانات
+# بطابور عادل موزون (start-time fair queuing) بين "التدفقات": الفريق (tenant) إن حُدّد، وإلا المهمة نفسها.
+# فمهمة من 10 مواد لا تنتظر انتهاء مهمة من 300 مادة بدأت قبلها. الإلغاء يوقف جدولة خلايا المهمة فورًا.
+CELL_CONCURRENCY = int(os.getenv("CELL_CONCURRENCY", "4"))
+MODEL_RPM_LIMIT = float(os.getenv("MODEL_RPM_LIMIT", "0"))  # 0 = بلا حد
+MODEL_RPM_BURST = int(os.getenv("MODEL_RPM_BURST", str(CELL_CONCURRENCY)))
+JOB_PRIORITIES = {"interactive": 0, "normal": 1, "bulk": 2}
+SCHEDULER_KEEP = int(os.getenv("SCHEDULER_KEEP", "1000"))  # مهام منتهية تُحفظ حالتها (للإلغاء المتأخر)
+
+
+def _parse_weights(raw: str) -> Dict[str, float]:
+    """'teamA=2,teamB=0.5' → {"teamA": 2.0, "teamB": 0.5}"""
+    out: Dict[str, float] = {}
+    for part in raw.replace("،", ",").split(","):
+        name, _, w = part.partition("=")
+        if name.strip() and w.strip():
+            out[name.strip()] = max(0.01, float(w))
+    return out
+
+
+def _default_priority(raw: str) -> str:
+    """قيمة JOB_DEFAULT_PRIORITY غير معروفة تُسقط كل مهمة بلا أولوية صريحة (KeyError في slot) → normal مع تحذير."""
+    name = raw.strip().lower()
+    if name in JOB_PRIORITIES:
+        return name
+    logger.warning(f"JOB_DEFAULT_PRIORITY={raw!r} is not one of {list(JOB_PRIORITIES)}; using 'normal'.")
+    return "normal"
+
+
+TENANT_WEIGHTS = _parse_weights(os.getenv("SCHED_TENANT_WEIGHTS", ""))
+DEFAULT_PRIORITY = _default_priority(os.getenv("JOB_DEFAULT_PRIORITY", "normal"))
+_WAIT_SAMPLES = 500
+SERVICE_FLOW_PREFIX = "service:"  # تدفقات نداءات النموذج غير المنسوبة لمهمة (model_slot)
+
+
+class JobCancelled(Exception):
+    """تُرفع في عامل المهمة عند إلغائها: أثناء انتظار خانة، أو في فحص بين الخلايا، أو أثناء انتظار إعادة المحاولة."""
+
+
+class CellQueue:
+    """
+    طابور خلايا المهمة (مادة × دولة) بترتيب الملف، مع صفوف "مُركَّز عليها" تُقدَّم على الباقي.
+    آخر طلب تركيز يتقدّم على ما قبله (ما ينظر إليه المستخدم الآن). كل العمليات O(1) مُطفأة.
+    """
+
+    def __init__(self, rows: int, cols: int):
+        self._lock = threading.Lock()
+        self._pending: Dict[int, deque] = {r: deque(range(cols)) for r in range(rows)} if cols else {}
+        self._order: deque = deque(self._pending)
+        self._focus: deque = deque()
+
+    def focus(self, rows: List[int]) -> int:
+        """يقدّم الصفوف المطلوبة (بترتيبها) ويعيد عدد الخلايا المعلّقة التي تقدّمت."""
+        moved = 0
+        with self._lock:
+            for r in reversed(rows):
+                cells = self._pending.get(r)
+                if cells:
+                    self._focus.appendleft(r)
+                    moved += len(cells)
+        return moved
+
+    def pop(self) -> Optional[Tuple[int, int]]:
+        """(الصف، الدولة) للخلية التالية، أو None إن فرغ الطابور."""
+        with self._lock:
+            for q in (self._focus, self._order):
+                while q:
+                    r = q[0]
+                    cells = self._pending.get(r)
+                    if cells:
+                        c = cells.popleft()
+                        if not cells:
+                            del self._pending[r]
+                        return r, c
+                    q.popleft()
+            return None
+
+    def __len__(self) -> int:
+        with self._lock:
+            return sum(len(c) for c in self._pending.values())
+
+
+class _JobState:
+    __slots__ = (
+        "job_id", "priority", "tenant", "cancelled", "running", "finished", "queue", "early_focus",
+        "granted", "granted_base", "granted_end", "busy_sec", "waits", "wait_total", "wait_max", "registered_at",
+    )
+
+    def __init__(self, job_id: str, priority: str):
+        self.job_id = job_id
+        self.priority = priority
+        self.tenant: Optional[str] = None
+        self.cancelled = threading.Event()
+        self.running = 0
+        self.finished = False
+        self.queue: Optional[CellQueue] = None
+        self.early_focus: List[int] = []  # تركيز طُلب قبل بدء مرحلة المقارنة
+        # إحصاءات الحصة والانتظار
+        self.granted = 0
+        self.granted_base = _granted_total  # ما مُنح لكل المهام قبل تسجيل هذه المهمة
+        self.granted_end: Optional[int] = None  # ... وعند انتهائها (تثبت الحصة بعدها)
+        self.busy_sec = 0.0
+        self.waits: deque = deque(maxlen=_WAIT_SAMPLES)
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.registered_at = time.time()
+
+    @property
+    def flow(self) -> str:
+        return f"tenant:{self.tenant}" if self.tenant else f"job:{self.job_id}"
+
+    @property
+    def weight(self) -> float:
+        return TENANT_WEIGHTS.get(self.tenant, 1.0) if self.tenant else 1.0
+
+
+_cond = threading.Condition()
+_jobs: Dict[str, _JobState] = {}
+_waiting: List[List[Any]] = []  # heap: [رتبة الأولوية، وسم البداية العادل، تسلسل، job_id، التدفق]
+_seq = itertools.count()
+_running = 0
+_granted_total = 0
+# الطابور العادل: الزمن الافتراضي = وسم بداية آخر خلية مُنحت، ولكل تدفق وسم نهاية آخر خلية له
+_vtime = 0.0
+_flow_finish: Dict[str, float] = {}
+# دلو التوكنات لحد الطلبات في الدقيقة
+_bucket = float(MODEL_RPM_BURST)
+_bucket_ts = time.monotonic()
+_current: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("scheduler_job", default=None)
+
+
+def _state(job_id: str) -> _JobState:
+    st = _jobs.get(job_id)
+    if st is None:
+        st = _jobs[job_id] = _JobState(job_id, DEFAULT_PRIORITY)
+        if len(_jobs) > SCHEDULER_KEEP:
+            for old in [k for k, s in _jobs.items() if s.finished][: len(_jobs) - SCHEDULER_KEEP]:
+                del _jobs[old]
+    return st
+
+
+def register(job_id: str, priority: Optional[str] = None, tenant: Optional[str] = None) -> None:
+    """
+    يسجّل المهمة بأولويتها (interactive | normal | bulk) وفريقها عند إنشائها. مهام الفريق الواحد
+    تتقاسم حصته (وزنه من SCHED_TENANT_WEIGHTS، افتراضيًا 1)؛ المهمة بلا فريق تدفق مستقل بوزن 1.
+    """
+    if priority is not None and priority not in JOB_PRIORITIES:
+        raise ValueError(f"Unknown priority {priority!r}. Allowed: {list(JOB_PRIORITIES)}")
+    with _cond:
+        st = _state(job_id)
+        if priority is not None:
+            st.priority = priority
+        if tenant:
+            st.tenant = tenant
+
+
+def set_priority(job_id: str, priority: str) -> bool:
+    """يغيّر أولوية مهمة قائمة؛ تسري على الخلايا التي لم تدخل الطابور بعد. False إن كانت المهمة غير معروفة."""
+    if priority not in JOB_PRIORITIES:
+        raise ValueError(f"Unknown priority {priority!r}. Allowed: {list(JOB_PRIORITIES)}")
+    with _cond:
+        st = _jobs.get(job_id)
+        if st is None:
+            return False
+        st.priority = priority
+        return True
+
+
+def cancel(job_id: str) -> Optional[bool]:
+    """
+    يطلب إلغاء المهمة. None إن كانت غير معروفة، False إن كانت منتهية أصلًا، True إن سُجّل الإلغاء.
+    الانتظارات الجارية تستيقظ فورًا؛ النداء الجاري فعلًا يكتمل لكن نتيجته تُهمل.
+    """
+    with _cond:
+        st = _jobs.get(job_id)
+        if st is None:
+            return None
+        if st.finished:
+            return False
+        st.cancelled.set()
+        _cond.notify_all()
+        return True
+
+
+def is_cancelled(job_id: str) -> bool:
+    st = _jobs.get(job_id)
+    return st is not None and st.cancelled.is_set()
+
+
+def check(job_id: str) -> None:
+    """يرفع JobCancelled إن أُلغيت المهمة (يُستدعى بين الخلايا والمراحل)."""
+    if is_cancelled(job_id):
+        raise JobCancelled(job_id)
+
+
+def finish(job_id: str) -> None:
+    with _cond:
+        st = _state(job_id)
+        st.finished = True
+        st.queue = None
+        st.granted_end = _granted_total
+        _drop_idle_flow(st)
+
+
+def open_queue(job_id: str, rows: int, cols: int) -> CellQueue:
+    """ينشئ طابور خلايا المهمة عند بدء المقارنة، ويطبّق أي تركيز طُلب قبل ذلك."""
+    queue = CellQueue(rows, cols)
+    with _cond:
+        st = _state(job_id)
+        st.queue = queue
+        early, st.early_focus = st.early_focus, []
+    if early:
+        queue.focus(early)
+    return queue
+
+
+def focus(job_id: str, rows: List[int]) -> Optional[Dict[str, Any]]:
+    """
+    يقدّم خلايا الصفوف المطلوبة إلى رأس طابور المهمة. None إن كانت المهمة غير معروفة.
+    قبل مرحلة المقارنة يُحفظ الطلب ويُطبَّق عند إنشاء الطابور.
+    """
+    with _cond:
+        st = _jobs.get(job_id)
+        if st is None:
+            return None
+        queue = st.queue
+        if queue is None and not st.finished:
+            st.early_focus = list(rows) + [r for r in st.early_focus if r not in rows]
+            return {"moved_cells": 0, "deferred": True}
+    if queue is None:
+        return {"moved_cells": 0, "deferred": False}
+    return {"moved_cells": queue.focus(list(rows)), "deferred": False}
+
+
+@contextmanager
+def slot(job_id: str) -> Iterator[None]:
+    """
+    يحجز خانة نموذج للمهمة طوال الكتلة (ينتظر دوره حسب الأولوية). يرفع JobCancelled إن أُلغيت المهمة
+    قبل الحصول على الخانة. داخل الكتلة، sleep() تنتظر إلغاء هذه المهمة أيضًا.
+    التركيز (focus) يغيّر ترتيب الخلايا داخل طابور المهمة فقط، لا رتبتها أو حصتها بين المهام.
+    """
+    global _running, _granted_total, _vtime
+    with _cond:
+        st = _state(job_id)
+        rank = JOB_PRIORITIES[st.priority]
+        # وسم البداية: لا يقل عن الزمن الافتراضي (لا رصيد متراكم لتدفق كان خاملًا)، ثم يتقدّم التدفق 1/وزنه
+        start = max(_vtime, _flow_finish.get(st.flow, 0.0))
+        _flow_finish[st.flow] = start + 1.0 / st.weight
+        entry = [rank, start, next(_seq), job_id, st.flow]
+        heapq.heappush(_waiting, entry)
+        t0 = time.monotonic()
+        try:
+            while True:
+                if st.cancelled.is_set():
+                    raise JobCancelled(job_id)
+                if _running < CELL_CONCURRENCY and _waiting[0] is entry:
+                    delay = _rate_delay()
+                    if delay <= 0:
+                        break
+                    _cond.wait(delay)  # رأس الطابور ينتظر توكنًا من حد الطلبات
+                else:
+                    _cond.wait()
+        except BaseException:
+            _waiting.remove(entry)
+            _unwind_flow(entry, 1.0 / st.weight)
+            _drop_idle_flow(st)
+            heapq.heapify(_waiting)
+            _cond.notify_all()
+            raise
+        heapq.heappop(_waiting)
+        _take_rate_token()
+        _vtime = max(_vtime, start)
+        _running += 1
+        _granted_total += 1
+        st.running += 1
+        st.granted += 1
+        waited = time.monotonic() - t0
+        st.waits.append(waited)
+        st.wait_total += waited
+        st.wait_max = max(st.wait_max, waited)
+        # الخانة التالية قد تكون متاحة لمن يليه
+        _cond.notify_all()
+    metrics.SCHED_QUEUE_WAIT_SECONDS.labels(st.priority).observe(waited)
+    token = _current.set(job_id)
+    t_run = time.monotonic()
+    try:
+        yield
+    finally:
+        _current.reset(token)
+        with _cond:
+            _running -= 1
+            st.running -= 1
+            st.busy_sec += time.monotonic() - t_run
+            _drop_idle_flow(st)
+            _cond.notify_all()
+
+
+@contextmanager
+def model_slot(service: str) -> Iterator[None]:
+    """
+    خانة لنداء Gemini خارج خلايا المقارنة (الاقتراح، البحث المعمّق، OCR) حتى يمر بالحد نفسه.
+    يُنسب إلى المهمة المربوطة بالقياسات (metrics.bind_job) بأولويتها وتدفقها إن عرفها المجدول ولم تُلغَ،
+    وإلا إلى تدفق الخدمة "service:<service>" بالأولوية الافتراضية. داخل slot قائمة لا يحجز خانة ثانية.
+    """
+    if _current.get() is not None:
+        yield
+        return
+    job = metrics.current_job()
+    job_id = job.job_id if job is not None else None
+    with _cond:
+        st = _jobs.get(job_id) if job_id else None
+        if st is None or st.cancelled.is_set():
+            job_id = SERVICE_FLOW_PREFIX + service
+            _state(job_id)
+    with slot(job_id):
+        yield
+
+
+def _unwind_flow(entry: List[Any], step: float) -> None:
+    """
+    منتظر تخلّى عن دوره (إلغاء/استثناء): يُعاد وسم نهاية تدفقه خطوة، وتتقدّم خلايا التدفق التي
+    انتظرت بعده خطوة، فلا يدفع التدفق ثمن خانة لم يأخذها.
+    """
+    flow, seq = entry[4], entry[2]
+    for e in _waiting:
+        if e[4] == flow and e[2] > seq:
+            e[1] -= step
+    if flow in _flow_finish:
+        _flow_finish[flow] -= step
+
+
+def _drop_idle_flow(st: _JobState) -> None:
+    """تدفق مهمة منتهية بلا فريق يُنسى حين لا يبقى له نداء جارٍ أو منتظر (اقتراحات لاحقة تعيده)."""
+    if st.finished and not st.tenant and st.running == 0 and not any(e[4] == st.flow for e in _waiting):
+        _flow_finish.pop(st.flow, None)
+
+
+def _rate_delay() -> float:
+    """الثواني المتبقية حتى يتوفر توكن في دلو MODEL_RPM_LIMIT (0 إن كان متوفرًا أو بلا حد)."""
+    global _bucket, _bucket_ts
+    if MODEL_RPM_LIMIT <= 0:
+        return 0.0
+    now = time.monotonic()
+    rate = MODEL_RPM_LIMIT / 60.0
+    _bucket = min(float(MODEL_RPM_BURST), _bucket + (now - _bucket_ts) * rate)
+    _bucket_ts = now
+    return 0.0 if _bucket >= 1.0 else (1.0 - _bucket) / rate
+
+
+def _take_rate_token() -> None:
+    global _bucket
+    if MODEL_RPM_LIMIT > 0:
+        _bucket -= 1.0
+
+
+def sleep(seconds: float) -> None:
+    """time.sleep تنقطع عند إلغاء المهمة الحالية (داخل slot)؛ خارج أي مهمة تعمل كـ time.sleep."""
+    job_id = _current.get()
+    st = _jobs.get(job_id) if job_id else None
+    if st is None:
+        time.sleep(seconds)
+        return
+    if st.cancelled.wait(seconds):
+        raise JobCancelled(job_id)
+
+
+def _pct(values: List[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    s = sorted(values)
+    return round(s[min(len(s) - 1, int(q * len(s)))], 3)
+
+
+def _job_info(st: _JobState) -> Dict[str, Any]:
+    # الحصة: نسبة ما مُنح لهذه المهمة من كل الخانات الممنوحة بين تسجيلها وانتهائها
+    granted_since = (st.granted_end if st.granted_end is not None else _granted_total) - st.granted_base
+    waits = list(st.waits)
+    return {
+        "priority": st.priority,
+        "tenant": st.tenant,
+        "flow": st.flow,
+        "weight": st.weight,
+        "cancelled": st.cancelled.is_set(),
+        "running_cells": st.running,
+        "waiting_cells": sum(1 for e in _waiting if e[3] == st.job_id),
+        "queued_cells": len(st.queue) if st.queue is not None else None,
+        "finished": st.finished,
+        "granted_slots": st.granted,
+        "share": round(st.granted / granted_since, 4) if granted_since else None,
+        "busy_slot_sec": round(st.busy_sec, 3),
+        "queue_wait_sec": {
+            "avg": round(st.wait_total / st.granted, 3) if st.granted else None,
+            "p50": _pct(waits, 0.5),
+            "p95": _pct(waits, 0.95),
+            "max": round(st.wait_max, 3),
+        },
+    }
+
+
+def stats() -> Dict[str, Any]:
+    """حالة المجدول: الخانات، حد الطلبات، الانتظار حسب الأولوية، وحصة كل مهمة نشطة وزمن انتظارها."""
+    with _cond:
+        waiting: Dict[str, int] = {}
+        for e in _waiting:
+            name = next(p for p, r in JOB_PRIORITIES.items() if r == e[0])
+            waiting[name] = waiting.get(name, 0) + 1
+        return {
+            "slots": CELL_CONCURRENCY,
+            "running": _running,
+            "waiting": waiting,
+            "rpm_limit": MODEL_RPM_LIMIT or None,
+            "tenant_weights": TENANT_WEIGHTS,
+            "jobs": {job_id: _job_info(st) for job_id, st in _jobs.items() if not st.finished},
+        }
+
+
+def job_info(job_id: str) -> Optional[Dict[str, Any]]:
+    with _cond:
+        st = _jobs.get(job_id)
+        return _job_info(st) if st is not None else None
@@ -2,33 +2,50 @@
 from __future__ import annotations
 
 import os
+import asyncio
+import base64
 import mimetypes
+import threading
+import time
 import uuid
-from typing import Optional
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, BinaryIO, Callable, Iterable, Iterator, Optional, TypeVar, Union
 
-from azure.storage.blob import BlobServiceClient, ContentSettings
-from azure.core.exceptions import ResourceExistsError
+from azure.storage.blob import BlobBlock, BlobServiceClient, ContentSettings
+from azure.core.exceptions import ResourceExistsError, ResourceNotFoundError
 from dotenv import load_dotenv
 
 load_dotenv()
 
-# =========[ 1) التهيئة: إنشاء عميل التخزين ]=========
+T = TypeVar("T")
+
+# =========[ 1) التهيئة: عميل التخزين يُنشأ كسولًا عند أول استخدام ]=========
 CONN_STR    = os.getenv("AZURE_STORAGE_CONNECTION_STRING")
 ACCOUNT     = os.getenv("AZURE_STORAGE_ACCOUNT")
 ACCOUNT_KEY = os.getenv("AZURE_STORAGE_KEY")
 
-if CONN_STR:
-    _blob_service = BlobServiceClient.from_connection_string(CONN_STR)
-elif ACCOUNT and ACCOUNT_KEY:
-    _blob_service = BlobServiceClient(
-        account_url=f"https://{ACCOUNT}.blob.core.windows.net",
-        credential=ACCOUNT_KEY,
-    )
-else:
-    raise RuntimeError(
-        "Azure Storage credentials not found. "
-        "Set AZURE_STORAGE_CONNECTION_STRING OR (AZURE_STORAGE_ACCOUNT + AZURE_STORAGE_KEY) in .env"
-    )
+_blob_service: Optional[BlobServiceClient] = None
+_blob_service_lock = threading.Lock()
+
+def _get_blob_service() -> BlobServiceClient:
+    global _blob_service
+    if _blob_service is not None:
+        return _blob_service
+    with _blob_service_lock:
+        if _blob_service is None:
+            if CONN_STR:
+                _blob_service = BlobServiceClient.from_connection_string(CONN_STR)
+            elif ACCOUNT and ACCOUNT_KEY:
+                _blob_service = BlobServiceClient(
+                    account_url=f"https://{ACCOUNT}.blob.core.windows.net",
+                    credential=ACCOUNT_KEY,
+                )
+            else:
+                raise RuntimeError(
+                    "Azure Storage credentials not found. "
+                    "Set AZURE_STORAGE_CONNECTION_STRING OR (AZURE_STORAGE_ACCOUNT + AZURE_STORAGE_KEY) in .env"
+                )
+    return _blob_service
 
 # =========[ 2) أسماء الكونتينرات من .env (مع قيم افتراضية) ]=========
 CONTAINER_INBOX        = os.getenv("AZ_BLOB_INBOX", "inbox")
@@ -36,6 +53,11 @@ CONTAINER_SORTED       = os.getenv("AZ_BLOB_SORTED", "sorted")              # ا
 CONTAINER_LEGISLATION  = os.getenv("AZ_BLOB_LEGISLATION", "legislation")
 CONTAINER_UNCLASSIFIED = os.getenv("AZ_BLOB_UNCLASSIFIED", "unclassified")  # جديد
 
+# الرفع المتدفق: حجم الكتلة وعدد الكتل المرفوعة بالتوازي (الذاكرة ≈ الحجم × (التوازي + 1))
+UPLOAD_BLOCK_SIZE      = int(os.getenv("AZ_BLOB_BLOCK_SIZE", str(8 * 1024 * 1024)))
+UPLOAD_MAX_CONCURRENCY = int(os.getenv("AZ_BLOB_MAX_CONCURRENCY", "4"))
+COPY_TIMEOUT_SEC       = float(os.getenv("AZ_BLOB_COPY_TIMEOUT", "300"))
+
 REQUIRED_CONTAINERS = [
     CONTAINER_INBOX,
     CONTAINER_SORTED,
@@ -43,16 +65,34 @@ REQUIRED_CONTAINERS = [
     CONTAINER_UNCLASSIFIED,
 ]
 
+# الكونتينرات التي تأكدنا من وجودها في هذه العملية (لا نعيد طلب الإنشاء لكل رفع)
+_known_containers: set = set()
+_known_containers_lock = threading.Lock()
+
 # =========[ 3) دوال مساعدة ]=========
 def ensure_container(name: str) -> None:
-    """ينشئ الكونتينر إذا لم يكن موجودًا. لا يرمي خطأ إن كان موجود."""
+    """ينشئ الكونتينر إذا لم يكن موجودًا. لا يرمي خطأ إن كان موجود. طلب شبكة واحد على الأكثر لكل عملية."""
+    if name in _known_containers:
+        return
     try:
-        _blob_service.create_container(name)
+        _get_blob_service().create_container(name)
     except ResourceExistsError:
         pass
+    with _known_containers_lock:
+        _known_containers.add(name)
+
+def forget_container(name: str) -> None:
+    """يُسقط الكونتينر من الذاكرة (مثلاً إن حُذف من خارج التطبيق) ليُعاد إنشاؤه عند الحاجة."""
+    with _known_containers_lock:
+        _known_containers.discard(name)
+
+def ensure_required_containers() -> None:
+    """تهيئة مسبقة اختيارية (مثلاً عند بدء التطبيق) بدل الإنشاء عند أول رفع."""
+    for c in REQUIRED_CONTAINERS:
+        ensure_container(c)
 
 def get_container_client(name: str):
-    return _blob_service.get_container_client(name)
+    return _get_blob_service().get_container_client(name)
 
 def _guess_content_type(filename: str) -> str:
     ctype, _ = mimetypes.guess_type(filename)
@@ -73,28 +113,201 @@ def upload_bytes(
     if content_type is None:
         content_type = _guess_content_type(blob_name)
     cs = ContentSettings(content_type=content_type)
-    cc.upload_blob(name=blob_name, data=data, overwrite=True, content_settings=cs)
+    _retry_missing_container(
+        container, lambda: cc.upload_blob(name=blob_name, data=data, overwrite=True, content_settings=cs)
+    )
+    return f"{container}/{blob_name}"
+
+def _retry_missing_container(container: str, call: Callable[[], T]) -> T:
+    """ينفّذ call؛ إن كان الكونتينر قد حُذف بعد أن سجّلناه كموجود نعيد إنشاءه ونحاول مرة واحدة."""
+    try:
+        return call()
+    except ResourceNotFoundError:
+        forget_container(container)
+        ensure_container(container)
+        return call()
+
+def _block_id(i: int) -> str:
+    # كل معرّفات الكتل في الـ blob يجب أن تكون بنفس الطول
+    return base64.b64encode(f"{i:08d}".encode()).decode()
+
+def _iter_blocks(source: Union[BinaryIO, Iterable[bytes]], block_size: int) -> Iterator[bytes]:
+    """يقسم ملفًا أو مُكرِّرًا من المقاطع إلى كتل بحجم ثابت (الأخيرة قد تكون أصغر)."""
+    if hasattr(source, "read"):
+        while True:
+            chunk = source.read(block_size)
+            if not chunk:
+                return
+            yield chunk
+    buf = bytearray()
+    for chunk in source:
+        buf += chunk
+        while len(buf) >= block_size:
+            yield bytes(buf[:block_size])
+            del buf[:block_size]
+    if buf:
+        yield bytes(buf)
+
+def upload_stream(
+    container: str,
+    blob_name: str,
+    source: Union[BinaryIO, Iterable[bytes]],
+    content_type: Optional[str] = None,
+    block_size: int = UPLOAD_BLOCK_SIZE,
+    max_concurrency: int = UPLOAD_MAX_CONCURRENCY,
+) -> str:
+    """
+    يرفع من ملف (file-like) أو مُكرِّر مقاطع دون تحميل الملف كاملًا في الذاكرة:
+    stage_block بتوازٍ محدود ثم commit_block_list. الذروة ≈ block_size × (max_concurrency + 1).
+    """
+    ensure_container(container)
+    blob = get_container_client(container).get_blob_client(blob_name)
+    cs = ContentSettings(content_type=content_type or _guess_content_type(blob_name))
+
+    blocks = _iter_blocks(source, block_size)
+    first = next(blocks, b"")
+    second = next(blocks, None)
+    if second is None:
+        # ملف صغير (كتلة واحدة): رفع مباشر بطلب واحد
+        _retry_missing_container(container, lambda: blob.upload_blob(first, overwrite=True, content_settings=cs))
+        return f"{container}/{blob_name}"
+
+    slots = threading.BoundedSemaphore(max_concurrency)
+    failed = threading.Event()  # أول كتلة تفشل توقف الباقي: لا قراءة ولا رفع لكتل جديدة
+    ids = []
+    futures = []
+
+    def stage(block_id: str, data: bytes) -> None:
+        try:
+            if not failed.is_set():
+                _retry_missing_container(container, lambda: blob.stage_block(block_id=block_id, data=data))
+        except BaseException:
+            failed.set()
+            raise
+        finally:
+            slots.release()
+
+    with ThreadPoolExecutor(max_workers=max_concurrency) as pool:
+        try:
+            for i, data in enumerate(_chain_first(first, second, blocks)):
+                slots.acquire()  # لا نقرأ كتلة جديدة قبل أن يتحرر مكان
+                if failed.is_set():
+                    break
+                ids.append(_block_id(i))
+                futures.append(pool.submit(stage, ids[-1], data))
+            for f in futures:
+                f.result()
+        except BaseException:
+            failed.set()
+            for f in futures:
+                f.cancel()
+            raise
+
+    _retry_missing_container(
+        container, lambda: blob.commit_block_list([BlobBlock(block_id=b) for b in ids], content_settings=cs)
+    )
+    return f"{container}/{blob_name}"
+
+def _chain_first(first: bytes, second: bytes, rest: Iterator[bytes]) -> Iterator[bytes]:
+    yield first
+    yield second
+    yield from rest
+
+async def upload_async_iter(
+    container: str,
+    blob_name: str,
+    chunks: AsyncIterator[bytes],
+    content_type: Optional[str] = None,
+    block_size: int = UPLOAD_BLOCK_SIZE,
+    max_concurrency: int = UPLOAD_MAX_CONCURRENCY,
+) -> str:
+    """
+    مثل upload_stream لكن من مُكرِّر غير متزامن (مثلاً جسم طلب HTTP يُقرأ مقطعًا مقطعًا).
+    النداءات المتزامنة للعميل تُنفَّذ في threads حتى لا تُحجب حلقة الأحداث.
+    """
+    await asyncio.to_thread(ensure_container, container)
+    blob = get_container_client(container).get_blob_client(blob_name)
+    cs = ContentSettings(content_type=content_type or _guess_content_type(blob_name))
+
+    slots = asyncio.Semaphore(max_concurrency)
+    tasks = []
+    ids = []
+
+    def stage_sync(block_id: str, data: bytes) -> None:
+        _retry_missing_container(container, lambda: blob.stage_block(block_id=block_id, data=data))
+
+    async def stage(block_id: str, data: bytes) -> None:
+        try:
+            await asyncio.to_thread(stage_sync, block_id, data)
+        finally:
+            slots.release()
+
+    async def submit(data: bytes) -> None:
+        await slots.acquire()
+        for t in tasks:
+            if t.done() and not t.cancelled() and t.exception() is not None:
+                slots.release()
+                raise t.exception()  # كتلة سابقة فشلت → نتوقف قبل قراءة/رفع المزيد
+        ids.append(_block_id(len(ids)))
+        tasks.append(asyncio.create_task(stage(ids[-1], data)))
+
+    buf = bytearray()
+    try:
+        async for chunk in chunks:
+            buf += chunk
+            while len(buf) >= block_size:
+                await submit(bytes(buf[:block_size]))
+                del buf[:block_size]
+        if buf or not ids:
+            await submit(bytes(buf))
+        await asyncio.gather(*tasks)
+    except BaseException:
+        for t in tasks:
+            t.cancel()
+        raise
+
+    await asyncio.to_thread(
+        _retry_missing_container,
+        container,
+        lambda: blob.commit_block_list([BlobBlock(block_id=b) for b in ids], content_settings=cs),
+    )
     return f"{container}/{blob_name}"
 
-def copy_within_account(src_container: str, src_blob: str, dst_container: str, dst_blob: str) -> None:
+def copy_within_account(
+    src_container: str,
+    src_blob: str,
+    dst_container: str,
+    dst_blob: str,
+    wait: bool = False,
+) -> None:
     """
-    ينسخ Blob داخل نفس الحساب.
+    ينسخ Blob داخل نفس الحساب (نسخ من جهة الخادم، لا تمر البيانات عبر هذا الخادم).
     ملاحظة: المجلدات في Blob هي مجرد بادئات أسماء (virtual folders).
+    wait=True ينتظر اكتمال النسخ (ضروري قبل حذف المصدر).
     """
     ensure_container(dst_container)
     src_client = get_container_client(src_container).get_blob_client(src_blob)
     dst_client = get_container_client(dst_container).get_blob_client(dst_blob)
     src_url = src_client.url
-    dst_client.start_copy_from_url(src_url)
+    copy = dst_client.start_copy_from_url(src_url)
+    if not wait or copy.get("copy_status") == "success":
+        return
+    deadline = time.monotonic() + COPY_TIMEOUT_SEC
+    delay = 0.2
+    while time.monotonic() < deadline:
+        status = dst_client.get_blob_properties().copy.status
+        if status == "success":
+            return
+        if status in ("failed", "aborted"):
+            raise RuntimeError(f"Server-side copy {src_container}/{src_blob} → {dst_container}/{dst_blob}: {status}")
+        time.sleep(delay)
+        delay = min(delay * 2, 5.0)
+    raise TimeoutError(f"Server-side copy did not finish within {COPY_TIMEOUT_SEC:.0f}s")
 
 def delete_blob(container: str, blob_name: str) -> None:
     get_container_client(container).delete_blob(blob_name, delete_snapshots="include")
 
-# =========[ 4) إنشاء الكونتينرات المطلوبة عند تحميل الموديول ]=========
-for c in REQUIRED_CONTAINERS:
-    ensure_container(c)
-
-# =========[ 5) واجهات سهلة الاستعمال للكود الآخر ]=========
+# =========[ 4) واجهات سهلة الاستعمال للكود الآخر ]=========
 def _unique_name(original_filename: str) -> str:
     """يولّد اسمًا فريدًا بسيطًا لتفادي التصادم (اختياري)."""
     base = original_filename.strip().replace("\\", "/").split("/")[-1]
@@ -102,17 +315,21 @@ def _unique_name(original_filename: str) -> str:
     return f"{uid}_{base}"
 
 def save_temp(
-    content: bytes,
+    content: Union[bytes, BinaryIO],
     filename: str,
     container: str = CONTAINER_INBOX,
     keep_original_name: bool = True,
 ) -> str:
     """
     يحفظ ملف مؤقت (مثلاً المرفوع للتصنيف) داخل inbox.
+    يقبل bytes أو ملفًا (file-like) يُرفع بالتدفق على كتل.
     يرجع اسم الـ blob (بدون الدليل الكامل للحساب).
     """
     blob_name = filename if keep_original_name else _unique_name(filename)
-    upload_bytes(container, blob_name, content)
+    if isinstance(content, (bytes, bytearray)):
+        upload_bytes(container, blob_name, content)
+    else:
+        upload_stream(container, blob_name, content)
     return blob_name
 
 def move_from_inbox_to_path(
@@ -122,11 +339,7 @@ def move_from_inbox_to_path(
 ) -> None:
     """
     يحرك blob من inbox إلى مسار وجهة (داخل كونتينر آخر أو نفس الكونتينر).
-    أسهل طريقة: نقرأ ثم نرفع ثم نحذف.
+    نسخ من جهة الخادم ثم حذف المصدر؛ لا تنزيل ولا إعادة رفع.
     """
-    inbox_cc   = get_container_client(CONTAINER_INBOX)
-    src_client = inbox_cc.get_blob_client(temp_blob_name)
-    data       = src_client.download_blob().readall()
-
-    upload_bytes(dst_container, dst_blob_path, data)
+    copy_within_account(CONTAINER_INBOX, temp_blob_name, dst_container, dst_blob_path, wait=True)
     delete_blob(CONTAINER_INBOX, temp_blob_name)
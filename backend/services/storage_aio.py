@@ -0,0 +1,268 @@
+# services/storage_aio.py
+from __future__ import annotations
+
+import asyncio
+import os
+import time
+from typing import AsyncIterator, Awaitable, Callable, Dict, Optional, TypeVar, Union
+
+import aiohttp
+from azure.core.exceptions import ResourceExistsError, ResourceNotFoundError
+from azure.core.pipeline.transport import AioHttpTransport
+from azure.storage.blob import BlobBlock, ContentSettings
+from azure.storage.blob.aio import BlobServiceClient
+
+from services.storage import (
+    ACCOUNT,
+    ACCOUNT_KEY,
+    CONN_STR,
+    CONTAINER_INBOX,
+    COPY_TIMEOUT_SEC,
+    UPLOAD_BLOCK_SIZE,
+    UPLOAD_MAX_CONCURRENCY,
+    _block_id,
+    _guess_content_type,
+    _known_containers,
+    _known_containers_lock,
+    forget_container,
+)
+
+T = TypeVar("T")
+
+# =========[ عميل Blob غير متزامن مشترك ]=========
+# عميل واحد لكل العملية يُفتح في lifespan التطبيق؛ كل الطلبات تتشارك مجمع اتصالات aiohttp نفسه،
+# فيتوسع الرفع المتزامن بعدد الاتصالات بدل حجب حلقة الأحداث.
+POOL_SIZE          = int(os.getenv("AZ_BLOB_POOL_SIZE", "64"))
+POOL_SIZE_PER_HOST = int(os.getenv("AZ_BLOB_POOL_SIZE_PER_HOST", "0"))  # 0 = بلا حد لكل مضيف
+
+_service: Optional[BlobServiceClient] = None
+_session: Optional[aiohttp.ClientSession] = None
+_service_lock = asyncio.Lock()
+
+
+def _build_service(session: aiohttp.ClientSession) -> BlobServiceClient:
+    transport = AioHttpTransport(session=session, session_owner=False)
+    if CONN_STR:
+        return BlobServiceClient.from_connection_string(CONN_STR, transport=transport)
+    if ACCOUNT and ACCOUNT_KEY:
+        return BlobServiceClient(
+            account_url=f"https://{ACCOUNT}.blob.core.windows.net",
+            credential=ACCOUNT_KEY,
+            transport=transport,
+        )
+    raise RuntimeError(
+        "Azure Storage credentials not found. "
+        "Set AZURE_STORAGE_CONNECTION_STRING OR (AZURE_STORAGE_ACCOUNT + AZURE_STORAGE_KEY) in .env"
+    )
+
+
+async def open_async_storage() -> BlobServiceClient:
+    """يفتح العميل المشترك ومجمع الاتصالات (يُستدعى من lifespan؛ آمن للاستدعاء المتكرر)."""
+    global _service, _session
+    async with _service_lock:
+        if _service is None:
+            session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=POOL_SIZE, limit_per_host=POOL_SIZE_PER_HOST)
+            )
+            try:
+                _service = _build_service(session)
+            except Exception:
+                await session.close()
+                raise
+            _session = session
+        return _service
+
+
+async def close_async_storage() -> None:
+    """يغلق العميل ومجمع الاتصالات عند إيقاف التطبيق."""
+    global _service, _session
+    async with _service_lock:
+        if _service is not None:
+            await _service.close()
+            _service = None
+        if _session is not None:
+            await _session.close()
+            _session = None
+
+
+async def get_async_service() -> BlobServiceClient:
+    # خارج lifespan (سكربتات/اختبارات يدوية) يُفتح كسولًا عند أول استخدام
+    return _service if _service is not None else await open_async_storage()
+
+
+# =========[ عمليات التخزين ]=========
+async def ensure_container_async(name: str) -> None:
+    """مثل storage.ensure_container ويتشارك معه ذاكرة الكونتينرات المعروفة."""
+    if name in _known_containers:
+        return
+    svc = await get_async_service()
+    try:
+        await svc.create_container(name)
+    except ResourceExistsError:
+        pass
+    with _known_containers_lock:
+        _known_containers.add(name)
+
+
+async def upload_async(
+    container: str,
+    blob_name: str,
+    source: Union[bytes, AsyncIterator[bytes]],
+    content_type: Optional[str] = None,
+    block_size: int = UPLOAD_BLOCK_SIZE,
+    max_concurrency: int = UPLOAD_MAX_CONCURRENCY,
+    metadata: Optional[Dict[str, str]] = None,
+) -> str:
+    """
+    يرفع bytes أو مُكرِّرًا غير متزامن من المقاطع.
+    كتلة واحدة → upload_blob بطلب واحد؛ أكثر → stage_block بتوازٍ محدود ثم commit_block_list.
+    metadata تُكتب مع الـ blob (مثلاً بصمة المحتوى التي يتحقق منها dedup).
+    """
+    await ensure_container_async(container)
+    svc = await get_async_service()
+    blob = svc.get_blob_client(container, blob_name)
+    cs = ContentSettings(content_type=content_type or _guess_content_type(blob_name))
+
+    if isinstance(source, (bytes, bytearray)):
+        source = _single(bytes(source))
+
+    slots = asyncio.Semaphore(max_concurrency)
+    tasks = []
+    ids = []
+    pending: Optional[bytes] = None  # نؤجل الكتلة الأولى لنعرف إن كان الملف كتلة واحدة
+
+    async def stage(block_id: str, data: bytes) -> None:
+        try:
+            await _retry_missing_container(container, lambda: blob.stage_block(block_id=block_id, data=data))
+        finally:
+            slots.release()
+
+    async def submit(data: bytes) -> None:
+        await slots.acquire()
+        for t in tasks:
+            if t.done() and not t.cancelled() and t.exception() is not None:
+                slots.release()
+                raise t.exception()  # كتلة سابقة فشلت → نتوقف قبل قراءة/رفع المزيد
+        ids.append(_block_id(len(ids)))
+        tasks.append(asyncio.create_task(stage(ids[-1], data)))
+
+    async def push(data: bytes) -> None:
+        nonlocal pending
+        if pending is not None:
+            await submit(pending)
+        pending = data
+
+    buf = bytearray()
+    try:
+        async for chunk in source:
+            buf += chunk
+            while len(buf) >= block_size:
+                await push(bytes(buf[:block_size]))
+                del buf[:block_size]
+        if buf:
+            await push(bytes(buf))
+
+        if not ids:
+            await _retry_missing_container(
+                container, lambda: blob.upload_blob(
+                    pending or b"", overwrite=True, content_settings=cs, metadata=metadata
+                )
+            )
+            return f"{container}/{blob_name}"
+
+        await submit(pending)
+        await asyncio.gather(*tasks)
+    except BaseException:
+        for t in tasks:
+            t.cancel()
+        raise
+
+    await _retry_missing_container(
+        container, lambda: blob.commit_block_list(
+            [BlobBlock(block_id=b) for b in ids], content_settings=cs, metadata=metadata
+        )
+    )
+    return f"{container}/{blob_name}"
+
+
+async def _retry_missing_container(container: str, call: Callable[[], Awaitable[T]]) -> T:
+    """مثل storage._retry_missing_container: الكونتينر حُذف بعد أن سجّلناه كموجود → ننشئه ونحاول مرة واحدة."""
+    try:
+        return await call()
+    except ResourceNotFoundError:
+        forget_container(container)
+        await ensure_container_async(container)
+        return await call()
+
+
+async def _single(data: bytes) -> AsyncIterator[bytes]:
+    yield data
+
+
+async def copy_within_account_async(
+    src_container: str,
+    src_blob: str,
+    dst_container: str,
+    dst_blob: str,
+    wait: bool = False,
+) -> None:
+    """نسخ من جهة الخادم داخل نفس الحساب؛ wait=True ينتظر الاكتمال (ضروري قبل حذف المصدر)."""
+    await ensure_container_async(dst_container)
+    svc = await get_async_service()
+    src_url = svc.get_blob_client(src_container, src_blob).url
+    dst_client = svc.get_blob_client(dst_container, dst_blob)
+    copy = await dst_client.start_copy_from_url(src_url)
+    if not wait or copy.get("copy_status") == "success":
+        return
+    deadline = time.monotonic() + COPY_TIMEOUT_SEC
+    delay = 0.2
+    while time.monotonic() < deadline:
+        status = (await dst_client.get_blob_properties()).copy.status
+        if status == "success":
+            return
+        if status in ("failed", "aborted"):
+            raise RuntimeError(f"Server-side copy {src_container}/{src_blob} → {dst_container}/{dst_blob}: {status}")
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, 5.0)
+    raise TimeoutError(f"Server-side copy did not finish within {COPY_TIMEOUT_SEC:.0f}s")
+
+
+async def blob_exists_async(container: str, blob_name: str) -> bool:
+    svc = await get_async_service()
+    return await svc.get_blob_client(container, blob_name).exists()
+
+
+async def blob_metadata_async(container: str, blob_name: str) -> Optional[Dict[str, str]]:
+    """metadata الـ blob (طلب HEAD واحد)، أو None إن لم يكن موجودًا."""
+    svc = await get_async_service()
+    try:
+        props = await svc.get_blob_client(container, blob_name).get_blob_properties()
+    except ResourceNotFoundError:
+        return None
+    return dict(props.metadata or {})
+
+
+async def delete_blob_async(container: str, blob_name: str) -> None:
+    svc = await get_async_service()
+    await svc.get_blob_client(container, blob_name).delete_blob(delete_snapshots="include")
+
+
+async def save_temp_async(
+    content: Union[bytes, AsyncIterator[bytes]],
+    filename: str,
+    container: str = CONTAINER_INBOX,
+    metadata: Optional[Dict[str, str]] = None,
+) -> str:
+    """مثل storage.save_temp (بالاسم الأصلي) لكن دون حجب حلقة الأحداث."""
+    await upload_async(container, filename, content, metadata=metadata)
+    return filename
+
+
+async def move_from_inbox_to_path_async(
+    temp_blob_name: str,
+    dst_blob_path: str,
+    dst_container: str,
+) -> None:
+    """نسخ من جهة الخادم من inbox إلى الوجهة ثم حذف المصدر."""
+    await copy_within_account_async(CONTAINER_INBOX, temp_blob_name, dst_container, dst_blob_path, wait=True)
+    await delete_blob_async(CONTAINER_INBOX, temp_blob_name)
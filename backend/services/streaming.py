@@ -0,0 +1,29 @@
+# services/streaming.py
+from __future__ import annotations
+
+import json
+from typing import Any, Dict, Iterable, Iterator
+
+# رؤوس تمنع التخزين المؤقت/التجميع في الوسطاء (nginx وغيره) حتى تصل المقاطع فورًا
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "X-Accel-Buffering": "no",
+}
+
+
+def sse_event(event: str, payload: Dict[str, Any]) -> str:
+    """يصوغ حدث Server-Sent Events واحدًا."""
+    return f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+
+def sse_stream(events: Iterable[Dict[str, Any]]) -> Iterator[str]:
+    """
+    يحوّل أحداثًا على شكل {"event": name, ...} إلى نص SSE.
+    أي استثناء أثناء البث يُرسل كحدث error بدل قطع الاتصال بصمت.
+    """
+    try:
+        for ev in events:
+            name = ev.get("event", "message")
+            yield sse_event(name, {k: v for k, v in ev.items() if k != "event"})
+    except Exception as e:
+        yield sse_event("error", {"error": str(e)})
@@ -0,0 +1,159 @@
+# services/structured_output.py
+from __future__ import annotations
+
+import json
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+# محارف غير مرئية تظهر أحيانًا في مخرجات النماذج العربية
+_INVISIBLE = dict.fromkeys(map(ord, "\ufeff\u200b\u200e\u200f\u202a\u202b\u202c\u2066\u2067\u2068\u2069"), None)
+_FENCE_RE = re.compile(r"```(?:json)?\s*([\s\S]+?)\s*(?:```|$)", re.IGNORECASE)
+# قيمة حرفية مقطوعة في آخر النص (tru، fals، nu...) بعد ":" أو "[" أو ","
+_PARTIAL_LITERAL_RE = re.compile(r"(?<=[:\[,])(\s*)(t|tr|tru|f|fa|fal|fals|n|nu|nul)$")
+_LITERALS = ("true", "false", "null")
+
+
+def _strip_wrappers(text: str) -> str:
+    """يزيل أسوار Markdown والمحارف غير المرئية وأي نص قبل أول قوس."""
+    s = (text or "").translate(_INVISIBLE).strip()
+    m = _FENCE_RE.search(s)
+    if m:
+        s = m.group(1).strip()
+    starts = [i for i in (s.find("{"), s.find("[")) if i >= 0]
+    if starts:
+        s = s[min(starts):]
+    return s
+
+
+def _close_truncated(s: str) -> Tuple[str, List[int]]:
+    """
+    يمرّ على النص مرة واحدة: يحذف الفواصل الزائدة قبل الأقواس، ويكمل قيمة حرفية مقطوعة،
+    ويغلق النص/الأقواس المفتوحة عند الانقطاع. يعيد أيضًا نقاط القطع (مواضع الفواصل، وما بعد
+    كل قوس فتح، خارج النصوص) لاستخدامها عند فشل المحاولة الأولى.
+    """
+    out: List[str] = []
+    stack: List[str] = []
+    cuts: List[int] = []
+    in_str = False
+    esc = False
+    i, n = 0, len(s)
+    while i < n:
+        ch = s[i]
+        if in_str:
+            out.append(ch)
+            if esc:
+                esc = False
+            elif ch == "\\":
+                esc = True
+            elif ch == '"':
+                in_str = False
+            i += 1
+            continue
+        if ch == '"':
+            in_str = True
+        elif ch in "{[":
+            stack.append("}" if ch == "{" else "]")
+            cuts.append(i + 1)
+        elif ch in "}]":
+            if stack:
+                stack.pop()
+            # نحذف فاصلة معلّقة قبل القوس
+            while out and out[-1].isspace():
+                out.pop()
+            if out and out[-1] == ",":
+                out.pop()
+        elif ch == ",":
+            cuts.append(i)
+        out.append(ch)
+        i += 1
+        if not stack and out and out[-1] in "}]":
+            break  # تجاهل أي ذيل بعد انتهاء الكائن الجذري
+
+    if in_str:
+        if esc:
+            out.pop()
+        out.append('"')
+    tail = "".join(out).rstrip()
+    m = _PARTIAL_LITERAL_RE.search(tail)
+    if m:
+        literal = next(lit for lit in _LITERALS if lit.startswith(m.group(2)))
+        tail = tail[: m.start(2)] + literal
+    while tail and tail[-1] in ",:":
+        tail = tail[:-1].rstrip()
+    return tail + "".join(reversed(stack)), cuts
+
+
+def repair_json(text: str, max_cuts: int = 8) -> Tuple[Optional[Any], str]:
+    """
+    يحوّل مخرجات النموذج إلى JSON بأقل تدخل ممكن.
+    يعيد (القيمة، المسار) حيث المسار أحد: "clean" | "repaired" | "failed".
+    """
+    if not text or not text.strip():
+        return None, "failed"
+    try:
+        return json.loads(text), "clean"
+    except json.JSONDecodeError:
+        pass
+
+    s = _strip_wrappers(text)
+    try:
+        return json.loads(s), "clean"
+    except json.JSONDecodeError:
+        pass
+
+    fixed, cuts = _close_truncated(s)
+    try:
+        return json.loads(fixed), "repaired"
+    except json.JSONDecodeError:
+        pass
+
+    # انقطاع داخل مفتاح/قيمة: نقص عند آخر فاصلة (أو قوس فتح) سليمة ونعيد الإغلاق
+    for cut in list(reversed(cuts))[:max_cuts]:
+        candidate, _ = _close_truncated(s[:cut])
+        try:
+            return json.loads(candidate), "repaired"
+        except json.JSONDecodeError:
+            continue
+    return None, "failed"
+
+
+# ---------- التحقق من المخطط (مجموعة جزئية من JSON Schema) ----------
+def validate(value: Any, schema: Dict[str, Any], path: str = "$") -> List[str]:
+    """
+    يتحقق من type/enum/required/properties/items ويعيد قائمة بالمشكلات (فارغة = صالح).
+    """
+    problems: List[str] = []
+    types = schema.get("type")
+    if types is not None:
+        allowed = types if isinstance(types, list) else [types]
+        if not any(_is_type(value, t) for t in allowed):
+            return [f"{path}: expected {'|'.join(allowed)}"]
+    if "enum" in schema and value not in schema["enum"]:
+        problems.append(f"{path}: not in {schema['enum']}")
+    if isinstance(value, dict):
+        for key in schema.get("required", []):
+            if key not in value:
+                problems.append(f"{path}.{key}: missing")
+        for key, sub in (schema.get("properties") or {}).items():
+            if key in value:
+                problems.extend(validate(value[key], sub, f"{path}.{key}"))
+    if isinstance(value, list) and "items" in schema:
+        for i, item in enumerate(value):
+            problems.extend(validate(item, schema["items"], f"{path}[{i}]"))
+    return problems
+
+
+def _is_type(value: Any, t: str) -> bool:
+    if t == "object":
+        return isinstance(value, dict)
+    if t == "array":
+        return isinstance(value, list)
+    if t == "string":
+        return isinstance(value, str)
+    if t == "number":
+        return isinstance(value, (int, float)) and not isinstance(value, bool)
+    if t == "null":
+        return value is None
+    if t == "boolean":
+        return isinstance(value, bool)
+    return True
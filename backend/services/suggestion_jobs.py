@@ -0,0 +1,150 @@
+# services/suggestion_jobs.py
+from __future__ import annotations
+
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# عدد الاقتراحات التي تُولَّد بالتوازي (كل اقتراح = 1–3 نداءات للنموذج)
+SUGGESTION_CONCURRENCY = int(os.getenv("SUGGESTION_CONCURRENCY", "3"))
+# بدء توليد الاقتراحات تلقائيًا عند اكتمال مقارنات كل صف
+AUTO_SUGGEST = os.getenv("AUTO_SUGGEST", "0").lower() in {"1", "true", "yes", "on"}
+# مهام تُحفظ حالة صفوفها في الذاكرة؛ الأقدم التي لا صفوف جارية لها تُحذف (حالتها تُقرأ من القرص بعدها)
+SUGGESTION_STATUS_KEEP = int(os.getenv("SUGGESTION_STATUS_KEEP", "200"))
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+# حالة كل صف: queued | running | completed | failed | cancelled
+_row_status: "OrderedDict[str, Dict[int, Dict[str, Any]]]" = OrderedDict()
+_status_lock = threading.Lock()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=SUGGESTION_CONCURRENCY, thread_name_prefix="suggest-bulk")
+        return _executor
+
+
+def suggestion_path(data_dir: Path, job_id: str, article_index: int) -> Path:
+    return data_dir / f"suggestion_{job_id}_{article_index}.json"
+
+
+def load_suggestion(data_dir: Path, job_id: str, article_index: int) -> Optional[Dict[str, Any]]:
+    """يعيد الاقتراح المحفوظ للصف إن وُجد."""
+    p = suggestion_path(data_dir, job_id, article_index)
+    if not p.exists():
+        return None
+    try:
+        return json.loads(p.read_text("utf-8"))
+    except (OSError, json.JSONDecodeError):
+        logger.warning("Stored suggestion %s is unreadable; ignoring it.", p.name)
+        return None
+
+
+def store_suggestion(data_dir: Path, job_id: str, article_index: int, result: Dict[str, Any]) -> None:
+    """كتابة ذرّية: ملف مؤقت ثم replace حتى لا يقرأ المستطلِع ملفًا نصف مكتوب."""
+    p = suggestion_path(data_dir, job_id, article_index)
+    tmp = p.with_name(f"{p.name}.{threading.get_ident()}.tmp")
+    tmp.write_text(json.dumps(result, ensure_ascii=False), encoding="utf-8")
+    os.replace(tmp, p)
+
+
+def _job_rows(job_id: str) -> Dict[int, Dict[str, Any]]:
+    """صفوف المهمة في الذاكرة (تحت _status_lock)، مع حذف أقدم المهام الخاملة فوق SUGGESTION_STATUS_KEEP."""
+    rows = _row_status.get(job_id)
+    if rows is None:
+        rows = _row_status[job_id] = {}
+        idle = [
+            k for k, v in _row_status.items()
+            if k != job_id and not any(e["status"] in ("queued", "running") for e in v.values())
+        ]
+        for old in idle[: max(0, len(_row_status) - SUGGESTION_STATUS_KEEP)]:
+            del _row_status[old]
+    return rows
+
+
+def _set_status(job_id: str, article_index: int, state: str, error: Optional[str] = None) -> None:
+    with _status_lock:
+        entry: Dict[str, Any] = {"status": state}
+        if error:
+            entry["error"] = error
+        _job_rows(job_id)[article_index] = entry
+
+
+def submit_rows(
+    data_dir: Path,
+    job_id: str,
+    article_indexes: Iterable[int],
+    worker: Callable[[int], Dict[str, Any]],
+    force: bool = False,
+) -> Dict[str, List[int]]:
+    """
+    يجدول توليد الاقتراحات للصفوف المطلوبة في الخلفية بتوازٍ محدود.
+    worker(article_index) يولّد الاقتراح ويعيده؛ التخزين يتم هنا.
+    لا يُعاد توليد صف محفوظ أو قيد التنفيذ إلا مع force=True.
+    """
+    queued: List[int] = []
+    skipped: List[int] = []
+    for idx in article_indexes:
+        with _status_lock:
+            rows = _job_rows(job_id)
+            current = rows.get(idx, {}).get("status")
+            if current in ("queued", "running") or (
+                not force and suggestion_path(data_dir, job_id, idx).exists()
+            ):
+                skipped.append(idx)
+                continue
+            rows[idx] = {"status": "queued"}
+        _get_executor().submit(_run_row, data_dir, job_id, idx, worker)
+        queued.append(idx)
+    return {"queued": queued, "skipped": skipped}
+
+
+def cancel_rows(job_id: str) -> List[int]:
+    """يلغي صفوف المهمة التي لم تبدأ بعد ويعيد فهارسها؛ الصفوف الجارية تكتمل."""
+    with _status_lock:
+        rows = _row_status.get(job_id, {})
+        cancelled = [idx for idx, e in rows.items() if e["status"] == "queued"]
+        for idx in cancelled:
+            rows[idx] = {"status": "cancelled"}
+    return cancelled
+
+
+def _run_row(data_dir: Path, job_id: str, article_index: int, worker: Callable[[int], Dict[str, Any]]) -> None:
+    with _status_lock:
+        entry = _job_rows(job_id).get(article_index)
+        if entry is None or entry["status"] != "queued":
+            return  # أُلغي قبل أن يبدأ
+        entry["status"] = "running"
+    try:
+        result = worker(article_index)
+        store_suggestion(data_dir, job_id, article_index, result)
+        _set_status(job_id, article_index, "completed")
+        logger.info(f"Job [{job_id}] - Suggestion ready for Article #{article_index + 1}.")
+    except Exception as e:
+        logger.error(f"Job [{job_id}] - Suggestion failed for Article #{article_index + 1}: {e}")
+        _set_status(job_id, article_index, "failed", str(e))
+
+
+def job_suggestion_status(data_dir: Path, job_id: str, total_rows: int) -> List[Dict[str, Any]]:
+    """حالة كل صف: من الذاكرة إن كان مجدولًا في هذه العملية، وإلا من القرص."""
+    with _status_lock:
+        known = dict(_row_status.get(job_id, {}))
+    rows: List[Dict[str, Any]] = []
+    for idx in range(total_rows):
+        entry = dict(known.get(idx) or {})
+        if not entry:
+            entry["status"] = "completed" if suggestion_path(data_dir, job_id, idx).exists() else "not_requested"
+        entry["article_index"] = idx
+        rows.append(entry)
+    return rows
@@ -1,13 +1,21 @@
 # services/suggestions.py
 from __future__ import annotations
 
+import contextvars
 import json
 import logging
-import re
-from typing import Any, Dict, List, Optional
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import ExitStack
+from typing import Any, Dict, Generator, Iterator, List, Optional, Tuple
 
 from google.generativeai import GenerativeModel
 
+from . import metrics, scheduler
+from .structured_output import repair_json, validate
+
 logger = logging.getLogger(__name__)
 
 # نحاول استيراد البحث المعمّق (اختياري). لو غير متاح، نكمل من دونه.
@@ -16,24 +24,37 @@ try:
 except Exception:  # pragma: no cover
     deepsearch_execute = None
 
+# تشغيل جلب أدلة البحث المعمّق بالتوازي مع التمريرة الأولى (بدل انتظار نتيجتها)
+SPECULATIVE_DEEPSEARCH = os.getenv("SUGGESTION_SPECULATIVE_DEEPSEARCH", "0").lower() in {"1", "true", "yes", "on"}
+_DS_WORKERS = int(os.getenv("SUGGESTION_DEEPSEARCH_WORKERS", "4"))
+_DS_CACHE_SIZE = int(os.getenv("SUGGESTION_DEEPSEARCH_CACHE", "256"))
+
+_ds_executor: Optional[ThreadPoolExecutor] = None
+_ds_executor_lock = threading.Lock()
+
+# كاش صغير للأدلة المجلوبة تخمينيًا ولم نحتجها (يُستفاد منها عند إعادة توليد نفس المادة)
+_evidence_cache: "OrderedDict[str, List[Dict[str, str]]]" = OrderedDict()
+_evidence_cache_lock = threading.Lock()
+
+# عدّادات المسارات: كم مرة نجح الإصلاح المحلي، وكم مرة احتجنا تمريرة ثانية ولماذا
+_path_stats: Dict[str, int] = {}
+_path_stats_lock = threading.Lock()
+
 
 def _safe_json(block: str) -> Optional[Dict[str, Any]]:
-    """يحاول استخراج/تحويل JSON حتى لو جاء داخل كود."""
-    if not block:
-        return None
-    # شفرة داخل كود JSON أو نص
-    m = re.search(r"```(?:json)?\s*([\s\S]+?)\s*```", block, re.IGNORECASE)
-    raw = m.group(1).strip() if m else block.strip()
-    try:
-        return json.loads(raw)
-    except json.JSONDecodeError:
-        # محاولة تنظيف فاصلة زائدة أو رموز غير قياسية
-        raw2 = raw.replace("\u200f", "").replace("\u200e", "").strip()
-        try:
-            return json.loads(raw2)
-        except Exception:
-            logger.warning("Failed to parse JSON from model. Raw head: %s", raw[:300])
-            return None
+    """يحاول استخراج/تحويل JSON حتى لو جاء داخل كود أو مقطوعًا أو بفواصل زائدة."""
+    data, _ = _parse_model_json(block)
+    return data
+
+
+def _parse_model_json(block: str) -> Tuple[Optional[Dict[str, Any]], str]:
+    """مثل _safe_json لكن يعيد أيضًا المسار: clean | repaired | failed."""
+    data, path = repair_json(block or "")
+    if not isinstance(data, dict):
+        if block:
+            logger.warning("Failed to parse JSON from model. Raw head: %s", block[:300])
+        return None, "failed"
+    return data, path
 
 
 def _trim(text: str, max_chars: int = 3000) -> str:
@@ -147,6 +168,151 @@ SUGGESTION_PROMPT = """
 """.strip()
 
 
+# تمريرة ثانية: نطلب تحسين الملخص وربط الأدلّة وملء الجدول الدستوري
+IMPROVE_PROMPT = """
+أعد صياغة المخرجات التالية لتستوفي تمامًا متطلبات الـ SCHEMA المذكور سابقًا:
+- حسّن "summary" ليكون مركزًا وسليمًا لغويًا (≥ 3 جمل).
+- اربط كلّ دليل بسبب واضح في مسألة الإبقاء/التعديل.
+- عند القرار = "keep"، تأكد من وجود ≥ 3 أسباب صريحة ومختلفة.
+- املأ "constitutional_check_uae" دائمًا (assessment, principles, notes).
+- لا تُعدّل "proposed_text" إلا إذا كان القرار "amend".
+- أعد JSON فقط.
+
+المخرجات الحالية:
+""".strip()
+
+
+# المخطط نفسه الوارد في SUGGESTION_PROMPT، بصيغة قابلة للتحقق محليًا
+SUGGESTION_SCHEMA: Dict[str, Any] = {
+    "type": "object",
+    "required": ["decision", "rationale", "proposed_text", "footnotes"],
+    "properties": {
+        "decision": {"type": "string", "enum": ["amend", "keep"]},
+        "rationale": {
+            "type": "object",
+            "required": ["summary", "evidence", "comparative_table", "constitutional_check_uae",
+                         "risk_assessment", "implementation_impact"],
+            "properties": {
+                "summary": {"type": "string"},
+                "evidence": {
+                    "type": "array",
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "source": {"type": "string"},
+                            "quote": {"type": "string"},
+                            "why_relevant": {"type": "string"},
+                        },
+                    },
+                },
+                "comparative_table": {
+                    "type": "array",
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "jurisdiction": {"type": "string"},
+                            "alignment": {"type": "string", "enum": ["same", "stricter", "looser"]},
+                            "note": {"type": "string"},
+                        },
+                    },
+                },
+                "constitutional_check_uae": {
+                    "type": "object",
+                    "required": ["assessment", "principles", "notes"],
+                    "properties": {
+                        "assessment": {"type": "string", "enum": ["ok", "concern"]},
+                        "principles": {"type": "array", "items": {"type": "string"}},
+                        "notes": {"type": "string"},
+                    },
+                },
+                "risk_assessment": {"type": "string"},
+                "implementation_impact": {"type": "string"},
+            },
+        },
+        "proposed_text": {"type": ["string", "null"]},
+        "footnotes": {"type": "array", "items": {"type": "object"}},
+    },
+}
+
+_DEFAULT_SUMMARY = (
+    "بعد مراجعة المادة ونظيراتها في الصف، لا يظهر خلل موضوعي أو صياغي يبرّر التعديل في هذه المرحلة."
+    " الصياغة الحالية تُحقق الغاية التنظيمية دون إدخال التباس أو عبء امتثال إضافي."
+)
+_DEFAULT_CONSTITUTIONAL_CHECK = {
+    "assessment": "ok",
+    "principles": ["مبدأ المشروعية", "اليقين القانوني", "المساواة أمام القانون", "التناسب"],
+    "notes": "فحص عام بالاستناد إلى مبادئ دستورية مُستقرة دون الإحالة إلى أرقام مواد محدّدة.",
+}
+_DEFAULT_RISK = "لا توجد مخاطر تنظيمية ظاهرة من الإبقاء، خلاف مخاطر إدخال غموض إن تم تعديل المصطلحات دون حاجة."
+_DEFAULT_IMPACT = "الإبقاء يحافظ على استقرار التطبيق ويجنّب تغييرات إجرائية غير لازمة."
+
+
+def _fill_defaults(d: Dict[str, Any], content: bool = False) -> Dict[str, Any]:
+    """
+    يُكمل الهيكل حتمياً دون استدعاء النموذج: مفاتيح ناقصة، أنواع خاطئة، أدلة نصية بدل كائنات.
+    عند content=False لا نملأ "decision" ولا "summary" حتى يبقى فحص الجودة صادقًا.
+    """
+    if isinstance(d.get("decision"), str):
+        d["decision"] = d["decision"].strip().lower()
+    rat = d.get("rationale")
+    if not isinstance(rat, dict):
+        rat = d["rationale"] = {}
+
+    ev = rat.get("evidence")
+    if isinstance(ev, dict):
+        ev = [ev]
+    if not isinstance(ev, list):
+        ev = []
+    rat["evidence"] = [
+        x if isinstance(x, dict) else {"source": "", "quote": str(x), "why_relevant": ""}
+        for x in ev
+        if x
+    ]
+    table = rat.get("comparative_table")
+    rat["comparative_table"] = [x for x in table if isinstance(x, dict)] if isinstance(table, list) else []
+
+    cc = rat.get("constitutional_check_uae")
+    if not isinstance(cc, dict):
+        cc = rat["constitutional_check_uae"] = dict(_DEFAULT_CONSTITUTIONAL_CHECK)
+    if isinstance(cc.get("assessment"), str):
+        cc["assessment"] = cc["assessment"].strip().lower()
+    cc.setdefault("assessment", _DEFAULT_CONSTITUTIONAL_CHECK["assessment"])
+    if not isinstance(cc.get("principles"), list):
+        cc["principles"] = list(_DEFAULT_CONSTITUTIONAL_CHECK["principles"])
+    cc.setdefault("notes", _DEFAULT_CONSTITUTIONAL_CHECK["notes"])
+
+    rat.setdefault("risk_assessment", _DEFAULT_RISK)
+    rat.setdefault("implementation_impact", _DEFAULT_IMPACT)
+    d.setdefault("proposed_text", None)
+    if not isinstance(d.get("footnotes"), list):
+        d["footnotes"] = []
+
+    if content:
+        d.setdefault("decision", "keep")
+        rat.setdefault("summary", _DEFAULT_SUMMARY)
+    return d
+
+
+def _count_path(name: str) -> None:
+    with _path_stats_lock:
+        _path_stats[name] = _path_stats.get(name, 0) + 1
+
+
+def suggestion_path_stats() -> Dict[str, Any]:
+    """
+    إحصاءات المسارات منذ تشغيل العملية:
+    - pass1_clean / pass1_repaired / pass1_failed: نتيجة تحليل JSON للتمريرة الأولى.
+    - schema_fixed_locally: مخرجات ناقصة هيكليًا أُكملت محليًا دون تمريرة ثانية.
+    - accepted_pass1: اكتفينا بالتمريرة الأولى.
+    - second_pass_quality / second_pass_unparseable: سبب اللجوء إلى IMPROVE_PROMPT.
+    """
+    with _path_stats_lock:
+        counts = dict(_path_stats)
+    total = counts.get("pass1_clean", 0) + counts.get("pass1_repaired", 0) + counts.get("pass1_failed", 0)
+    rates = {k: round(v / total, 4) for k, v in counts.items()} if total else {}
+    return {"total": total, "counts": counts, "rates": rates}
+
+
 def _need_second_pass(d: Optional[Dict[str, Any]]) -> bool:
     if not d or not isinstance(d, dict):
         return True
@@ -181,16 +347,159 @@ def _merge_evidence(d: Dict[str, Any], new_items: List[Dict[str, str]]) -> None:
             ev.append({"source": src, "quote": quote, "why_relevant": why})
 
 
-def generate_legislative_suggestion(
+def _get_ds_executor() -> ThreadPoolExecutor:
+    global _ds_executor
+    with _ds_executor_lock:
+        if _ds_executor is None:
+            _ds_executor = ThreadPoolExecutor(max_workers=_DS_WORKERS, thread_name_prefix="suggest-ds")
+        return _ds_executor
+
+
+def _evidence_key(base_article: Dict[str, Any]) -> str:
+    return json.dumps(
+        [
+            base_article.get("article_number"),
+            base_article.get("article_title"),
+            base_article.get("article_text"),
+        ],
+        ensure_ascii=False,
+    )
+
+
+def _cached_evidence(base_article: Dict[str, Any]) -> Optional[List[Dict[str, str]]]:
+    key = _evidence_key(base_article)
+    with _evidence_cache_lock:
+        ev = _evidence_cache.get(key)
+        if ev is not None:
+            _evidence_cache.move_to_end(key)
+        return ev
+
+
+def _store_evidence(base_article: Dict[str, Any], ev: List[Dict[str, str]]) -> None:
+    key = _evidence_key(base_article)
+    with _evidence_cache_lock:
+        _evidence_cache[key] = ev
+        _evidence_cache.move_to_end(key)
+        while len(_evidence_cache) > _DS_CACHE_SIZE:
+            _evidence_cache.popitem(last=False)
+
+
+def _deepsearch_evidence(model: GenerativeModel, base_article: Dict[str, Any]) -> List[Dict[str, str]]:
+    """يجلب أدلة من البحث المعمّق ويحوّلها لصيغة evidence. يخزّنها في الكاش عند النجاح."""
+    topic = base_article.get("article_title") or base_article.get("article_number") or "موضوع المادة"
+    scope = {
+        "base_article": base_article,
+        "law_subject": topic,
+        "query_topic": topic,
+        "geo": "United Arab Emirates, GCC, OECD, UNCITRAL",
+        "sources": "تشريعات، معايير دولية",
+        "types": "laws, guides, standards, official pages",
+        "extra": _trim(base_article.get("article_text", ""), 800),
+    }
+    ds = deepsearch_execute(model, scope)  # قد يعيد {"results":[{title,url,snippet,why,score},...]}
+    results = (ds or {}).get("results") or []
+    ev: List[Dict[str, str]] = []
+    for r in results[:6]:
+        ev.append(
+            {
+                "source": (r.get("url") or "").strip(),
+                "quote": _trim(r.get("snippet") or "", 220),
+                "why_relevant": (r.get("why") or "صلة مباشرة بموضوع المادة.").strip(),
+            }
+        )
+    if ev:
+        # نتيجة فارغة (فشل مؤقت أو لا نتائج) لا تُخزَّن حتى يُعاد الجلب في المرة القادمة
+        _store_evidence(base_article, ev)
+    return ev
+
+
+def _collect_evidence(
+    model: GenerativeModel,
+    base_article: Dict[str, Any],
+    ds_future: Optional[Future],
+) -> List[Dict[str, str]]:
+    """
+    يعيد أدلة البحث المعمّق: من الكاش، أو من الطلب التخميني الجاري، أو بطلب متزامن جديد.
+    أي فشل هنا لا يوقف التوليد.
+    """
+    if not callable(deepsearch_execute):
+        return []
+    try:
+        if ds_future is not None:
+            return ds_future.result()
+        cached = _cached_evidence(base_article)
+        if cached is not None:
+            return cached
+        return _deepsearch_evidence(model, base_article)
+    except Exception:
+        logger.warning("deepsearch enrichment failed; continuing without it.")
+        return []
+
+
+def _usage_of(resp: Any) -> Dict[str, int]:
+    um = getattr(resp, "usage_metadata", None)
+    return {
+        "prompt_tokens": int(getattr(um, "prompt_token_count", 0) or 0),
+        "completion_tokens": int(getattr(um, "candidates_token_count", 0) or 0),
+        "total_tokens": int(getattr(um, "total_token_count", 0) or 0),
+    }
+
+
+def _add_usage(total: Dict[str, int], part: Dict[str, int]) -> None:
+    for k, v in part.items():
+        total[k] = total.get(k, 0) + v
+
+
+def _generate_text(
+    model: GenerativeModel,
+    parts: List[Any],
+    gen_cfg: Dict[str, Any],
+    stream: bool,
+    pass_no: int,
+) -> Generator[Dict[str, Any], None, Tuple[str, Dict[str, int]]]:
+    """
+    نداء واحد للنموذج. في وضع البث يُصدر حدث delta لكل مقطع فور وصوله،
+    ويعيد في النهاية (النص الكامل، الاستهلاك).
+    يمر بخانة المجدول المشترك (انتظارها خارج زمن النداء المقيس)؛ في البث تُحجز لإرسال الطلب فقط
+    حتى لا يحتجز عميل بطيء خانة مشتركة.
+    """
+    op, name = f"suggest_pass{pass_no}", metrics.model_name(model)
+    if not stream:
+        with scheduler.model_slot("suggest"), metrics.llm_call("gemini", op, name) as call:
+            resp = model.generate_content(parts, generation_config=gen_cfg)
+            call.usage(resp)
+        return getattr(resp, "text", "") or "", _usage_of(resp)
+
+    with ExitStack() as stack:
+        with scheduler.model_slot("suggest"):
+            call = stack.enter_context(metrics.llm_call("gemini", op, name))
+            resp = model.generate_content(parts, generation_config=gen_cfg, stream=True)
+        buf: List[str] = []
+        for chunk in resp:
+            try:
+                piece = chunk.text or ""
+            except Exception:  # مقطع بلا نص (مثلاً إشارة أمان) — نتجاوزه
+                piece = ""
+            if piece:
+                buf.append(piece)
+                yield {"event": "delta", "pass": pass_no, "text": piece}
+        call.usage(resp)
+        return "".join(buf), _usage_of(resp)
+
+
+def _suggestion_events(
     model: GenerativeModel,
     base_article: Dict[str, Any],
     row_similars: List[Dict[str, Any]],
-) -> Dict[str, Any]:
+    speculative: Optional[bool],
+    stream: bool,
+) -> Generator[Dict[str, Any], None, None]:
     """
-    يولّد اقتراحًا مُعلّلاً (تعديل/إبقاء) مع أدلة وفحص دستوري إماراتي.
-    يعمل بتمريرتين عند الحاجة ويستعين بالبحث المعمّق إن متاح.
+    قلب توليد الاقتراح على شكل أحداث: delta (مقاطع النص عند البث)، stage (بدء تمريرة/بحث)،
+    وأخيرًا result يحمل الاقتراح النهائي والاستهلاك الإجمالي للتوكنات.
     """
     context = _build_context(base_article, row_similars)
+    usage: Dict[str, int] = {}
 
     gen_cfg = {
         "temperature": 0.2,
@@ -198,60 +507,54 @@ def generate_legislative_suggestion(
         "response_mime_type": "application/json",
     }
 
+    if speculative is None:
+        speculative = SPECULATIVE_DEEPSEARCH
+
+    # الوضع التخميني: نطلق جلب الأدلة مع التمريرة الأولى حتى لا ننتظره بعدها
+    ds_future: Optional[Future] = None
+    if speculative and callable(deepsearch_execute) and _cached_evidence(base_article) is None:
+        # نسخة السياق تحمل المهمة الحالية إلى الـ thread حتى تُنسب نداءات البحث إليها
+        ds_future = _get_ds_executor().submit(contextvars.copy_context().run, _deepsearch_evidence, model, base_article)
+
     # التمريرة الأولى
+    yield {"event": "stage", "stage": "pass1"}
     try:
-        resp = model.generate_content([SUGGESTION_PROMPT, context], generation_config=gen_cfg)
-        data = _safe_json(getattr(resp, "text", "") or "")
+        text, u = yield from _generate_text(model, [SUGGESTION_PROMPT, context], gen_cfg, stream, 1)
+        _add_usage(usage, u)
+        data, parse_path = _parse_model_json(text)
     except Exception as e:
         logger.exception("suggestion pass-1 failed")
-        data = None
-
-    # لو الإخراج ضعيف/ناقص، نحاول تحسينه
-    if _need_second_pass(data):
-        # لو عندنا deepsearch، نجلب أدلة إضافية ونحقنها
-        if callable(deepsearch_execute):
-            try:
-                scope = {
-                    "query_topic": base_article.get("article_title") or base_article.get("article_number") or "موضوع المادة",
-                    "geo": "United Arab Emirates, GCC, OECD, UNCITRAL",
-                    "types": "laws, guides, standards, official pages",
-                    "extra": _trim(base_article.get("article_text", ""), 800),
-                }
-                ds = deepsearch_execute(model, scope)  # قد يعيد {"results":[{title,url,snippet,why,score},...]}
-                results = (ds or {}).get("results") or []
-                ev = []
-                for r in results[:6]:
-                    ev.append(
-                        {
-                            "source": (r.get("url") or "").strip(),
-                            "quote": _trim(r.get("snippet") or "", 220),
-                            "why_relevant": (r.get("why") or "صلة مباشرة بموضوع المادة.").strip(),
-                        }
-                    )
-                if not data:
-                    data = {"decision": "keep", "rationale": {}, "proposed_text": None, "footnotes": []}
-                _merge_evidence(data, ev)
-            except Exception:
-                logger.warning("deepsearch enrichment failed; continuing without it.")
+        data, parse_path = None, "failed"
+    _count_path(f"pass1_{parse_path}")
+
+    # إصلاح هيكلي محلي قبل الحكم على الجودة: لا نصرف تمريرة ثانية على مفتاح ناقص
+    if data is not None:
+        problems = validate(data, SUGGESTION_SCHEMA)
+        data = _fill_defaults(data)
+        if problems:
+            _count_path("schema_fixed_locally")
+            logger.info("suggestion pass-1 schema issues fixed locally: %s", problems[:5])
+
+    # لو الإخراج ضعيف/ناقص في المضمون، نحاول تحسينه
+    if not _need_second_pass(data):
+        _count_path("accepted_pass1")
+    else:
+        _count_path("second_pass_unparseable" if data is None else "second_pass_quality")
+        # لو عندنا deepsearch، نجلب أدلة إضافية ونحقنها (أو نستلم ما جُلب بالتوازي)
+        yield {"event": "stage", "stage": "deepsearch"}
+        ev = _collect_evidence(model, base_article, ds_future)
+        if not data:
+            data = {"decision": "keep", "rationale": {}, "proposed_text": None, "footnotes": []}
+        _merge_evidence(data, ev)
 
         # تمريرة ثانية: نطلب تحسين الملخص وربط الأدلّة وملء الجدول الدستوري
-        IMPROVE_PROMPT = """
-أعد صياغة المخرجات التالية لتستوفي تمامًا متطلبات الـ SCHEMA المذكور سابقًا:
-- حسّن "summary" ليكون مركزًا وسليمًا لغويًا (≥ 3 جمل).
-- اربط كلّ دليل بسبب واضح في مسألة الإبقاء/التعديل.
-- عند القرار = "keep"، تأكد من وجود ≥ 3 أسباب صريحة ومختلفة.
-- املأ "constitutional_check_uae" دائمًا (assessment, principles, notes).
-- لا تُعدّل "proposed_text" إلا إذا كان القرار "amend".
-- أعد JSON فقط.
-
-المخرجات الحالية:
-""".strip()
-
+        yield {"event": "stage", "stage": "pass2"}
         try:
-            improved = model.generate_content(
-                [IMPROVE_PROMPT, json.dumps(data, ensure_ascii=False)], generation_config=gen_cfg
+            text, u = yield from _generate_text(
+                model, [IMPROVE_PROMPT, json.dumps(data, ensure_ascii=False)], gen_cfg, stream, 2
             )
-            improved_json = _safe_json(getattr(improved, "text", "") or "")
+            _add_usage(usage, u)
+            improved_json = _safe_json(text)
             if improved_json:
                 data = improved_json
         except Exception:
@@ -261,25 +564,37 @@ def generate_legislative_suggestion(
     if not isinstance(data, dict):
         data = {}
 
-    data.setdefault("decision", "keep")
-    rat = data.setdefault("rationale", {})
-    rat.setdefault(
-        "summary",
-        "بعد مراجعة المادة ونظيراتها في الصف، لا يظهر خلل موضوعي أو صياغي يبرّر التعديل في هذه المرحلة."
-        " الصياغة الحالية تُحقق الغاية التنظيمية دون إدخال التباس أو عبء امتثال إضافي.",
-    )
-    rat.setdefault("evidence", [])
-    rat.setdefault(
-        "constitutional_check_uae",
-        {
-            "assessment": "ok",
-            "principles": ["مبدأ المشروعية", "اليقين القانوني", "المساواة أمام القانون", "التناسب"],
-            "notes": "فحص عام بالاستناد إلى مبادئ دستورية مُستقرة دون الإحالة إلى أرقام مواد محدّدة.",
-        },
-    )
-    rat.setdefault("risk_assessment", "لا توجد مخاطر تنظيمية ظاهرة من الإبقاء، خلاف مخاطر إدخال غموض إن تم تعديل المصطلحات دون حاجة.")
-    rat.setdefault("implementation_impact", "الإبقاء يحافظ على استقرار التطبيق ويجنّب تغييرات إجرائية غير لازمة.")
-    data.setdefault("proposed_text", None)
-    data.setdefault("footnotes", [])
+    _fill_defaults(data, content=True)
 
+    yield {"event": "result", "data": data, "usage": usage}
+
+
+def generate_legislative_suggestion(
+    model: GenerativeModel,
+    base_article: Dict[str, Any],
+    row_similars: List[Dict[str, Any]],
+    speculative: Optional[bool] = None,
+) -> Dict[str, Any]:
+    """
+    يولّد اقتراحًا مُعلّلاً (تعديل/إبقاء) مع أدلة وفحص دستوري إماراتي.
+    يعمل بتمريرتين عند الحاجة ويستعين بالبحث المعمّق إن متاح.
+    في الوضع التخميني (speculative) يُجلب البحث المعمّق بالتوازي مع التمريرة الأولى.
+    """
+    data: Dict[str, Any] = {}
+    for ev in _suggestion_events(model, base_article, row_similars, speculative, stream=False):
+        if ev["event"] == "result":
+            data = ev["data"]
     return data
+
+
+def stream_legislative_suggestion(
+    model: GenerativeModel,
+    base_article: Dict[str, Any],
+    row_similars: List[Dict[str, Any]],
+    speculative: Optional[bool] = None,
+) -> Iterator[Dict[str, Any]]:
+    """
+    نفس generate_legislative_suggestion لكن يُمرّر مقاطع النص فور وصولها من النموذج.
+    آخر حدث دائمًا {"event": "result", "data": ..., "usage": {...}}.
+    """
+    return _suggestion_events(model, base_article, row_similars, speculative, stream=True)
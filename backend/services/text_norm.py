@@ -0,0 +1,63 @@
+# services/text_norm.py
+from __future__ import annotations
+
+import re
+from typing import Iterator, List, Tuple
+
+# التشكيل + التطويل
+_DIACRITICS_RE = re.compile(r"[\u0610-\u061A\u064B-\u065F\u0670\u06D6-\u06ED\u0640]")
+_TOKEN_RE = re.compile(r"\w+")  # \w يشمل الحروف العربية ويستثني علامات الترقيم (، ؛ ؟)
+# كلمة في النص الأصلي: التشكيل ليس \w فنضمه حتى لا تنقسم الكلمة المشكولة
+_SPAN_RE = re.compile(r"[\w\u0610-\u061A\u064B-\u065F\u0670\u06D6-\u06ED]+")
+
+# توحيد الحروف: الألف بأشكالها، الياء/الألف المقصورة، التاء المربوطة، الهمزات على الواو/الياء
+_FOLD = str.maketrans({
+    "أ": "ا", "إ": "ا", "آ": "ا", "ٱ": "ا",
+    "ى": "ي", "ئ": "ي",
+    "ؤ": "و",
+    "ة": "ه",
+    "٠": "0", "١": "1", "٢": "2", "٣": "3", "٤": "4",
+    "٥": "5", "٦": "6", "٧": "7", "٨": "8", "٩": "9",
+})
+
+_AR_PREFIXES = ("وال", "فال", "بال", "كال", "لل", "ال")
+
+# كلمات وظيفية لا تفيد البحث (بعد التوحيد)
+STOPWORDS = {
+    "في", "من", "على", "الي", "عن", "مع", "او", "ان", "هذا", "هذه", "ذلك", "التي", "الذي",
+    "الذين", "ما", "لا", "لم", "لن", "قد", "كل", "اي", "هو", "هي", "كان", "بين", "كما", "عند",
+    "and", "or", "the", "a", "an", "of", "for", "to", "by", "in", "on", "is", "are",
+}
+
+
+def normalize_ar(text: str) -> str:
+    """يزيل التشكيل والتطويل ويوحّد أشكال الحروف ويحوّل للأحرف الصغيرة."""
+    if not text:
+        return ""
+    return _DIACRITICS_RE.sub("", text).translate(_FOLD).lower()
+
+
+def _strip_prefix(tok: str) -> str:
+    for p in _AR_PREFIXES:
+        if tok.startswith(p) and len(tok) - len(p) >= 2:
+            return tok[len(p):]
+    return tok
+
+
+def tokenize(text: str, drop_stopwords: bool = True) -> List[str]:
+    """تقطيع بسيط بعد التوحيد مع نزع أداة التعريف وحروف الجر الملتصقة بها."""
+    out: List[str] = []
+    for t in _TOKEN_RE.findall(normalize_ar(text)):
+        t = _strip_prefix(t)
+        if len(t) < 2 or (drop_stopwords and t in STOPWORDS):
+            continue
+        out.append(t)
+    return out
+
+
+def token_spans(text: str) -> Iterator[Tuple[int, int, str]]:
+    """مثل tokenize (دون حذف كلمات الوقف) لكن على النص الأصلي: (بداية، نهاية، الرمز الموحَّد)."""
+    for m in _SPAN_RE.finditer(text or ""):
+        t = _strip_prefix(normalize_ar(m.group()))
+        if len(t) >= 2:
+            yield m.start(), m.end(), t
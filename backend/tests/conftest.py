@@ -0,0 +1,18 @@
+# tests/conftest.py
+# الاختبارات تُشغَّل من مجلد backend: python -m pytest -q
+import os
+import sys
+from pathlib import Path
+
+BACKEND_ROOT = Path(__file__).resolve().parent.parent
+if str(BACKEND_ROOT) not in sys.path:
+    sys.path.insert(0, str(BACKEND_ROOT))
+
+# وحدات تتحقق من وجود المفاتيح عند الاستيراد؛ قيم وهمية تكفي لاختبار المنطق المحلي (لا يخرج أي طلب)
+for _key, _val in {
+    "GOOGLE_API_KEY": "test-key",
+    "AZURE_OPENAI_KEY": "test-key",
+    "AZURE_OPENAI_ENDPOINT": "https://test.openai.azure.com/",
+    "AZURE_OPENAI_DEPLOYMENT": "test-deployment",
+}.items():
+    os.environ.setdefault(_key, _val)
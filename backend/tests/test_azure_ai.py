@@ -0,0 +1,79 @@
+# tests/test_azure_ai.py
+import httpx
+import pytest
+from openai import BadRequestError
+
+from services import azure_ai
+from services.azure_ai import ChatCache, ChatMessage, ChatRequest, ChatResponse
+
+
+def _req(text, **kw):
+    return ChatRequest(messages=[ChatMessage(role="user", content=text)], law_context_top_k=0, **kw)
+
+
+def _bad_request(message, param=None):
+    response = httpx.Response(400, request=httpx.Request("POST", "https://test.openai.azure.com/chat"))
+    return BadRequestError(message, response=response, body={"message": message, "param": param})
+
+
+@pytest.fixture
+def fake_client(monkeypatch):
+    calls = []
+
+    class Completions:
+        def create(self, **kw):
+            calls.append(kw)
+            usage = type("U", (), {"prompt_tokens": 11, "completion_tokens": 7, "total_tokens": 18})()
+            message = type("M", (), {"content": "جواب"})()
+            return type("R", (), {"choices": [type("C", (), {"message": message})()], "usage": usage})()
+
+    monkeypatch.setattr(azure_ai.client.chat, "completions", Completions())
+    monkeypatch.setattr(azure_ai, "chat_cache", ChatCache(10, 60))
+    return calls
+
+
+def test_cache_hit_reports_zero_usage(fake_client):
+    first = azure_ai.chat(_req("ما مدة الإجازة؟"))
+    assert (first.total_tokens, first.cached) == (18, None)
+
+    again = azure_ai.chat(_req("ما  مدة الإجازة؟"))
+    assert len(fake_client) == 1
+    assert again.cached == "exact"
+    assert (again.prompt_tokens, again.completion_tokens, again.total_tokens) == (0, 0, 0)
+    assert again.content == "جواب"
+
+
+def test_stream_cache_hit_reports_zero_usage(fake_client):
+    azure_ai.chat(_req("سؤال"))
+    events = list(azure_ai.chat_stream(_req("سؤال")))
+    assert [e["event"] for e in events] == ["delta", "done"]
+    assert events[-1]["cached"] == "exact"
+    assert events[-1]["total_tokens"] == 0
+
+
+def test_near_duplicate_tier_matches_same_prefix_only():
+    cache = ChatCache(10, 60)
+    stored = ChatResponse(content="x", prompt_tokens=1, completion_tokens=1, total_tokens=2)
+    cache.put(_req("ما هي شروط عقد العمل المحدد المدة"), stored)
+    hit, how = cache.get(_req("ما هي شروط عقد العمل محدد المدة"), near_dup=True)
+    assert how == "near" and hit.content == "x"
+    assert cache.get(_req("ما هي شروط عقد العمل محدد المدة"), near_dup=False) == (None, None)
+    assert cache.get(_req("ما هي شروط عقد العمل المحدد المدة", temperature=0.1), near_dup=True) == (None, None)
+
+
+def test_cache_evicts_least_recently_used():
+    cache = ChatCache(2, 60)
+    resp = ChatResponse(content="x", prompt_tokens=0, completion_tokens=0, total_tokens=0)
+    for q in ("أ", "ب", "ج"):
+        cache.put(_req(q), resp)
+    assert cache.get(_req("أ"), near_dup=False) == (None, None)
+    assert cache.snapshot()["evicted"] == 1
+
+
+def test_only_stream_options_rejection_is_retried():
+    assert azure_ai._rejects_stream_options(
+        _bad_request("Unrecognized request argument supplied: stream_options")
+    )
+    assert azure_ai._rejects_stream_options(_bad_request("unsupported", param="stream_options"))
+    assert not azure_ai._rejects_stream_options(_bad_request("The response was filtered", param="prompt"))
+    assert not azure_ai._rejects_stream_options(_bad_request("This model's maximum context length is 8192 tokens"))
@@ -0,0 +1,31 @@
+# tests/test_batch_pipeline.py
+import asyncio
+import io
+import zipfile
+
+from services.batch_pipeline import count_uploads, create_batch, spool_uploads
+
+
+def _zip(members):
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w") as zf:
+        for name, data in members.items():
+            zf.writestr(name, data)
+    buf.seek(0)
+    return buf
+
+
+def test_count_uploads_reads_zip_directory_without_extracting():
+    archive = _zip({"a/scan001.pdf": b"1", "b/scan001.pdf": b"2", "__MACOSX/a/._x": b"", "c/": b""})
+    uploads = [("docs.zip", archive), ("memo.pdf", io.BytesIO(b"x")), ("bad.zip", io.BytesIO(b"nope"))]
+    assert asyncio.run(count_uploads(uploads)) == 4
+    assert archive.tell() == 0
+
+
+def test_flattened_zip_members_get_unique_names():
+    archive = _zip({"a/scan001.pdf": b"1", "b/scan001.pdf": b"2", "c/SCAN001.pdf": b"3"})
+    spooled = asyncio.run(spool_uploads([("docs.zip", archive)]))
+    names = [f["filename"] for f in create_batch(spooled)["files"]]
+    assert names == ["scan001.pdf", "scan001 (2).pdf", "SCAN001 (3).pdf"]
+    for _, f, _ in spooled:
+        f.close()
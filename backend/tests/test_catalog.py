@@ -0,0 +1,61 @@
+# tests/test_catalog.py
+import pytest
+
+from services import catalog, dedup
+
+
+@pytest.fixture(autouse=True)
+def db(tmp_path, monkeypatch):
+    monkeypatch.setattr(dedup, "DOCUMENTS_DB", tmp_path / "documents.sqlite")
+    monkeypatch.setattr(dedup, "_initialized", False)
+    monkeypatch.setattr(catalog, "_schema_ready", False)
+
+
+_DECISION = {"bucket": "contracts", "subfolder": "leases", "confidence": 0.9, "reasoning": "عقد"}
+
+
+def test_search_snippet_uses_original_text():
+    text = "مقدمة طويلة جدًا عن الأطراف والتواريخ والشروط العامة، ثم تلتزم المحكمةُ العليا بالنظر في الدعوى."
+    doc_id = catalog.record_document("contracts", "leases/a.pdf", "a.pdf", _DECISION, text, "s1", 10)
+    page = catalog.query_documents(q="المحكمه")
+    assert page["total"] == 1
+    item = page["items"][0]
+    assert item["id"] == doc_id
+    assert "[المحكمةُ]" in item["snippet"]
+    assert "العليا" in item["snippet"]           # النص الأصلي لا الرموز الموحَّدة ("عليا")
+    assert item["snippet"].startswith("… ")
+
+
+def test_filters_and_browse_order():
+    catalog.record_document("contracts", "leases/a.pdf", "a.pdf", _DECISION, "عقد ايجار")
+    catalog.record_document("cases", "labor/b.pdf", "b.pdf", {"bucket": "cases", "confidence": 0.2}, "دعوى عمالية")
+    assert [i["blob_name"] for i in catalog.query_documents()["items"]] == ["labor/b.pdf", "leases/a.pdf"]
+    assert catalog.query_documents(bucket="cases")["total"] == 1
+    assert catalog.query_documents(min_confidence=0.5)["items"][0]["bucket"] == "contracts"
+    assert catalog.query_documents(q="في")["total"] == 0  # كلمات الوقف وحدها لا تطابق شيئًا
+
+
+def test_rerouting_same_path_updates_in_place():
+    first = catalog.record_document("contracts", "leases/a.pdf", "a.pdf", _DECISION, "نص قديم")
+    second = catalog.record_document("contracts", "leases/a.pdf", "a.pdf", _DECISION, "نص جديد مختلف")
+    assert first == second
+    assert catalog.query_documents(q="قديم")["total"] == 0
+    assert catalog.query_documents(q="مختلف")["total"] == 1
+
+
+def test_duplicate_upload_is_searchable_by_its_filename():
+    doc_id = catalog.record_document("contracts", "leases/a.pdf", "lease.pdf", _DECISION, "عقد ايجار")
+    again = catalog.record_duplicate("contracts", "leases/a.pdf", "scan 2024.pdf", _DECISION, "s1", 10, "classify-upload")
+    assert again == doc_id
+    assert catalog.query_documents(q="2024")["items"][0]["id"] == doc_id
+    assert catalog.query_documents(q="ايجار")["total"] == 1
+
+
+def test_duplicate_of_uncatalogued_blob_is_recorded():
+    doc_id = catalog.record_duplicate("contracts", "old/x.pdf", "x.pdf", _DECISION, "s2", 5, "classify-batch")
+    doc = catalog.get_document(doc_id)
+    assert doc["blob_path"] == "contracts/old/x.pdf"
+    assert doc["bucket"] == "contracts" and doc["source"] == "classify-batch"
+    assert catalog.facets() == [
+        {"bucket": "contracts", "subfolder": "leases", "count": 1, "last_routed_at": doc["routed_at"]}
+    ]
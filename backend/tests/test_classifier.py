@@ -0,0 +1,18 @@
+# tests/test_classifier.py
+from services import classifier
+
+
+def test_generic_keywords_only_keep_the_bucket_root():
+    result = classifier.classify_text("", "صحيفة دعوى المدعي.pdf")
+    assert result["bucket"] == "cases"
+    assert result["subfolder"] is None
+
+
+def test_specific_keyword_picks_its_subfolder():
+    result = classifier.classify_text("طلب نفقة وحضانة", "صحيفة دعوى.pdf")
+    assert (result["bucket"], result["subfolder"]) == ("cases", "family")
+
+
+def test_no_keywords_falls_back_to_reports():
+    result = classifier.classify_text("", "scan001.pdf")
+    assert (result["bucket"], result["subfolder"], result["confidence"]) == ("reports", "summary_report", 0.3)
@@ -0,0 +1,67 @@
+# tests/test_dedup.py
+import asyncio
+import io
+
+import pytest
+
+from services import dedup
+
+
+@pytest.fixture
+def blobs(tmp_path, monkeypatch):
+    monkeypatch.setattr(dedup, "DOCUMENTS_DB", tmp_path / "documents.sqlite")
+    monkeypatch.setattr(dedup, "_initialized", False)
+    monkeypatch.setattr(dedup, "DEDUP_VERIFY", True)
+    store = {}
+
+    async def fake_metadata(container, blob_name):
+        return store.get((container, blob_name))
+
+    monkeypatch.setattr(dedup, "blob_metadata_async", fake_metadata)
+    return store
+
+
+def _route(blobs, data, container="contracts", blob_name="leases/a.pdf"):
+    sha, size = dedup.hash_file(io.BytesIO(data))
+    blobs[(container, blob_name)] = dedup.content_metadata(sha)
+    dedup.register(sha, size, container, blob_name, "a.pdf", {"bucket": container})
+    return sha
+
+
+def test_duplicate_content_returns_prior_decision(blobs):
+    sha = _route(blobs, b"lease v1")
+    got_sha, size, prior = asyncio.run(dedup.check_duplicate(io.BytesIO(b"lease v1"), "copy.pdf", "test"))
+    assert (got_sha, size) == (sha, 8)
+    assert prior["blob_name"] == "leases/a.pdf"
+    assert prior["decision"] == {"bucket": "contracts"}
+    assert dedup.references(sha)[0]["filename"] == "copy.pdf"
+    assert dedup.stats()["duplicate_uploads"] == 1
+
+
+def test_new_content_is_not_a_duplicate(blobs):
+    _route(blobs, b"lease v1")
+    _, _, prior = asyncio.run(dedup.check_duplicate(io.BytesIO(b"other"), "b.pdf", "test"))
+    assert prior is None
+
+
+def test_overwritten_canonical_blob_is_forgotten(blobs):
+    sha = _route(blobs, b"lease v1")
+    # رفع لاحق بالاسم نفسه ومحتوى مختلف كتب فوق الأصل
+    _route(blobs, b"lease v2")
+    _, _, prior = asyncio.run(dedup.check_duplicate(io.BytesIO(b"lease v1"), "a.pdf", "test"))
+    assert prior is None
+    assert dedup.lookup(sha) is None
+
+
+def test_deleted_canonical_blob_is_forgotten(blobs):
+    sha = _route(blobs, b"lease v1")
+    del blobs[("contracts", "leases/a.pdf")]
+    _, _, prior = asyncio.run(dedup.check_duplicate(io.BytesIO(b"lease v1"), "a.pdf", "test"))
+    assert prior is None
+    assert dedup.lookup(sha) is None
+
+
+def test_first_registration_wins(blobs):
+    sha = _route(blobs, b"same", blob_name="one.pdf")
+    dedup.register(sha, 4, "contracts", "two.pdf", "two.pdf", None)
+    assert dedup.lookup(sha)["blob_name"] == "one.pdf"
@@ -0,0 +1,131 @@
+# tests/test_job_registry.py
+import gzip
+import uuid
+from types import SimpleNamespace
+
+import orjson
+import pytest
+
+from services import job_registry
+
+
+@pytest.fixture(autouse=True)
+def fresh(monkeypatch):
+    monkeypatch.setattr(job_registry, "_jobs", job_registry.OrderedDict())
+    monkeypatch.setattr(job_registry, "_cached", job_registry.OrderedDict())
+
+
+def _publish(job_id, data, status="processing", http_status=200):
+    return job_registry.publish(job_id, status, job_registry.dumps(data), http_status=http_status)
+
+
+def test_version_and_etag_change_only_with_new_payload():
+    job_id = uuid.uuid4().hex
+    v1 = _publish(job_id, [1])
+    rec = job_registry.get(job_id)
+    etag1 = rec.etag
+    job_registry.set_status(job_id, "completed")
+    assert rec.version == v1 and rec.etag == etag1 and rec.status == "completed"
+    v2 = _publish(job_id, [1, 2])
+    assert v2 > v1 and rec.etag != etag1
+    assert job_registry.parsed_payload(rec) == [1, 2]
+
+
+def test_recreated_record_never_repeats_an_etag(monkeypatch):
+    monkeypatch.setattr(job_registry, "JOB_REGISTRY_KEEP", 1)
+    job_id = uuid.uuid4().hex
+    _publish(job_id, [1], status="completed")
+    seen = job_registry.get(job_id).etag
+    _publish("other", [0], status="completed")  # يُخرج السجل الأول
+    assert job_registry.get(job_id) is None
+    _publish(job_id, [9], status="completed")
+    assert job_registry.get(job_id).etag != seen
+
+
+def test_running_jobs_are_not_evicted(monkeypatch):
+    monkeypatch.setattr(job_registry, "JOB_REGISTRY_KEEP", 2)
+    job_registry.register("running", None, [])  # extracting
+    _publish("done-1", [1], status="completed")
+    _publish("done-2", [2], status="completed")
+    _publish("done-3", [3], status="completed")
+    assert job_registry.get("running") is not None
+    assert job_registry.get("done-1") is None and job_registry.get("done-2") is None
+    assert job_registry.get("done-3") is not None
+
+
+def test_payload_cache_evicts_least_recently_polled(monkeypatch):
+    monkeypatch.setattr(job_registry, "JOB_STATE_CACHE_SIZE", 2)
+    for job_id in ("a", "b"):
+        _publish(job_id, [job_id])
+    job_registry.get("a")  # استطلاع حديث
+    _publish("c", ["c"])
+    assert job_registry.get("b").payload is None
+    assert job_registry.get("a").payload is not None
+
+
+def test_encoded_payload_is_cached_per_version(monkeypatch):
+    monkeypatch.setattr(job_registry, "RESULTS_COMPRESS_MIN_BYTES", 10)
+    _publish("big", ["نص طويل"] * 50)
+    rec = job_registry.get("big")
+    body, enc = job_registry.encoded_payload(rec, "gzip")
+    assert enc == "gzip" and orjson.loads(gzip.decompress(body)) == ["نص طويل"] * 50
+    assert job_registry.encoded_payload(rec, "gzip")[0] is body
+    assert job_registry.encoded_payload(rec, None) == (rec.payload, None)
+
+
+def test_load_from_disk_marks_unknown_job_final(tmp_path):
+    path = tmp_path / "results.json"
+    path.write_bytes(orjson.dumps({"status": "failed", "error": "boom"}))
+    rec = job_registry.load_from_disk("old", path)
+    assert (rec.status, rec.http_status) == ("failed", 500)
+    assert rec.version > 0
+    assert job_registry.load_from_disk("missing", tmp_path / "none.json") is None
+
+
+def test_published_structure_is_served_without_parsing():
+    rows = [{"status": "pending"}]
+    job_registry.publish("live", "processing", job_registry.dumps(rows), data=rows)
+    assert job_registry.parsed_payload(job_registry.get("live")) is rows
+    job_registry.publish("live", "processing", job_registry.dumps([1]))
+    assert job_registry.parsed_payload(job_registry.get("live")) == [1]
+
+
+def test_restart_keeps_a_cancelled_job_cancelled(tmp_path):
+    report = [{"base_article_info": {}, "country_comparisons": [
+        {"country_name": "مصر", "status": "completed", "similar_articles": []},
+        {"country_name": "الأردن", "status": "cancelled", "similar_articles": []},
+    ]}]
+    path = tmp_path / "results.json"
+    path.write_bytes(orjson.dumps(report))
+    rec = job_registry.load_from_disk("cancelled-mid", path)
+    assert (rec.status, rec.http_status) == ("cancelled", 200)
+
+    path.write_bytes(orjson.dumps({"status": "cancelled", "message": "Job was cancelled before comparison started."}))
+    rec = job_registry.load_from_disk("cancelled-early", path)
+    assert (rec.status, rec.http_status) == ("cancelled", 409)
+
+    report[0]["country_comparisons"][1]["status"] = "completed"
+    path.write_bytes(orjson.dumps(report))
+    assert job_registry.load_from_disk("done", path).status == "completed"
+
+
+def test_brotli_is_preferred_only_when_installed(monkeypatch):
+    monkeypatch.setattr(job_registry, "RESULTS_COMPRESS_MIN_BYTES", 10)
+    _publish("enc", ["نص"] * 50)
+    rec = job_registry.get("enc")
+
+    monkeypatch.setattr(job_registry, "brotli", None)
+    assert job_registry.available_encodings() == ["gzip"]
+    assert job_registry.encoded_payload(rec, "br") == (rec.payload, None)  # يُرسل كما هو
+
+    fake = SimpleNamespace(compress=lambda data, quality: b"br:" + data)
+    monkeypatch.setattr(job_registry, "brotli", fake)
+    assert job_registry.available_encodings() == ["br", "gzip"]
+    assert job_registry.encoded_payload(rec, "br") == (b"br:" + rec.payload, "br")
+
+
+def test_small_payload_is_not_compressed(monkeypatch):
+    monkeypatch.setattr(job_registry, "RESULTS_COMPRESS_MIN_BYTES", 10_000)
+    _publish("small", [1])
+    rec = job_registry.get("small")
+    assert job_registry.encoded_payload(rec, "gzip") == (rec.payload, None)
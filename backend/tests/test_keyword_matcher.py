@@ -0,0 +1,58 @@
+# tests/test_keyword_matcher.py
+from services.keyword_matcher import AhoCorasick, KeywordScorer, bucket_decision
+
+
+def _payloads(matcher, text):
+    return [p for _, _, p in matcher.iter_matches(text)]
+
+
+def test_overlapping_patterns_all_reported():
+    m = AhoCorasick([("he", 1), ("she", 2), ("hers", 3), ("his", 4)])
+    assert sorted(_payloads(m, "ushers")) == []  # لا تطابق يبدأ عند بداية كلمة
+    assert sorted(_payloads(m, "she hers")) == [1, 2, 3]
+
+
+def test_arabic_prefixes_and_normalization():
+    m = AhoCorasick([("محكمة", "court"), ("عقد", "contract")])
+    assert _payloads(m, "وبالمحكمة") == ["court"]
+    assert _payloads(m, "المحكمه العليا") == ["court"]  # التاء المربوطة تُوحَّد
+    assert _payloads(m, "عَقْد إيجار") == ["contract"]     # التشكيل يُزال
+    assert _payloads(m, "معقد") == []                      # "م" ليست سابقة مسموحة
+
+
+def test_match_offsets_point_into_normalized_text():
+    m = AhoCorasick([("lease", "x")])
+    assert list(m.iter_matches("a lease")) == [(2, 7, "x")]
+
+
+def test_scorer_ranks_labels_and_weights_filename():
+    scorer = KeywordScorer({
+        ("contracts", "leases"): [("ايجار", 1.0)],
+        ("cases", None): [("المدعى عليه", 1.0)],
+    })
+    ranked = scorer.score("عقد ايجار.pdf", "المدعى عليه")
+    assert [(r["bucket"], r["subfolder"]) for r in ranked] == [("contracts", "leases"), ("cases", None)]
+    assert ranked[0]["score"] == 2.0
+    assert scorer.score("x.pdf", "") == []
+
+
+def test_repeated_keyword_grows_logarithmically():
+    scorer = KeywordScorer({("cases", None): [("دعوى", 1.0)]})
+    once = scorer.score("", "دعوى")[0]["score"]
+    many = scorer.score("", " ".join(["دعوى"] * 20))[0]["score"]
+    assert once < many < 5 * once
+
+
+def test_bucket_decision_aggregates_per_container():
+    ranked = [
+        {"bucket": "contracts", "subfolder": "leases", "score": 3.0, "share": 0.4, "keywords": ["ايجار"]},
+        {"bucket": "cases", "subfolder": None, "score": 2.5, "share": 0.33, "keywords": ["المدعى عليه"]},
+        {"bucket": "cases", "subfolder": "labor", "score": 2.0, "share": 0.27, "keywords": ["عامل"]},
+    ]
+    decision = bucket_decision(ranked)
+    assert decision["bucket"] == "cases"
+    assert decision["subfolder"] == "labor"
+    assert decision["score"] == 4.5
+    assert decision["share"] == round(4.5 / 7.5, 3)
+    assert decision["keywords"] == ["المدعى عليه", "عامل"]
+    assert bucket_decision([]) is None
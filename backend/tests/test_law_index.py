@@ -0,0 +1,62 @@
+# tests/test_law_index.py
+import json
+import os
+import time
+
+from services import law_index as law_index_mod
+from services.law_index import LawIndex
+
+
+def _write(path, articles, mtime=None):
+    path.write_text(json.dumps(articles, ensure_ascii=False), encoding="utf-8")
+    if mtime is not None:
+        os.utime(path, ns=(mtime, mtime))
+
+
+def _wait_refreshed(index, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while index._refreshing and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+def test_search_ranks_matching_article_first(tmp_path):
+    _write(tmp_path / "civil.json", [
+        {"article_number": "1", "article_title": "النفقة", "article_text": "تجب نفقة الزوجة على زوجها"},
+        {"article_number": "2", "article_title": "الحضانة", "article_text": "الحضانة حق للأم"},
+    ])
+    hits = LawIndex([tmp_path]).search("نفقة الزوجة")
+    assert [h["article_number"] for h in hits] == ["1"]
+    assert hits[0]["source"] == "civil"
+
+
+def test_job_copies_and_result_files_are_not_indexed_twice(tmp_path):
+    art = [{"article_number": "1", "article_title": "", "article_text": "حماية البيانات الشخصية"}]
+    job_a, job_b = "a" * 32, "b" * 32
+    _write(tmp_path / f"{job_a}_cmp_privacy.json", art, mtime=1_000_000_000)
+    _write(tmp_path / f"{job_b}_cmp_privacy.json", art, mtime=2_000_000_000)
+    _write(tmp_path / f"results_{job_a}.json", [{"base_article_info": art[0]}])
+    _write(tmp_path / "notes.error.json", art)
+
+    index = LawIndex([tmp_path])
+    assert [p.name for p in index._law_files()] == [f"{job_b}_cmp_privacy.json"]
+    assert len(index.search("البيانات الشخصية")) == 1
+
+
+def test_changes_are_picked_up_in_the_background(tmp_path, monkeypatch):
+    monkeypatch.setattr(law_index_mod, "LAW_INDEX_REFRESH_SEC", 0.0)
+    law = tmp_path / "labour.json"
+    _write(law, [{"article_number": "1", "article_text": "ساعات العمل"}], mtime=1_000_000_000)
+    index = LawIndex([tmp_path])
+    assert index.search("الإجازة") == []
+    first = index._snapshot
+
+    _write(law, [{"article_number": "9", "article_text": "الإجازة السنوية"}], mtime=2_000_000_000)
+    # الطلب التالي يُخدم من النسخة السابقة ويجدول البناء في الخلفية
+    assert index.search("الإجازة") == []
+    _wait_refreshed(index)
+    assert index._snapshot is not first
+    assert [h["article_number"] for h in index.search("الإجازة")] == ["9"]
+
+
+def test_missing_directories_yield_no_results(tmp_path):
+    assert LawIndex([tmp_path / "absent"]).search("أي شيء") == []
@@ -0,0 +1,97 @@
+# tests/test_local_classifier.py
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from services import classifier, local_classifier
+
+_TOPICS = {
+    ("contracts", "lease"): "عقد إيجار بين المؤجر والمستأجر للعين المؤجرة مدة سنة والأجرة شهرية",
+    ("cases", "family"): "دعوى نفقة وحضانة أمام محكمة الأحوال الشخصية بعد الطلاق",
+    ("reports", None): "تقرير الخبير المحاسبي عن القوائم المالية ومراجعة الحسابات",
+}
+
+
+@pytest.fixture(autouse=True)
+def paths(tmp_path, monkeypatch):
+    monkeypatch.setattr(local_classifier, "DECISIONS_LOG", tmp_path / "decisions.jsonl")
+    monkeypatch.setattr(local_classifier, "MODEL_PATH", tmp_path / "model.joblib")
+    monkeypatch.setattr(local_classifier, "_model", None)
+    monkeypatch.setattr(local_classifier, "_model_mtime", None)
+    monkeypatch.setattr(local_classifier, "LOCAL_CLASSIFIER_ENABLED", True)
+
+
+def _train(**kwargs):
+    return local_classifier.train(local_classifier.DECISIONS_LOG, local_classifier.MODEL_PATH, **kwargs)
+
+
+def _write_log(per_label):
+    with local_classifier.DECISIONS_LOG.open("w", encoding="utf-8") as f:
+        for (bucket, sub), text in _TOPICS.items():
+            for i in range(per_label):
+                rec = {"bucket": bucket, "subfolder": sub, "filename": f"{bucket}-{i}.pdf", "text": f"{text} رقم {i}"}
+                f.write(json.dumps(rec, ensure_ascii=False) + "\n")
+
+
+def test_train_and_predict_on_small_log():
+    _write_log(per_label=8)
+    report = _train(min_per_label=5, holdout=0.25)
+    assert report["labels"] == ["cases/family", "contracts/lease", "reports/"]
+    assert report["holdout_size"] == 6
+    assert local_classifier.MODEL_PATH.exists()
+    bucket, sub, conf = local_classifier.predict("عقد إيجار والمستأجر يدفع الأجرة", "lease.pdf")
+    assert (bucket, sub) == ("contracts", "lease") and 0 < conf <= 1
+    assert local_classifier.predict("تقرير الخبير عن القوائم المالية")[:2] == ("reports", None)
+
+
+def test_two_examples_per_label_skip_the_holdout():
+    _write_log(per_label=2)
+    report = _train(min_per_label=2, holdout=0.5)
+    assert "holdout_size" not in report and report["holdout_skipped"]
+    assert report["n_samples"] == 6
+
+
+def test_min_per_label_below_two_is_rejected():
+    _write_log(per_label=3)
+    with pytest.raises(ValueError, match="min_per_label"):
+        _train(min_per_label=1)
+    with pytest.raises(SystemExit):
+        local_classifier._main(["train", "--log", str(local_classifier.DECISIONS_LOG), "--min-per-label", "1"])
+
+
+def test_disabled_or_missing_model_predicts_nothing(monkeypatch):
+    assert local_classifier.predict("عقد إيجار") is None  # لا نموذج محفوظ
+    _write_log(per_label=6)
+    _train(min_per_label=5, holdout=0)
+    monkeypatch.setattr(local_classifier, "LOCAL_CLASSIFIER_ENABLED", False)
+    assert local_classifier.predict("عقد إيجار") is None
+
+
+class _FakeAzure:
+    def __init__(self, answer):
+        self.calls = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+        self._answer = answer
+
+    def _create(self, **kwargs):
+        self.calls += 1
+        message = SimpleNamespace(content=json.dumps(self._answer, ensure_ascii=False))
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=None)
+
+
+@pytest.mark.parametrize("confidence, local_answer", [(0.95, True), (0.5, False)])
+def test_classify_text_escalates_below_threshold(monkeypatch, confidence, local_answer):
+    llm = _FakeAzure({"bucket": "cases", "subfolder": "civil", "confidence": 0.8, "reasoning": "نموذج"})
+    monkeypatch.setattr(classifier, "_client", llm)
+    monkeypatch.setattr(classifier, "KEYWORD_SKIP_LLM", False)
+    monkeypatch.setattr(local_classifier, "LOCAL_CLASSIFIER_THRESHOLD", 0.85)
+    monkeypatch.setattr(local_classifier, "predict", lambda text, filename="": ("contracts", "lease", confidence))
+    result = classifier.classify_text("نص مستند طويل بما يكفي لتجاوز حد النص القصير " * 3, "doc.pdf")
+    if local_answer:
+        assert (result["bucket"], result["subfolder"], llm.calls) == ("contracts", "lease", 0)
+    else:
+        assert (result["bucket"], result["subfolder"], llm.calls) == ("cases", "civil", 1)
+        # قرار النموذج اللغوي يُسجَّل مثالًا للتدريب
+        logged = json.loads(local_classifier.DECISIONS_LOG.read_text("utf-8"))
+        assert (logged["bucket"], logged["subfolder"]) == ("cases", "civil")
@@ -0,0 +1,173 @@
+# tests/test_main.py
+import json
+import threading
+import time
+import uuid
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from services import job_registry, scheduler, suggestions
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setattr(main, "DATA_DIR", tmp_path)
+    with TestClient(main.app) as c:  # حلقة أحداث واحدة لكل الطلبات (كما في الخادم)
+        yield c
+
+
+@pytest.fixture
+def one_slot(monkeypatch):
+    monkeypatch.setattr(scheduler, "_jobs", {})
+    monkeypatch.setattr(scheduler, "_waiting", [])
+    monkeypatch.setattr(scheduler, "_flow_finish", {})
+    monkeypatch.setattr(scheduler, "_vtime", 0.0)
+    monkeypatch.setattr(scheduler, "_running", 0)
+    monkeypatch.setattr(scheduler, "CELL_CONCURRENCY", 1)
+    monkeypatch.setattr(scheduler, "MODEL_RPM_LIMIT", 0.0)
+
+
+def _report(rows=1):
+    return [
+        {
+            "base_article_info": {"article_number": str(i), "article_title": f"م{i}", "article_text": "نص"},
+            "country_comparisons": [{"country_name": "مصر", "status": "completed", "similar_articles": []}],
+        }
+        for i in range(rows)
+    ]
+
+
+def _publish_job(status="completed", report=None):
+    job_id = uuid.uuid4().hex
+    report = report if report is not None else _report()
+    job_registry.publish(job_id, status, job_registry.dumps(report), data=report)
+    return job_id
+
+
+def _wait_for(cond):
+    deadline = time.monotonic() + 5
+    while not cond():
+        assert time.monotonic() < deadline
+        time.sleep(0.005)
+
+
+def test_suggestion_waiting_for_a_slot_does_not_block_the_loop(client, one_slot, monkeypatch):
+    def fake_suggestion(model, base, row_similars, speculative=None):
+        with scheduler.model_slot("suggest"):
+            return {"decision": "keep"}
+
+    monkeypatch.setattr(main, "generate_legislative_suggestion", fake_suggestion)
+    job_id = _publish_job()
+    responses = {}
+
+    def post():
+        responses["suggest"] = client.post("/suggest-amendment", json={"job_id": job_id, "article_index": 0})
+
+    with scheduler.slot("busy-job"):
+        waiter = threading.Thread(target=post)
+        waiter.start()
+        _wait_for(lambda: len(scheduler._waiting) == 1)
+        # الحلقة تخدم طلبات أخرى بينما الاقتراح ينتظر الخانة
+        poll = threading.Thread(target=lambda: responses.update(stats=client.get("/scheduler")))
+        poll.start()
+        poll.join(5)
+        assert not poll.is_alive()
+        assert responses["stats"].json()["waiting"] == {"normal": 1}
+    waiter.join(5)
+    assert responses["suggest"].status_code == 200
+    assert responses["suggest"].json() == {"decision": "keep"}
+
+
+def test_rows_etag_follows_status_and_honors_if_none_match(client):
+    job_id = _publish_job(status="processing", report=_report(3))
+    url = f"/jobs/{job_id}/rows?fields=status"
+    first = client.get(url)
+    assert first.status_code == 200 and first.json()["status"] == "processing"
+    etag = first.headers["etag"]
+    assert client.get(url, headers={"If-None-Match": etag}).status_code == 304
+
+    # الحالة تتغير دون نتائج جديدة: الجسم مختلف فلا 304 ولا الوسم نفسه
+    job_registry.set_status(job_id, "completed")
+    second = client.get(url, headers={"If-None-Match": etag})
+    assert second.status_code == 200 and second.json()["status"] == "completed"
+    assert second.headers["etag"] != etag
+    assert client.get(url, headers={"If-None-Match": second.headers["etag"]}).status_code == 304
+
+
+def test_results_etag_round_trip(client):
+    job_id = _publish_job(status="processing")
+    url = f"/results/{job_id}"
+    first = client.get(url)
+    assert first.status_code == 200 and first.json() == _report()
+    etag = first.headers["etag"]
+    assert first.headers["vary"] == "Accept-Encoding"
+
+    for tag in (etag, f"W/{etag}", f'"other", {etag}'):
+        cached = client.get(url, headers={"If-None-Match": tag})
+        assert cached.status_code == 304 and cached.content == b"" and cached.headers["etag"] == etag
+
+    report = _report(2)
+    job_registry.publish(job_id, "processing", job_registry.dumps(report), data=report)
+    fresh = client.get(url, headers={"If-None-Match": etag})
+    assert fresh.status_code == 200 and fresh.headers["etag"] != etag and len(fresh.json()) == 2
+
+
+@pytest.mark.parametrize("accept, expected", [
+    ("gzip, br", "gzip"),      # brotli غير مثبت: gzip
+    ("br", None),               # لا ترميز مشترك: الجسم كما هو
+    ("gzip;q=0, deflate", None),
+    ("identity", None),
+])
+def test_results_encoding_negotiation_without_brotli(client, monkeypatch, accept, expected):
+    monkeypatch.setattr(job_registry, "brotli", None)
+    monkeypatch.setattr(job_registry, "RESULTS_COMPRESS_MIN_BYTES", 10)
+    job_id = _publish_job(report=_report(20))
+    resp = client.get(f"/results/{job_id}", headers={"Accept-Encoding": accept})
+    assert resp.status_code == 200
+    assert resp.headers.get("content-encoding") == expected
+    assert resp.json() == _report(20)  # httpx يفك gzip
+
+
+class _Chunks:
+    """رد بث Gemini وهمي: مقاطع نصية بلا استهلاك."""
+
+    usage_metadata = None
+
+    def __init__(self, chunks):
+        self._chunks = chunks
+
+    def __iter__(self):
+        return iter(self._chunks)
+
+
+def test_suggestion_stream_endpoint_sends_sse_and_stores_result(client, monkeypatch):
+    result = {"decision": "amend", "rationale": {"summary": "س" * 80, "evidence": [{"source": "م 5"}]},
+              "proposed_text": "نص مقترح", "footnotes": []}
+    text = json.dumps(result, ensure_ascii=False)
+
+    class StreamingModel:
+        model_name = "models/fake"
+
+        def generate_content(self, parts, generation_config=None, stream=False):
+            assert stream
+            return _Chunks([SimpleNamespace(text=text[i:i + 30]) for i in range(0, len(text), 30)])
+
+    monkeypatch.setattr(main, "model", StreamingModel())
+    monkeypatch.setattr(suggestions, "deepsearch_execute", None)
+    job_id = _publish_job()
+    resp = client.post("/suggest-amendment/stream", json={"job_id": job_id, "article_index": 0})
+    assert resp.status_code == 200 and resp.headers["content-type"].startswith("text/event-stream")
+    events = [
+        (block.split("\n")[0].removeprefix("event: "), json.loads(block.split("\n")[1].removeprefix("data: ")))
+        for block in resp.text.strip().split("\n\n")
+    ]
+    names = [name for name, _ in events]
+    assert names[0] == "stage" and names[-1] == "result" and set(names[1:-1]) == {"delta"}
+    assert "".join(data["text"] for name, data in events if name == "delta") == text
+    assert events[-1][1]["data"]["proposed_text"] == "نص مقترح"
+    # الصف مكتمل: الاقتراح يُحفظ ويُعاد من التخزين في الطلب التالي
+    again = client.post("/suggest-amendment/stream", json={"job_id": job_id, "article_index": 0})
+    assert "delta" not in again.text and '"cached": true' in again.text
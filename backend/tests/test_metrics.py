@@ -0,0 +1,56 @@
+# tests/test_metrics.py
+import contextvars
+import uuid
+
+from services import metrics
+
+
+def _record_call(operation):
+    with metrics.llm_call("gemini", operation, "test-model"):
+        pass
+
+
+def test_bind_unknown_job_creates_finished_detached_record():
+    job_id = uuid.uuid4().hex
+    with metrics.bind_job(job_id):
+        _record_call("suggest")
+        assert metrics.job_summary(job_id)["status"] == "detached"
+    summary = metrics.job_summary(job_id)
+    assert summary["status"] == "detached"
+    assert summary["finished_at"] is not None
+    assert summary["calls"]["gemini/suggest"]["calls"] == 1
+    assert metrics.current_job() is None
+
+
+def test_bind_running_job_keeps_its_status():
+    job_id = uuid.uuid4().hex
+    job = metrics.start_job(job_id)
+    try:
+        with metrics.bind_job(job_id):
+            _record_call("suggest")
+        assert metrics.job_summary(job_id)["status"] == "running"
+        assert metrics.job_summary(job_id)["finished_at"] is None
+    finally:
+        metrics.end_job(job)
+    assert metrics.job_summary(job_id)["status"] == "completed"
+
+
+def test_bind_iter_survives_a_new_context_per_step():
+    job_id = uuid.uuid4().hex
+
+    def events():
+        for op in ("pass1", "pass2"):
+            _record_call(op)
+            yield op
+
+    it = metrics.bind_iter(job_id, events())
+    # كما في StreamingResponse: كل next() في نسخة سياق مستقلة
+    got = []
+    while True:
+        try:
+            got.append(contextvars.copy_context().run(next, it))
+        except StopIteration:
+            break
+    assert got == ["pass1", "pass2"]
+    calls = metrics.job_summary(job_id)["calls"]
+    assert calls["gemini/pass1"]["calls"] == calls["gemini/pass2"]["calls"] == 1
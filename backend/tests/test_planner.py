@@ -0,0 +1,61 @@
+# tests/test_planner.py
+import pytest
+
+from services import metrics, planner, scheduler
+from services.planner import LawInput, plan_job
+
+
+def _law(name, n):
+    return LawInput(name, 1000, [{"article_number": str(i), "article_text": "نص المادة"} for i in range(n)])
+
+
+@pytest.fixture(autouse=True)
+def defaults(monkeypatch):
+    # أزمنة افتراضية ثابتة، مجدول فارغ وبلا حد طلبات
+    monkeypatch.setattr(metrics, "recent_call_stats", lambda provider, operation: None)
+    monkeypatch.setattr(scheduler, "MODEL_RPM_LIMIT", 0.0)
+    monkeypatch.setattr(scheduler, "stats", lambda: {"jobs": {}})
+    monkeypatch.setattr(planner, "COMPARE_CONCURRENCY", 4)
+    monkeypatch.setattr(scheduler, "CELL_CONCURRENCY", 4)
+
+
+def test_counts_calls_for_extracted_laws():
+    plan = plan_job(_law("base", 8), [_law("a", 5), _law("b", 5)])
+    assert plan["rows"] == 8 and plan["cells"] == 16
+    assert plan["calls"]["compare"]["calls"] == 16
+    assert plan["calls"]["file_upload"]["calls"] == 3
+    assert "extract" not in plan["calls"]
+    assert plan["cache"]["extraction"] == {"hits": 3, "misses": 0, "files": {"base": True, "a": True, "b": True}}
+    # 16 خلية × 12 ثانية ÷ 4 خانات + رفع 3 ملفات + حذفها
+    assert plan["wall_sec"]["p50"] == pytest.approx(16 * 12 / 4 + 3 * 1.5 + 3 * 0.4, abs=0.1)
+    assert plan["scheduler"]["slots"] == 16 + 3
+
+
+def test_unextracted_law_is_estimated_from_size():
+    plan = plan_job(LawInput("base", 25_000), [_law("a", 2)])
+    assert plan["laws"][0] == {"name": "base", "size_bytes": 25_000, "articles": 10, "articles_estimated": True}
+    assert plan["calls"]["extract"]["calls"] == 1
+
+
+def test_rpm_limit_bounds_wall_time(monkeypatch):
+    monkeypatch.setattr(scheduler, "MODEL_RPM_LIMIT", 6.0)  # خانة كل 10 ثوانٍ
+    plan = plan_job(_law("base", 8), [_law("a", 5), _law("b", 5)])
+    # المقارنة: 16 خانة ≥ 160 ثانية بدل 48
+    assert plan["wall_sec"]["p50"] >= 160 + 30
+
+
+def test_queue_depth_delays_by_fair_share(monkeypatch):
+    jobs = {
+        "big": {"priority": "normal", "flow": "job:big", "weight": 1.0, "waiting_cells": 4, "queued_cells": 296},
+        "urgent": {"priority": "interactive", "flow": "job:urgent", "weight": 1.0, "waiting_cells": 0, "queued_cells": 8},
+        "later": {"priority": "bulk", "flow": "job:later", "weight": 1.0, "waiting_cells": 2, "queued_cells": 500},
+    }
+    idle = plan_job(_law("base", 8), [_law("a", 5), _law("b", 5)])
+    monkeypatch.setattr(scheduler, "stats", lambda: {"jobs": jobs})
+    plan = plan_job(_law("base", 8), [_law("a", 5), _law("b", 5)], priority="normal")
+    # interactive كلها (8) + من المهمة الكبيرة بقدر خلايانا (16)؛ bulk لا تؤخرنا
+    assert plan["scheduler"]["cells_ahead"] == {"higher_priority": 8, "same_priority": 16, "total": 24}
+    assert plan["wall_sec"]["p50"] == pytest.approx(idle["wall_sec"]["p50"] + 24 * 12 / 4, abs=0.1)
+
+    bulk = plan_job(_law("base", 8), [_law("a", 5), _law("b", 5)], priority="bulk")
+    assert bulk["scheduler"]["cells_ahead"]["higher_priority"] == 8 + 300
@@ -0,0 +1,68 @@
+# tests/test_results_rows.py
+import pytest
+
+from services.results_rows import ROWS_PAGE_MAX, parse_fields, rows_page
+
+
+def _report(n):
+    return [
+        {
+            "base_article_info": {"article_number": str(i), "article_title": f"م{i}", "article_text": "نص طويل"},
+            "country_comparisons": [
+                {"country_name": "مصر", "status": "completed", "similar_articles": [
+                    {"matched_article_identifier": "5", "matched_article_title": "ع", "reason_for_similarity": "س",
+                     "matched_article_full_text": "نص كامل"},
+                ]},
+                {"country_name": "الأردن", "status": "failed", "error": "boom", "similar_articles": []},
+            ],
+        }
+        for i in range(n)
+    ]
+
+
+def test_parse_fields():
+    assert parse_fields(None) is None
+    assert parse_fields(" status, article_title ,") == {"status", "article_title"}
+    with pytest.raises(ValueError, match="nope"):
+        parse_fields("status,nope")
+
+
+def test_page_window_and_indexes():
+    page = rows_page(_report(10), offset=8, limit=5)
+    assert (page["total"], page["offset"], page["limit"]) == (10, 8, 5)
+    assert [r["index"] for r in page["rows"]] == [8, 9]
+    assert page["rows"][0]["base_article_info"]["article_text"] == "نص طويل"
+
+
+def test_limits_are_clamped():
+    page = rows_page(_report(3), offset=-4, limit=10_000)
+    assert page["offset"] == 0 and page["limit"] == ROWS_PAGE_MAX
+    assert rows_page(_report(3), limit=0)["limit"] == 1
+
+
+def test_field_projection_drops_texts():
+    page = rows_page(_report(2), fields={"article_title", "status", "matched_article_title"})
+    row = page["rows"][0]
+    assert row["base_article_info"] == {"article_title": "م0"}
+    assert row["country_comparisons"][0] == {
+        "country_name": "مصر", "status": "completed", "similar_articles": [{"matched_article_title": "ع"}],
+    }
+    assert row["country_comparisons"][1] == {"country_name": "الأردن", "status": "failed", "similar_articles": []}
+
+
+def test_comparison_fields_only_omit_article_and_matches():
+    row = rows_page(_report(1), fields={"status", "error"})["rows"][0]
+    assert "base_article_info" not in row
+    assert row["country_comparisons"][1] == {"country_name": "الأردن", "status": "failed", "error": "boom"}
+
+
+def test_country_filter():
+    row = rows_page(_report(1), countries={"الأردن"})["rows"][0]
+    assert [c["country_name"] for c in row["country_comparisons"]] == ["الأردن"]
+
+
+def test_page_does_not_alias_report_lists():
+    report = _report(1)
+    page = rows_page(report, countries={"مصر"})
+    page["rows"][0]["country_comparisons"].clear()
+    assert len(report[0]["country_comparisons"]) == 2
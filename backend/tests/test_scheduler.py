@@ -0,0 +1,121 @@
+# tests/test_scheduler.py
+import logging
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+import pytest
+
+from services import metrics, scheduler
+
+
+def test_unknown_default_priority_falls_back_to_normal(caplog):
+    with caplog.at_level(logging.WARNING, logger="services.scheduler"):
+        assert scheduler._default_priority("urgent") == "normal"
+    assert "JOB_DEFAULT_PRIORITY" in caplog.text
+    assert scheduler._default_priority(" Bulk ") == "bulk"
+
+
+
+@pytest.fixture
+def sched(monkeypatch):
+    # مجدول فارغ بخانة واحدة وبلا حد طلبات: ترتيب المنح = ترتيب دخول الكتلة
+    monkeypatch.setattr(scheduler, "_jobs", {})
+    monkeypatch.setattr(scheduler, "_waiting", [])
+    monkeypatch.setattr(scheduler, "_flow_finish", {})
+    monkeypatch.setattr(scheduler, "_vtime", 0.0)
+    monkeypatch.setattr(scheduler, "_running", 0)
+    monkeypatch.setattr(scheduler, "CELL_CONCURRENCY", 1)
+    monkeypatch.setattr(scheduler, "MODEL_RPM_LIMIT", 0.0)
+    return scheduler
+
+
+def _wait_for(cond):
+    deadline = time.monotonic() + 5
+    while not cond():
+        assert time.monotonic() < deadline
+        time.sleep(0.005)
+
+
+@contextmanager
+def _held_slot():
+    """يحجز الخانة الوحيدة ويعطي enqueue(job_id) تصفّ خلية في thread؛ عند الخروج تُحرَّر وتُخدم الخلايا."""
+    order, threads = [], []
+
+    def cell(job_id):
+        try:
+            with scheduler.slot(job_id):
+                order.append(job_id)
+        except scheduler.JobCancelled:
+            order.append(f"cancelled:{job_id}")
+
+    def enqueue(job_id):
+        n = len(scheduler._waiting)
+        t = threading.Thread(target=cell, args=(job_id,))
+        t.start()
+        threads.append(t)
+        _wait_for(lambda: len(scheduler._waiting) == n + 1)
+        return t
+
+    with scheduler.slot("blocker"):
+        yield enqueue, order
+    for t in threads:
+        t.join(5)
+
+
+def test_higher_priority_is_served_first(sched):
+    sched.register("later", "bulk")
+    sched.register("urgent", "interactive")
+    with _held_slot() as (enqueue, order):
+        enqueue("later")
+        enqueue("later")
+        enqueue("urgent")
+    assert order == ["urgent", "later", "later"]
+
+
+def test_small_job_interleaves_with_big_one(sched):
+    with _held_slot() as (enqueue, order):
+        for job_id in ("big", "big", "big", "small"):
+            enqueue(job_id)
+    assert order == ["big", "small", "big", "big"]
+    assert sched.job_info("small")["granted_slots"] == 1
+
+
+def test_tenant_weight_sets_its_share(sched, monkeypatch):
+    monkeypatch.setattr(scheduler, "TENANT_WEIGHTS", {"heavy": 2.0})
+    sched.register("h", tenant="heavy")
+    sched.register("l", tenant="light")
+    with _held_slot() as (enqueue, order):
+        for job_id in ("h", "h", "h", "h", "l", "l"):
+            enqueue(job_id)
+    assert order == ["h", "l", "h", "h", "l", "h"]
+
+
+def test_cancelled_waiter_gives_its_flow_tag_back(sched):
+    sched.register("a", tenant="t")
+    sched.register("b", tenant="t")
+    with _held_slot() as (enqueue, order):
+        a = enqueue("a")
+        enqueue("b")
+        sched.cancel("a")
+        a.join(5)
+        # الدور المتروك لا يُحتسب على الفريق: "b" يأخذ وسمه فلا يتأخر خلف تدفق جديد
+        assert sched._flow_finish["tenant:t"] == 1.0
+        assert [e[1] for e in sched._waiting] == [0.0]
+        enqueue("c")
+    assert order == ["cancelled:a", "b", "c"]
+
+
+def test_model_slot_uses_bound_job_or_service_flow(sched):
+    job_id = uuid.uuid4().hex
+    sched.register(job_id, "bulk")
+    with sched.model_slot("ocr"):
+        assert sched.job_info("service:ocr")["running_cells"] == 1
+        with sched.model_slot("ocr"):  # داخل خانة قائمة: لا تُحجز ثانية (كانت ستنتظر للأبد)
+            pass
+    with metrics.bind_job(job_id), sched.model_slot("suggest"):
+        assert sched.job_info(job_id)["running_cells"] == 1
+    sched.cancel(job_id)
+    with metrics.bind_job(job_id), sched.model_slot("suggest"):
+        assert sched.job_info("service:suggest")["running_cells"] == 1
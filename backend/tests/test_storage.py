@@ -0,0 +1,73 @@
+# tests/test_storage.py
+import threading
+
+import pytest
+from azure.core.exceptions import HttpResponseError, ResourceNotFoundError
+
+from services import storage
+
+
+class _FakeBlob:
+    def __init__(self, fail_block=None, missing_once=False):
+        self.fail_block = fail_block
+        self.missing_once = missing_once
+        self.staged = []
+        self.committed = None
+        self._lock = threading.Lock()
+
+    def stage_block(self, block_id, data):
+        with self._lock:
+            if self.missing_once:
+                self.missing_once = False
+                raise ResourceNotFoundError("ContainerNotFound")
+            if data == self.fail_block:
+                raise HttpResponseError("stage failed")
+            self.staged.append(block_id)
+
+    def commit_block_list(self, blocks, content_settings=None):
+        self.committed = [b.id for b in blocks]
+
+    def upload_blob(self, data, overwrite=False, content_settings=None):
+        self.committed = [data]
+
+
+class _FakeContainer:
+    def __init__(self, blob):
+        self.blob = blob
+
+    def get_blob_client(self, name):
+        return self.blob
+
+
+@pytest.fixture
+def fake_blob(monkeypatch):
+    holder = {}
+    created = []
+    monkeypatch.setattr(storage, "get_container_client", lambda name: _FakeContainer(holder["blob"]))
+    monkeypatch.setattr(storage, "ensure_container", lambda name: created.append(name))
+    holder["created"] = created
+    return holder
+
+
+def test_staged_upload_recreates_missing_container(fake_blob):
+    blob = fake_blob["blob"] = _FakeBlob(missing_once=True)
+    blocks = [bytes([i]) * 4 for i in range(3)]
+    storage.upload_stream("inbox", "a.pdf", iter(blocks), block_size=4, max_concurrency=1)
+    assert len(blob.staged) == 3
+    assert blob.committed == [storage._block_id(i) for i in range(3)]
+    assert fake_blob["created"].count("inbox") == 2  # الأولى + إعادة الإنشاء
+
+
+def test_staged_upload_stops_reading_after_first_failure(fake_blob):
+    blob = fake_blob["blob"] = _FakeBlob(fail_block=b"\x01" * 4)
+    consumed = []
+
+    def source():
+        for i in range(50):
+            consumed.append(i)
+            yield bytes([i]) * 4
+
+    with pytest.raises(HttpResponseError):
+        storage.upload_stream("inbox", "a.pdf", source(), block_size=4, max_concurrency=1)
+    assert blob.committed is None
+    assert len(consumed) < 50
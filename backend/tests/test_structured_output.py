@@ -0,0 +1,85 @@
+# tests/test_structured_output.py
+import pytest
+
+from services.structured_output import repair_json, validate
+
+
+@pytest.mark.parametrize(
+    "text, expected",
+    [
+        ('{"decision": "keep"}', {"decision": "keep"}),
+        ('[1, 2]', [1, 2]),
+    ],
+)
+def test_clean_json_is_untouched(text, expected):
+    assert repair_json(text) == (expected, "clean")
+
+
+def test_fenced_json_with_prose_is_clean():
+    text = 'إليك النتيجة:\n```json\n{"a": 1}\n```\nشكرًا'
+    assert repair_json(text) == ({"a": 1}, "clean")
+
+
+@pytest.mark.parametrize(
+    "text, expected",
+    [
+        ('{"a": 1,}', {"a": 1}),
+        ('{"a": [1, 2,], "b": 3}', {"a": [1, 2], "b": 3}),
+        ('{"k": "نص مقطو', {"k": "نص مقطو"}),
+        ('{"k": {"x": 1,', {"k": {"x": 1}}),
+        ('{"k": tru', {"k": True}),
+        ('{"k": 1, "j": fals', {"k": 1, "j": False}),
+        ('{"a": [1, 2, nu', {"a": [1, 2, None]}),
+        ('{"a": 1} تذييل لا علاقة له', {"a": 1}),
+    ],
+)
+def test_truncated_or_sloppy_json_is_repaired(text, expected):
+    assert repair_json(text) == (expected, "repaired")
+
+
+def test_cut_inside_key_falls_back_to_last_complete_member():
+    data, path = repair_json('{"decision": "amend", "rationale": {"summ')
+    assert path == "repaired"
+    assert data == {"decision": "amend", "rationale": {}}
+
+
+def test_escape_at_truncation_point_is_dropped():
+    data, path = repair_json('{"k": "a\\')
+    assert (data, path) == ({"k": "a"}, "repaired")
+
+
+@pytest.mark.parametrize("text", ["", "   ", "لا يوجد JSON هنا"])
+def test_unrecoverable_input_fails(text):
+    assert repair_json(text) == (None, "failed")
+
+
+SCHEMA = {
+    "type": "object",
+    "required": ["decision", "items"],
+    "properties": {
+        "decision": {"type": "string", "enum": ["amend", "keep"]},
+        "items": {"type": "array", "items": {"type": "object"}},
+        "text": {"type": ["string", "null"]},
+    },
+}
+
+
+def test_validate_accepts_matching_value():
+    assert validate({"decision": "keep", "items": [{}], "text": None}, SCHEMA) == []
+
+
+def test_validate_reports_paths_of_problems():
+    problems = validate({"decision": "maybe", "items": [1], "text": 3}, SCHEMA)
+    assert problems == [
+        "$.decision: not in ['amend', 'keep']",
+        "$.items[0]: expected object",
+        "$.text: expected string|null",
+    ]
+
+
+def test_validate_reports_missing_required_keys():
+    assert validate({}, SCHEMA) == ["$.decision: missing", "$.items: missing"]
+
+
+def test_booleans_are_not_numbers():
+    assert validate(True, {"type": "number"}) == ["$: expected number"]
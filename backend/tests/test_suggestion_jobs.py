@@ -0,0 +1,69 @@
+# tests/test_suggestion_jobs.py
+import threading
+
+import pytest
+
+from services import suggestion_jobs
+
+
+@pytest.fixture(autouse=True)
+def fresh_state(monkeypatch):
+    monkeypatch.setattr(suggestion_jobs, "_row_status", suggestion_jobs.OrderedDict())
+    monkeypatch.setattr(suggestion_jobs, "_executor", None)
+    yield
+    if suggestion_jobs._executor is not None:
+        suggestion_jobs._executor.shutdown(wait=True)
+
+
+def _drain():
+    suggestion_jobs._get_executor().shutdown(wait=True)
+    suggestion_jobs._executor = None
+
+
+def test_rows_are_generated_stored_and_not_resubmitted(tmp_path):
+    summary = suggestion_jobs.submit_rows(tmp_path, "job", [0, 1], lambda i: {"row": i})
+    assert summary == {"queued": [0, 1], "skipped": []}
+    _drain()
+    assert suggestion_jobs.load_suggestion(tmp_path, "job", 1) == {"row": 1}
+
+    again = suggestion_jobs.submit_rows(tmp_path, "job", [0, 1], lambda i: {"row": i})
+    assert again == {"queued": [], "skipped": [0, 1]}
+    statuses = [r["status"] for r in suggestion_jobs.job_suggestion_status(tmp_path, "job", 3)]
+    assert statuses == ["completed", "completed", "not_requested"]
+
+
+def test_failed_row_records_error(tmp_path):
+    def boom(i):
+        raise RuntimeError("model down")
+
+    suggestion_jobs.submit_rows(tmp_path, "job", [0], boom)
+    _drain()
+    [row] = suggestion_jobs.job_suggestion_status(tmp_path, "job", 1)
+    assert row == {"status": "failed", "error": "model down", "article_index": 0}
+
+
+def test_cancel_drops_queued_rows_only(tmp_path, monkeypatch):
+    monkeypatch.setattr(suggestion_jobs, "SUGGESTION_CONCURRENCY", 1)
+    started, release = threading.Event(), threading.Event()
+
+    def worker(i):
+        started.set()
+        release.wait(5)
+        return {"row": i}
+
+    suggestion_jobs.submit_rows(tmp_path, "job", [0, 1, 2], worker)
+    assert started.wait(5)
+    assert suggestion_jobs.cancel_rows("job") == [1, 2]
+    release.set()
+    _drain()
+
+    statuses = [r["status"] for r in suggestion_jobs.job_suggestion_status(tmp_path, "job", 3)]
+    assert statuses == ["completed", "cancelled", "cancelled"]
+    assert not suggestion_jobs.suggestion_path(tmp_path, "job", 1).exists()
+
+
+def test_status_memory_is_bounded_to_idle_jobs(tmp_path, monkeypatch):
+    monkeypatch.setattr(suggestion_jobs, "SUGGESTION_STATUS_KEEP", 2)
+    for n in range(5):
+        suggestion_jobs._set_status(f"job{n}", 0, "completed")
+    assert list(suggestion_jobs._row_status) == ["job3", "job4"]
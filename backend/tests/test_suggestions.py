@@ -0,0 +1,188 @@
+# tests/test_suggestions.py
+import json
+import threading
+import time
+import uuid
+from types import SimpleNamespace
+
+import pytest
+
+from services import metrics, scheduler, suggestions
+
+_ARTICLE = {"article_number": "7", "article_title": "التعريفات", "article_text": "يقصد بالكلمات التالية المعاني المبينة قرين كل منها."}
+
+GOOD = {
+    "decision": "keep",
+    "rationale": {
+        "summary": "الصياغة الحالية واضحة ومتسقة مع المواد المقارنة، ولا يظهر ما يبرّر تعديلها في هذه المرحلة.",
+        "evidence": [
+            {"source": "المادة المشابهة رقم 5", "quote": "يقصد بالكلمات", "why_relevant": "نفس البنية"},
+            {"source": "UNCITRAL", "quote": "definitions", "why_relevant": "معيار دولي"},
+        ],
+        "comparative_table": [],
+        "constitutional_check_uae": {"assessment": "ok", "principles": ["اليقين القانوني"], "notes": "لا إشكال."},
+        "risk_assessment": "منخفض",
+        "implementation_impact": "لا أثر",
+    },
+    "proposed_text": None,
+    "footnotes": [],
+}
+
+
+class _Stream:
+    """رد بث وهمي: مقاطع نصية صغيرة، ويسجّل عدد خانات المجدول المشغولة أثناء قراءتها."""
+
+    usage_metadata = None
+
+    def __init__(self, text, seen_running):
+        self._pieces = [text[i:i + 40] for i in range(0, len(text), 40)]
+        self._seen = seen_running
+
+    def __iter__(self):
+        for piece in self._pieces:
+            self._seen.append(scheduler.stats()["running"])
+            yield SimpleNamespace(text=piece)
+
+
+class FakeModel:
+    model_name = "models/fake-gemini"
+
+    def __init__(self, *outputs):
+        self.outputs = list(outputs)
+        self.prompts = []
+        self.contexts = []
+        self.running_at_request = []
+        self.running_while_streaming = []
+
+    def generate_content(self, parts, generation_config=None, stream=False):
+        self.prompts.append(parts[0])
+        self.contexts.append(parts[1])
+        self.running_at_request.append(scheduler.stats()["running"])
+        text = self.outputs.pop(0)
+        if stream:
+            return _Stream(text, self.running_while_streaming)
+        return SimpleNamespace(text=text, usage_metadata=None)
+
+
+@pytest.fixture(autouse=True)
+def isolated(monkeypatch):
+    monkeypatch.setattr(suggestions, "deepsearch_execute", None)  # لا بحث معمّق حقيقي
+    monkeypatch.setattr(suggestions, "_evidence_cache", suggestions.OrderedDict())
+    monkeypatch.setattr(scheduler, "_jobs", {})
+    monkeypatch.setattr(scheduler, "_waiting", [])
+    monkeypatch.setattr(scheduler, "_flow_finish", {})
+    monkeypatch.setattr(scheduler, "_running", 0)
+    monkeypatch.setattr(scheduler, "MODEL_RPM_LIMIT", 0.0)
+
+
+def _stream(model, speculative=False):
+    return list(suggestions.stream_legislative_suggestion(model, _ARTICLE, [], speculative=speculative))
+
+
+def _names(events):
+    # المقاطع المتتالية تُختصر إلى delta واحد حتى يسهل مقارنة الترتيب
+    out = []
+    for ev in events:
+        name = f"delta{ev['pass']}" if ev["event"] == "delta" else ev.get("stage", ev["event"])
+        if not out or out[-1] != name:
+            out.append(name)
+    return out
+
+
+def test_stream_emits_deltas_then_validated_result():
+    text = json.dumps(GOOD, ensure_ascii=False)
+    events = _stream(FakeModel(text))
+    assert _names(events) == ["pass1", "delta1", "result"]
+    assert "".join(ev["text"] for ev in events if ev["event"] == "delta") == text
+    assert events[-1]["data"] == GOOD
+
+
+def test_truncated_pass1_is_repaired_locally():
+    before = suggestions.suggestion_path_stats()["counts"].get("pass1_repaired", 0)
+    text = json.dumps(GOOD, ensure_ascii=False)[:-3]  # انقطع البث قبل أقواس الإغلاق
+    model = FakeModel(text)
+    events = _stream(model)
+    assert _names(events) == ["pass1", "delta1", "result"]
+    assert events[-1]["data"]["rationale"]["summary"] == GOOD["rationale"]["summary"]
+    assert len(model.prompts) == 1  # لا تمريرة ثانية
+    assert suggestions.suggestion_path_stats()["counts"]["pass1_repaired"] == before + 1
+
+
+def test_unusable_pass1_streams_a_second_pass():
+    model = FakeModel("لا يوجد JSON هنا", json.dumps(GOOD, ensure_ascii=False))
+    events = _stream(model)
+    assert _names(events) == ["pass1", "delta1", "deepsearch", "pass2", "delta2", "result"]
+    assert model.prompts == [suggestions.SUGGESTION_PROMPT, suggestions.IMPROVE_PROMPT]
+    assert events[-1]["data"]["decision"] == "keep"
+
+
+def test_slot_is_held_for_the_request_not_the_stream():
+    model = FakeModel(json.dumps(GOOD, ensure_ascii=False))
+    _stream(model)
+    assert model.running_at_request == [1]
+    assert model.running_while_streaming and set(model.running_while_streaming) == {0}
+    assert scheduler.stats()["running"] == 0
+
+
+class _FakeDeepsearch:
+    """deepsearch_execute وهمي: يسجّل المهمة المنسوبة إليها النداء والـ thread الذي جرى فيه."""
+
+    URL = "https://example.org/standard"
+
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, model, scope):
+        job = metrics.current_job()
+        self.calls.append((job.job_id if job else None, threading.current_thread().name))
+        return {"results": [{"title": "t", "url": self.URL, "snippet": "مقتطف", "why": "صلة"}]}
+
+
+def _generate(model, speculative=True):
+    return suggestions.generate_legislative_suggestion(model, _ARTICLE, [], speculative=speculative)
+
+
+def _sources(data):
+    return [e.get("source") for e in data["rationale"]["evidence"]]
+
+
+def test_speculative_evidence_is_used_by_the_second_pass(monkeypatch):
+    ds = _FakeDeepsearch()
+    monkeypatch.setattr(suggestions, "deepsearch_execute", ds)
+    model = FakeModel("{}", json.dumps(GOOD, ensure_ascii=False))
+    _generate(model)
+    assert len(ds.calls) == 1  # جُلب مرة واحدة بالتوازي، ولم يُطلب ثانية عند الحاجة
+    assert ds.calls[0][1].startswith("suggest-ds")
+    assert _FakeDeepsearch.URL in model.contexts[1]  # الأدلة حُقنت في مدخل التمريرة الثانية
+
+
+def test_speculative_evidence_is_discarded_when_pass1_suffices(monkeypatch):
+    ds = _FakeDeepsearch()
+    monkeypatch.setattr(suggestions, "deepsearch_execute", ds)
+    model = FakeModel(json.dumps(GOOD, ensure_ascii=False))
+    data = _generate(model)
+    assert len(model.prompts) == 1
+    assert _FakeDeepsearch.URL not in _sources(data)
+    # النتيجة غير المستخدمة تبقى في الكاش لإعادة توليد المادة نفسها
+    deadline = time.monotonic() + 5
+    while suggestions._cached_evidence(_ARTICLE) is None:
+        assert time.monotonic() < deadline
+        time.sleep(0.005)
+    assert [e["source"] for e in suggestions._cached_evidence(_ARTICLE)] == [_FakeDeepsearch.URL]
+
+
+def test_speculative_call_is_attributed_to_the_bound_job(monkeypatch):
+    ds = _FakeDeepsearch()
+    monkeypatch.setattr(suggestions, "deepsearch_execute", ds)
+    job_id = uuid.uuid4().hex
+    with metrics.bind_job(job_id):
+        _generate(FakeModel("{}", json.dumps(GOOD, ensure_ascii=False)))
+    assert ds.calls[0][0] == job_id
+    assert ds.calls[0][1] != threading.current_thread().name
+
+
+def test_no_speculative_fetch_when_disabled(monkeypatch):
+    ds = _FakeDeepsearch()
+    monkeypatch.setattr(suggestions, "deepsearch_execute", ds)
+    _generate(FakeModel(json.dumps(GOOD, ensure_ascii=False)), speculative=False)
+    assert ds.calls == []